@@ -1,5 +1,5 @@
 from dotenv import load_dotenv
-from langchain_core.messages import HumanMessage
+from langchain_core.messages import AIMessageChunk, HumanMessage
 from src.agent.graph import graph
 import logging
 
@@ -8,6 +8,14 @@ logging.disable(logging.CRITICAL)
 load_dotenv()
 
 
+def apply_profile_patch(profile, event):
+    """Apply a profile_patch event of the custom stream to the client's copy of the profile."""
+    if event["full"]:
+        profile.clear()
+    profile.update(event["patch"])
+    return [field for field in event["patch"] if not event["full"]]
+
+
 def main():
 
     # Initial configuration for the agent
@@ -57,12 +65,33 @@ def main():
         # Append the human message to the conversation
         conversation_state["messages"].append(HumanMessage(content=user_input))
 
-        # Stream the agent's response, passing the config
+        # Stream the agent's response, passing the config. Profile changes arrive on the
+        # custom stream as patches of the changed fields, so the local copy is kept current
+        # without fetching the whole thread state.
         print("Agent: ", end="", flush=True)
-        for msg, metadata in graph.stream(conversation_state, stream_mode="messages", config=config):
-            if metadata["langgraph_node"] == "message_manager":
+        help_streamed = False
+        changed = []
+        for mode, chunk in graph.stream(conversation_state, stream_mode=["messages", "custom"], config=config):
+            if mode == "custom":
+                if chunk.get("type") == "profile_patch":
+                    changed += apply_profile_patch(config["configurable"]["expert_profile"], chunk)
+                    config["configurable"]["profile_version"] = chunk["version"]
+                continue
+            msg, metadata = chunk
+            # Field suggestions are streamed token by token too; their final ToolMessage
+            # repeats the whole suggestion, so it is only printed when it came from the
+            # response cache and no chunks were streamed.
+            if metadata["langgraph_node"] in ("message_manager", "profile_fast_path"):
                 print(msg.content, end="", flush=True)
+            elif metadata["langgraph_node"] == "expert_field_assistant":
+                if isinstance(msg, AIMessageChunk):
+                    help_streamed = True
+                    print(msg.content, end="", flush=True)
+                elif not help_streamed:
+                    print(msg.content, end="", flush=True)
         print()  # New line after the message is complete
+        if changed:
+            print(f"(profile updated: {', '.join(changed)}; version {config['configurable']['profile_version']})")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,198 @@
+"""Offline batch runner replaying scripted conversations through the graph.
+
+Each input line is one conversation, run on its own thread::
+
+    {"id": "chef", "expert_profile": {"name": "Chef"}, "messages": ["...", "..."]}
+
+``tenant_id`` and ``expert_id`` are optional and passed through to the
+configuration; ``expert_id`` defaults to the conversation id. The resulting Expert is appended to the output as soon as its
+conversation finishes::
+
+    {"id": "chef", "status": "ok", "expert": {...}, "elapsed": 1.9}
+
+``status`` is ``ok``, ``timeout`` or ``error`` (with an ``error`` message).
+Conversations already written with status ``ok`` are skipped, so an
+interrupted run resumes where it stopped. Input is read lazily and at most
+``concurrency`` conversations are in flight, so memory stays flat however
+large the input is.
+
+    python -m agent.batch conversations.jsonl experts.jsonl --concurrency 8 --timeout 120
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import time
+from typing import Any, Iterator, Optional, TextIO
+
+from langchain_core.messages import HumanMessage
+
+from agent.profile import aresolve_profile, stored_profile
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONCURRENCY = 8
+DEFAULT_TIMEOUT = 300.0
+
+
+def completed_ids(path: str) -> set[str]:
+    """Return the ids already written to ``path`` with status ``ok``."""
+    done: set[str] = set()
+    try:
+        with open(path, encoding="utf-8") as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # A run killed mid-write leaves a truncated last line.
+                    continue
+                if record.get("status") == "ok":
+                    done.add(str(record["id"]))
+    except FileNotFoundError:
+        pass
+    return done
+
+
+def read_items(file: TextIO) -> Iterator[dict[str, Any]]:
+    """Yield the conversations of a JSONL file one at a time, with an ``id`` on each."""
+    for number, line in enumerate(file, start=1):
+        if not line.strip():
+            continue
+        try:
+            item = json.loads(line)
+        except json.JSONDecodeError as exc:
+            item = {"error": f"invalid JSON: {exc}"}
+        item.setdefault("id", f"line-{number}")
+        item["id"] = str(item["id"])
+        yield item
+
+
+async def run_conversation(graph: Any, item: dict[str, Any], *, keep_thread: bool = False) -> dict[str, Any]:
+    """Replay one conversation on its own thread and return the final Expert."""
+    if "error" in item:
+        raise ValueError(item["error"])
+    thread_id = f"batch-{item['id']}"
+    configurable = {
+        "thread_id": thread_id,
+        "expert_profile": dict(item.get("expert_profile") or {}),
+        # The profile below is sent whole, so the run never writes the profile store.
+        "expert_id": item.get("expert_id", item["id"]),
+        **({"tenant_id": item["tenant_id"]} if "tenant_id" in item else {}),
+    }
+    profile = configurable["expert_profile"]
+    try:
+        for text in item.get("messages", []):
+            state = await graph.ainvoke({"messages": [HumanMessage(text)]}, {"configurable": configurable})
+            # Like a front end would, feed the updated profile back in for the next turn.
+            profile = await aresolve_profile(state) or profile
+            configurable["expert_profile"] = profile
+    finally:
+        if not keep_thread and graph.checkpointer is not None:
+            await _delete_thread(graph.checkpointer, thread_id)
+    return stored_profile(profile or {})
+
+
+async def _delete_thread(checkpointer: Any, thread_id: str) -> None:
+    try:
+        await asyncio.to_thread(checkpointer.delete_thread, thread_id)
+    except NotImplementedError:
+        pass
+
+
+async def run_batch(
+    graph: Any,
+    items: Iterator[dict[str, Any]],
+    output: TextIO,
+    *,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    timeout: Optional[float] = DEFAULT_TIMEOUT,
+    skip: frozenset[str] | set[str] = frozenset(),
+    keep_threads: bool = False,
+) -> dict[str, int]:
+    """Run ``items`` through ``graph`` and append one record per conversation to ``output``.
+
+    Returns the number of conversations per status, ``skipped`` included.
+    """
+    queue: asyncio.Queue[Optional[dict[str, Any]]] = asyncio.Queue(maxsize=concurrency * 2)
+    counts: dict[str, int] = {"ok": 0, "timeout": 0, "error": 0, "skipped": 0}
+
+    async def worker() -> None:
+        while (item := await queue.get()) is not None:
+            start = time.perf_counter()
+            record: dict[str, Any] = {"id": item["id"]}
+            try:
+                expert = await asyncio.wait_for(run_conversation(graph, item, keep_thread=keep_threads), timeout)
+                record.update(status="ok", expert=expert)
+            except TimeoutError:
+                record.update(status="timeout")
+            except Exception as exc:
+                logger.warning("Conversation %s failed: %s", item["id"], exc)
+                record.update(status="error", error=str(exc))
+            record["elapsed"] = round(time.perf_counter() - start, 3)
+            counts[record["status"]] += 1
+            output.write(json.dumps(record, ensure_ascii=False) + "\n")
+            output.flush()
+
+    workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+    try:
+        for item in items:
+            if item["id"] in skip:
+                counts["skipped"] += 1
+                continue
+            await queue.put(item)
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+    finally:
+        for task in workers:
+            task.cancel()
+    return counts
+
+
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
+    """Parse the command line of the batch runner."""
+    parser = argparse.ArgumentParser(description="Replay scripted conversations through the graph.")
+    parser.add_argument("input", help="JSONL file with one conversation per line")
+    parser.add_argument("output", help="JSONL file the Expert records are appended to")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                        help="conversations in flight at once")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT,
+                        help="deadline per conversation in seconds, 0 for none")
+    parser.add_argument("--restart", action="store_true",
+                        help="ignore the records already in the output instead of resuming")
+    parser.add_argument("--keep-threads", action="store_true",
+                        help="keep each conversation's checkpoints instead of deleting them")
+    return parser.parse_args(argv)
+
+
+async def amain(argv: Optional[list[str]] = None) -> dict[str, int]:
+    """Run the batch described by ``argv`` and return the counts of its conversations."""
+    args = parse_args(argv)
+    from agent.graph import graph
+
+    skip = set() if args.restart else completed_ids(args.output)
+    with open(args.input, encoding="utf-8") as source, \
+            open(args.output, "w" if args.restart else "a", encoding="utf-8") as output:
+        return await run_batch(
+            graph,
+            read_items(source),
+            output,
+            concurrency=args.concurrency,
+            timeout=args.timeout or None,
+            skip=skip,
+            keep_threads=args.keep_threads,
+        )
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    """Run the batch and write its counts to stdout as JSON."""
+    counts = asyncio.run(amain(argv))
+    sys.stdout.write(json.dumps(counts) + "\n")
+
+
+if __name__ == "__main__":
+    main()
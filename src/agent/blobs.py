@@ -0,0 +1,247 @@
+"""Content-addressed storage for profile field values.
+
+Each value is stored once under its sha256 hash, the same hash
+``agent.profile.hash_value`` computes, however many profile versions refer
+to it. Profile versions keep only the hashes; values are read back through
+an in-process LRU cache.
+
+``PROFILE_STORE`` selects the backend, like the profile store:
+
+- ``memory`` (default): per process, keeping the ``PROFILE_STORE_MAX_BLOBS``
+  most recently used values, so memory stays bounded. Versions whose values
+  were evicted can no longer be read.
+- ``sqlite``: a SQLite database file (``PROFILE_STORE_URI``), for single-node
+  deployments next to the SQLite checkpointer.
+- ``mongo``: shared by every worker (``PROFILE_STORE_URI`` or ``MONGODB_URI``).
+
+The durable backends never delete blobs: any profile version may still
+refer to them.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Iterable, Protocol
+
+from agent.metrics import metrics
+
+if TYPE_CHECKING:
+    from pymongo.collection import Collection
+
+DEFAULT_CACHE_SIZE = 4096
+DEFAULT_MAX_BLOBS = 100_000
+DEFAULT_SQLITE_PATH = "profiles.sqlite"
+
+# Host parameters per SQLite statement, below the limit of older SQLite builds.
+_SQLITE_BATCH = 500
+
+
+def blob_hash(value: str) -> str:
+    """Return the hex sha256 of ``value``, the key it is stored under."""
+    return hashlib.sha256(value.encode("utf-8")).hexdigest()
+
+
+class BlobBackend(Protocol):
+    """Durable map from content hash to value.
+
+    ``put_many`` returns how many of the values were not stored yet.
+    """
+
+    def get_many(self, hashes: list[str]) -> dict[str, str]:
+        """Return the stored values of ``hashes``; unknown hashes are left out."""
+        ...
+
+    def put_many(self, blobs: dict[str, str]) -> int:
+        """Store the ``{hash: value}`` pairs not stored yet and return how many there were."""
+        ...
+
+
+class InMemoryBlobBackend:
+    """Per-process blob storage keeping the ``max_blobs`` most recently used values."""
+
+    def __init__(self, *, max_blobs: int = DEFAULT_MAX_BLOBS) -> None:
+        """Keep at most ``max_blobs`` values."""
+        self.max_blobs = max_blobs
+        self._lock = threading.Lock()
+        self._blobs: OrderedDict[str, str] = OrderedDict()
+
+    def get_many(self, hashes: list[str]) -> dict[str, str]:
+        """Return the values of ``hashes`` still kept, marking them recently used."""
+        found: dict[str, str] = {}
+        with self._lock:
+            for key in hashes:
+                if key in self._blobs:
+                    self._blobs.move_to_end(key)
+                    found[key] = self._blobs[key]
+        return found
+
+    def put_many(self, blobs: dict[str, str]) -> int:
+        """Store the new values, evicting the least recently used ones past ``max_blobs``."""
+        with self._lock:
+            new = 0
+            for key, value in blobs.items():
+                if key in self._blobs:
+                    self._blobs.move_to_end(key)
+                else:
+                    self._blobs[key] = value
+                    new += 1
+            while len(self._blobs) > self.max_blobs:
+                self._blobs.popitem(last=False)
+        return new
+
+
+class SqliteBlobBackend:
+    """Blob storage in a SQLite database file, one row per hash."""
+
+    def __init__(self, path: str = DEFAULT_SQLITE_PATH) -> None:
+        """Open the database at ``path``, creating the blobs table if needed."""
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS blobs (hash TEXT PRIMARY KEY, value TEXT NOT NULL)")
+
+    def get_many(self, hashes: list[str]) -> dict[str, str]:
+        """Return the stored values of ``hashes``, read in batches."""
+        found: dict[str, str] = {}
+        with self._lock:
+            for start in range(0, len(hashes), _SQLITE_BATCH):
+                batch = hashes[start:start + _SQLITE_BATCH]
+                rows = self._conn.execute(
+                    f"SELECT hash, value FROM blobs WHERE hash IN ({', '.join('?' * len(batch))})", batch
+                )
+                found.update(rows)
+        return found
+
+    def put_many(self, blobs: dict[str, str]) -> int:
+        """Insert the values not stored yet in one transaction."""
+        with self._lock, self._conn:
+            before = self._conn.total_changes
+            self._conn.executemany("INSERT OR IGNORE INTO blobs (hash, value) VALUES (?, ?)", blobs.items())
+            return self._conn.total_changes - before
+
+
+class MongoBlobBackend:
+    """Blob storage shared by every worker, one document per hash."""
+
+    def __init__(self, uri: str, *, db_name: str = "agent_profiles", collection_name: str = "blobs") -> None:
+        """Connect to ``collection_name`` of ``db_name`` at ``uri``."""
+        from pymongo import MongoClient
+
+        self.collection: Collection[dict[str, Any]] = MongoClient(uri)[db_name][collection_name]
+
+    def get_many(self, hashes: list[str]) -> dict[str, str]:
+        """Return the stored values of ``hashes`` in one query."""
+        return {doc["_id"]: doc["value"] for doc in self.collection.find({"_id": {"$in": hashes}})}
+
+    def put_many(self, blobs: dict[str, str]) -> int:
+        """Insert the values not stored yet in one unordered bulk write."""
+        from pymongo import UpdateOne
+
+        if not blobs:
+            return 0
+        result = self.collection.bulk_write(
+            [UpdateOne({"_id": key}, {"$setOnInsert": {"value": value}}, upsert=True)
+             for key, value in blobs.items()],
+            ordered=False,
+        )
+        return result.upserted_count
+
+
+class BlobStore:
+    """Content-addressed blob store with an LRU read cache.
+
+    ``profile_blobs.stored`` counts values written for the first time and
+    ``profile_blobs.deduplicated`` the writes of values already stored.
+    """
+
+    def __init__(self, backend: BlobBackend, *, max_size: int = DEFAULT_CACHE_SIZE) -> None:
+        """Store values in ``backend``, caching the ``max_size`` most recently used ones."""
+        self.backend = backend
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._cache: OrderedDict[str, str] = OrderedDict()
+
+    def _remember(self, blobs: dict[str, str]) -> None:
+        with self._lock:
+            for key, value in blobs.items():
+                self._cache[key] = value
+                self._cache.move_to_end(key)
+            while len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+
+    def _cached(self, hashes: Iterable[str]) -> tuple[dict[str, str], list[str]]:
+        found: dict[str, str] = {}
+        missing: list[str] = []
+        with self._lock:
+            for key in dict.fromkeys(hashes):
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    found[key] = self._cache[key]
+                else:
+                    missing.append(key)
+        return found, missing
+
+    def _count(self, total: int, new: int) -> None:
+        metrics.increment("profile_blobs.stored", new)
+        metrics.increment("profile_blobs.deduplicated", total - new)
+
+    def get_many(self, hashes: Iterable[str]) -> dict[str, str]:
+        """Return the values of the given hashes; unknown hashes are left out."""
+        found, missing = self._cached(hashes)
+        if missing:
+            loaded = self.backend.get_many(missing)
+            self._remember(loaded)
+            found.update(loaded)
+        return found
+
+    def put_many(self, values: Iterable[str]) -> dict[str, str]:
+        """Store values that are not stored yet and return ``{hash: value}`` for all of them.
+
+        Every value goes to the backend, cached or not: the in-memory backend
+        may have evicted it since, and writing it again is what keeps it.
+        """
+        blobs = {blob_hash(value): value for value in values}
+        new = self.backend.put_many(blobs) if blobs else 0
+        self._count(len(blobs), new)
+        self._remember(blobs)
+        return blobs
+
+    async def aget_many(self, hashes: Iterable[str]) -> dict[str, str]:
+        """Async version of get_many; only cache misses leave the event loop."""
+        found, missing = self._cached(hashes)
+        if missing:
+            loaded = await asyncio.to_thread(self.backend.get_many, missing)
+            self._remember(loaded)
+            found.update(loaded)
+        return found
+
+    async def aput_many(self, values: Iterable[str]) -> dict[str, str]:
+        """Async version of put_many."""
+        blobs = {blob_hash(value): value for value in values}
+        new = await asyncio.to_thread(self.backend.put_many, blobs) if blobs else 0
+        self._count(len(blobs), new)
+        self._remember(blobs)
+        return blobs
+
+
+def create_blob_store() -> BlobStore:
+    """Create the blob store configured by the environment."""
+    kind = os.getenv("PROFILE_STORE", "memory").lower()
+    if kind == "memory":
+        return BlobStore(InMemoryBlobBackend(max_blobs=int(os.getenv("PROFILE_STORE_MAX_BLOBS", DEFAULT_MAX_BLOBS))))
+    if kind == "sqlite":
+        return BlobStore(SqliteBlobBackend(os.getenv("PROFILE_STORE_URI") or DEFAULT_SQLITE_PATH))
+    if kind == "mongo":
+        uri = os.getenv("PROFILE_STORE_URI") or os.getenv("MONGODB_URI")
+        if not uri:
+            raise ValueError("PROFILE_STORE=mongo requires PROFILE_STORE_URI or MONGODB_URI")
+        return BlobStore(MongoBlobBackend(uri))
+    raise ValueError(f"Unknown profile store: {kind}")
+
+
+blob_store = create_blob_store()
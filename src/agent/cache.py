@@ -0,0 +1,181 @@
+"""Memoizing cache for field-help generations.
+
+Suggestions are keyed on a normalized fingerprint of the requested field, the
+current Expert profile, the trimmed chat history and the model, so users who
+ask for help on the same field in the same situation share one generation.
+
+``FIELD_HELP_CACHE`` selects the backend: ``memory`` (default, per process,
+LRU with TTL) or ``mongo`` (shared by every worker, TTL index). The size and
+TTL come from ``FIELD_HELP_CACHE_SIZE`` and ``FIELD_HELP_CACHE_TTL``; the
+MongoDB connection string from ``FIELD_HELP_CACHE_URI`` or ``MONGODB_URI``.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import UTC, datetime, timedelta
+from typing import TYPE_CHECKING, Any, Callable, Optional, Protocol, Sequence
+
+from langchain_core.messages import BaseMessage
+
+from agent.metrics import metrics
+
+if TYPE_CHECKING:
+    from pymongo.collection import Collection
+
+DEFAULT_MAX_SIZE = 1024
+DEFAULT_TTL_SECONDS = 3600.0
+
+# Only the tail of the conversation is part of the fingerprint.
+FINGERPRINT_HISTORY_MESSAGES = 6
+
+
+def _normalize(text: Any) -> str:
+    return " ".join(str(text).split()).lower()
+
+
+def fingerprint(field: str, profile: dict[str, Any], history: Sequence[BaseMessage], model: str) -> str:
+    """Return the cache key of a field-help request."""
+    payload = {
+        "field": field,
+        "profile": {key: _normalize(value) for key, value in sorted((profile or {}).items())},
+        "history": [
+            [msg.type, _normalize(msg.content)]
+            for msg in history[-FINGERPRINT_HISTORY_MESSAGES:]
+        ],
+        "model": model,
+    }
+    encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+class CacheBackend(Protocol):
+    """Storage used by ResponseCache; implementations handle their own eviction."""
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached value of ``key``, None if it is missing or expired."""
+        ...
+
+    def set(self, key: str, value: str) -> None:
+        """Cache ``value`` under ``key``."""
+        ...
+
+
+class InMemoryBackend:
+    """Process-local LRU cache whose entries also expire after ``ttl`` seconds."""
+
+    def __init__(
+        self,
+        max_size: int = DEFAULT_MAX_SIZE,
+        ttl: float = DEFAULT_TTL_SECONDS,
+        *,
+        name: str = "field_help_cache",
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        """Keep at most ``max_size`` entries, each for ``ttl`` seconds of ``clock``."""
+        self.max_size = max_size
+        self.ttl = ttl
+        self.name = name
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the value of ``key`` unless it expired, marking it recently used."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= self._clock():
+                del self._entries[key]
+                metrics.increment(f"{self.name}.evictions", reason="ttl")
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str) -> None:
+        """Cache ``value``, evicting the least recently used entries past ``max_size``."""
+        with self._lock:
+            self._entries[key] = (self._clock() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                metrics.increment(f"{self.name}.evictions", reason="lru")
+
+    def __len__(self) -> int:
+        """Return the number of entries, expired ones not yet evicted included."""
+        return len(self._entries)
+
+
+class MongoBackend:
+    """Cache shared by every worker, expired by a MongoDB TTL index."""
+
+    def __init__(
+        self,
+        uri: str,
+        ttl: float = DEFAULT_TTL_SECONDS,
+        *,
+        db_name: str = "agent_cache",
+        collection_name: str = "field_help",
+    ) -> None:
+        """Connect to ``collection_name`` of ``db_name`` at ``uri`` and ensure its TTL index."""
+        from pymongo import MongoClient
+
+        self.ttl = ttl
+        self.collection: Collection[dict[str, Any]] = MongoClient(uri)[db_name][collection_name]
+        self.collection.create_index("expires_at", expireAfterSeconds=0)
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the value of ``key`` unless it expired; the TTL index removes it later."""
+        doc = self.collection.find_one({"_id": key, "expires_at": {"$gt": datetime.now(UTC)}})
+        return doc["value"] if doc else None
+
+    def set(self, key: str, value: str) -> None:
+        """Store ``value`` to expire ``ttl`` seconds from now."""
+        expires_at = datetime.now(UTC) + timedelta(seconds=self.ttl)
+        self.collection.replace_one(
+            {"_id": key}, {"_id": key, "value": value, "expires_at": expires_at}, upsert=True
+        )
+
+
+class ResponseCache:
+    """Cache front end that counts hits and misses under ``<name>.hits``/``<name>.misses``."""
+
+    def __init__(self, backend: CacheBackend, *, name: str = "field_help_cache") -> None:
+        """Cache in ``backend``, counting under ``name``."""
+        self.backend = backend
+        self.name = name
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached value of ``key``, counting a hit or a miss."""
+        value = self.backend.get(key)
+        metrics.increment(f"{self.name}.hits" if value is not None else f"{self.name}.misses")
+        return value
+
+    def set(self, key: str, value: str) -> None:
+        """Cache ``value`` under ``key``."""
+        self.backend.set(key, value)
+
+
+def create_field_help_cache() -> ResponseCache:
+    """Create the field-help cache configured by the environment."""
+    kind = os.getenv("FIELD_HELP_CACHE", "memory").lower()
+    ttl = float(os.getenv("FIELD_HELP_CACHE_TTL", DEFAULT_TTL_SECONDS))
+    if kind == "memory":
+        max_size = int(os.getenv("FIELD_HELP_CACHE_SIZE", DEFAULT_MAX_SIZE))
+        return ResponseCache(InMemoryBackend(max_size, ttl))
+    if kind == "mongo":
+        uri = os.getenv("FIELD_HELP_CACHE_URI") or os.getenv("MONGODB_URI")
+        if not uri:
+            raise ValueError("FIELD_HELP_CACHE=mongo requires FIELD_HELP_CACHE_URI or MONGODB_URI")
+        return ResponseCache(MongoBackend(uri, ttl))
+    raise ValueError(f"Unknown field help cache: {kind}")
+
+
+field_help_cache = create_field_help_cache()
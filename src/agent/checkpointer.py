@@ -0,0 +1,598 @@
+"""Checkpointer backends for the compiled graph, selected from the environment.
+
+``CHECKPOINTER`` picks the backend:
+
+- ``memory`` (default): in-process, with LRU eviction of idle threads and a
+  per-thread cap on retained checkpoints, so memory stays flat no matter how
+  many sessions a worker has served. Also the stand-in used by tests.
+- ``sqlite``: a SQLite database file for single-node deployments.
+- ``mongo``: a MongoDB cluster shared by every worker.
+
+``CHECKPOINTER_URI`` is the SQLite path or the MongoDB connection string.
+``CHECKPOINTER_MAX_CHECKPOINTS`` caps the checkpoints kept per thread for every
+backend (at least 1) and ``CHECKPOINTER_MAX_THREADS`` the threads kept in memory.
+Checkpoints are zlib-compressed unless ``CHECKPOINTER_COMPRESS`` is ``0``.
+Every backend stores a channel value once per version, apart from the
+checkpoints, so an unchanged profile is not copied into each new checkpoint.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import sqlite3
+import threading
+import zlib
+from collections import OrderedDict, defaultdict
+from functools import partial
+from typing import Any, AsyncIterator, Iterator, Optional, Sequence
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+)
+from langgraph.checkpoint.memory import InMemorySaver
+from langgraph.checkpoint.serde.base import SerializerProtocol
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+DEFAULT_MAX_THREADS = 1000
+DEFAULT_MAX_CHECKPOINTS = 20
+DEFAULT_SQLITE_PATH = "checkpoints.sqlite"
+
+# Payloads below this size are stored as-is, compressing them is not worth it.
+_COMPRESSION_THRESHOLD = 1024
+_COMPRESSED_SUFFIX = "+zlib"
+
+_SQLITE_BLOBS_TABLE = """
+CREATE TABLE IF NOT EXISTS checkpoint_blobs (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    channel TEXT NOT NULL,
+    version TEXT NOT NULL,
+    checkpoint_id TEXT NOT NULL,
+    type TEXT NOT NULL,
+    blob BLOB,
+    PRIMARY KEY (thread_id, checkpoint_ns, channel, version)
+);
+"""
+
+# The oldest kept checkpoint still reads the newest blob of each channel written
+# at or before it; older blobs of the channel are unreachable.
+_SQLITE_PRUNE_BLOBS = """
+DELETE FROM checkpoint_blobs
+WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id < (
+    SELECT MAX(newer.checkpoint_id) FROM checkpoint_blobs AS newer
+    WHERE newer.thread_id = checkpoint_blobs.thread_id
+    AND newer.checkpoint_ns = checkpoint_blobs.checkpoint_ns
+    AND newer.channel = checkpoint_blobs.channel
+    AND newer.checkpoint_id <= (
+        SELECT MIN(checkpoint_id) FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?
+    )
+)
+"""
+
+
+class CompressedSerializer(SerializerProtocol):
+    """Serializer that zlib-compresses large payloads of another serializer."""
+
+    def __init__(self, serde: Optional[SerializerProtocol] = None, level: int = 6) -> None:
+        """Wrap ``serde`` (JsonPlusSerializer by default), compressing at zlib ``level``."""
+        self.serde = serde or JsonPlusSerializer()
+        self.level = level
+
+    def dumps(self, obj: Any) -> bytes:
+        """Serialize ``obj`` uncompressed."""
+        return self.serde.dumps(obj)
+
+    def loads(self, data: bytes) -> Any:
+        """Deserialize ``data`` written by dumps."""
+        return self.serde.loads(data)
+
+    def dumps_typed(self, obj: Any) -> tuple[str, bytes]:
+        """Serialize ``obj``, compressing payloads above the threshold and marking their type."""
+        type_, data = self.serde.dumps_typed(obj)
+        if len(data) < _COMPRESSION_THRESHOLD:
+            return type_, data
+        return type_ + _COMPRESSED_SUFFIX, zlib.compress(data, self.level)
+
+    def loads_typed(self, data: tuple[str, bytes]) -> Any:
+        """Deserialize a payload of dumps_typed, decompressing it if its type is marked."""
+        type_, payload = data
+        if type_.endswith(_COMPRESSED_SUFFIX):
+            type_, payload = type_[: -len(_COMPRESSED_SUFFIX)], zlib.decompress(payload)
+        return self.serde.loads_typed((type_, payload))
+
+
+def _max_checkpoints(value: int) -> int:
+    if value < 1:
+        raise ValueError(f"max_checkpoints must be at least 1, got {value}")
+    return value
+
+
+def _with_str_thread_id(config: RunnableConfig) -> RunnableConfig:
+    """Return ``config`` with its thread id as a string, the key every store uses."""
+    configurable = config.get("configurable") or {}
+    thread_id = configurable.get("thread_id")
+    if thread_id is None or isinstance(thread_id, str):
+        return config
+    return {**config, "configurable": {**configurable, "thread_id": str(thread_id)}}
+
+
+class BoundedMemorySaver(InMemorySaver):
+    """In-memory checkpointer with LRU eviction of idle threads.
+
+    Only the newest ``max_checkpoints`` checkpoints of each thread are kept,
+    together with the pending writes and channel blobs they still reference.
+    Once more than ``max_threads`` threads are stored, the least recently used
+    one is dropped entirely. Thread ids are stored as strings.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_threads: int = DEFAULT_MAX_THREADS,
+        max_checkpoints: int = DEFAULT_MAX_CHECKPOINTS,
+        serde: Optional[SerializerProtocol] = None,
+    ) -> None:
+        """Keep ``max_checkpoints`` checkpoints of each of at most ``max_threads`` threads."""
+        super().__init__(serde=serde)
+        self.max_threads = max_threads
+        self.max_checkpoints = _max_checkpoints(max_checkpoints)
+        self._lock = threading.RLock()
+        self._threads: OrderedDict[str, None] = OrderedDict()
+        # Bookkeeping that lets pruning and eviction avoid scanning every key.
+        self._blob_keys: defaultdict[str, set[tuple[str, str, str, str | int | float]]] = defaultdict(set)
+        self._versions: defaultdict[str, dict[tuple[str, str], ChannelVersions]] = defaultdict(dict)
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        """Get a checkpoint tuple, marking its thread as recently used."""
+        config = _with_str_thread_id(config)
+        self._touch(config["configurable"]["thread_id"])
+        return super().get_tuple(config)
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        """List checkpoints matching the given criteria."""
+        return super().list(
+            config and _with_str_thread_id(config),
+            filter=filter,
+            before=before and _with_str_thread_id(before),
+            limit=limit,
+        )
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        """Save a checkpoint and prune the ones of its thread past the cap."""
+        config = _with_str_thread_id(config)
+        next_config = super().put(config, checkpoint, metadata, new_versions)
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        with self._lock:
+            self._blob_keys[thread_id].update(
+                (thread_id, checkpoint_ns, channel, version)
+                for channel, version in new_versions.items()
+            )
+            self._versions[thread_id][(checkpoint_ns, checkpoint["id"])] = dict(
+                checkpoint["channel_versions"]
+            )
+            self._prune(thread_id, checkpoint_ns)
+        self._touch(thread_id)
+        return next_config
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        """Save the pending writes of a task."""
+        super().put_writes(_with_str_thread_id(config), writes, task_id, task_path)
+
+    def delete_thread(self, thread_id: str) -> None:
+        """Delete every checkpoint, write and blob of a thread."""
+        thread_id = str(thread_id)
+        with self._lock:
+            self.storage.pop(thread_id, None)
+            for checkpoint_ns, checkpoint_id in self._versions.pop(thread_id, {}):
+                self.writes.pop((thread_id, checkpoint_ns, checkpoint_id), None)
+            for key in self._blob_keys.pop(thread_id, ()):
+                self.blobs.pop(key, None)
+            self._threads.pop(thread_id, None)
+
+    def _touch(self, thread_id: str) -> None:
+        with self._lock:
+            self._threads[thread_id] = None
+            self._threads.move_to_end(thread_id)
+            while len(self._threads) > self.max_threads:
+                idle_thread, _ = self._threads.popitem(last=False)
+                self.delete_thread(idle_thread)
+
+    def _prune(self, thread_id: str, checkpoint_ns: str) -> None:
+        checkpoints = self.storage[thread_id][checkpoint_ns]
+        if len(checkpoints) <= self.max_checkpoints:
+            return
+
+        # Checkpoint ids are time-ordered, so the smallest ones are the oldest.
+        for checkpoint_id in sorted(checkpoints)[: -self.max_checkpoints]:
+            del checkpoints[checkpoint_id]
+            self.writes.pop((thread_id, checkpoint_ns, checkpoint_id), None)
+            self._versions[thread_id].pop((checkpoint_ns, checkpoint_id), None)
+
+        referenced = {
+            (thread_id, ns, channel, version)
+            for (ns, _), versions in self._versions[thread_id].items()
+            for channel, version in versions.items()
+        }
+        blob_keys = self._blob_keys[thread_id]
+        for key in blob_keys - referenced:
+            self.blobs.pop(key, None)
+        blob_keys &= referenced
+
+
+class _ExecutorAsyncMixin:
+    """Serve the async checkpointer API from the sync one in a worker thread.
+
+    Lets the synchronous SQLite and MongoDB savers back graphs that are run
+    with ``ainvoke``/``astream``.
+    """
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await asyncio.get_running_loop().run_in_executor(
+            None, partial(self.get_tuple, config)  # type: ignore[attr-defined]
+        )
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        checkpoints = await asyncio.get_running_loop().run_in_executor(
+            None,
+            lambda: list(self.list(config, filter=filter, before=before, limit=limit)),  # type: ignore[attr-defined]
+        )
+        for checkpoint in checkpoints:
+            yield checkpoint
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        return await asyncio.get_running_loop().run_in_executor(
+            None, partial(self.put, config, checkpoint, metadata, new_versions)  # type: ignore[attr-defined]
+        )
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        await asyncio.get_running_loop().run_in_executor(
+            None, partial(self.put_writes, config, writes, task_id, task_path)  # type: ignore[attr-defined]
+        )
+
+
+class _ChannelBlobsMixin:
+    """Store channel values apart from the checkpoints, once per channel version.
+
+    Like InMemorySaver, a checkpoint keeps only the version of each channel and
+    a value is written when its channel changes, so a turn does not copy the
+    messages and the profile into one more checkpoint. A channel with no blob
+    yet, such as one saved inline before, is written with the next checkpoint.
+    Subclasses store, look up and prune the blobs.
+    """
+
+    serde: SerializerProtocol
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        """Save the changed channels as blobs and the checkpoint without its values."""
+        thread_id, checkpoint_ns = _thread_key(config)
+        versions = {channel: str(version) for channel, version in checkpoint["channel_versions"].items()}
+        stored = self._stored_channels(thread_id, checkpoint_ns, versions)
+        values = checkpoint["channel_values"]
+        blobs = [
+            (channel, version, *self._dump(values, channel))
+            for channel, version in versions.items()
+            if channel in new_versions or channel not in stored
+        ]
+        if blobs:
+            self._put_blobs(thread_id, checkpoint_ns, checkpoint["id"], blobs)
+        return super().put(  # type: ignore[misc, no-any-return]
+            config, {**checkpoint, "channel_values": {}}, metadata, new_versions
+        )
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        """Get a checkpoint tuple with its channel values."""
+        checkpoint_tuple = super().get_tuple(config)  # type: ignore[misc]
+        return checkpoint_tuple and self._with_values(checkpoint_tuple)
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        """List checkpoints matching the given criteria, with their channel values."""
+        # Read them all first: the SQLite saver holds its lock while listing.
+        checkpoints = [*super().list(config, filter=filter, before=before, limit=limit)]  # type: ignore[misc]
+        for checkpoint_tuple in checkpoints:
+            yield self._with_values(checkpoint_tuple)
+
+    def _dump(self, values: dict[str, Any], channel: str) -> tuple[str, bytes]:
+        if channel not in values:
+            return "empty", b""
+        return self.serde.dumps_typed(values[channel])
+
+    def _with_values(self, checkpoint_tuple: CheckpointTuple) -> CheckpointTuple:
+        checkpoint = checkpoint_tuple.checkpoint
+        thread_id, checkpoint_ns = _thread_key(checkpoint_tuple.config)
+        versions = {channel: str(version) for channel, version in checkpoint["channel_versions"].items()}
+        values = {
+            channel: self.serde.loads_typed(blob)
+            for channel, blob in self._get_blobs(thread_id, checkpoint_ns, versions).items()
+            if blob[0] != "empty"
+        }
+        return checkpoint_tuple._replace(
+            checkpoint={**checkpoint, "channel_values": {**checkpoint["channel_values"], **values}}
+        )
+
+    def _stored_channels(self, thread_id: str, checkpoint_ns: str, versions: dict[str, str]) -> set[str]:
+        """Return the channels of ``versions`` whose blob is stored."""
+        raise NotImplementedError
+
+    def _get_blobs(
+        self, thread_id: str, checkpoint_ns: str, versions: dict[str, str]
+    ) -> dict[str, tuple[str, bytes]]:
+        """Return the stored ``(type, blob)`` of each channel of ``versions``."""
+        raise NotImplementedError
+
+    def _put_blobs(
+        self,
+        thread_id: str,
+        checkpoint_ns: str,
+        checkpoint_id: str,
+        blobs: Sequence[tuple[str, str, str, bytes]],
+    ) -> None:
+        """Store ``(channel, version, type, blob)`` rows written by ``checkpoint_id``."""
+        raise NotImplementedError
+
+
+def _thread_key(config: RunnableConfig) -> tuple[str, str]:
+    configurable = config["configurable"]
+    return str(configurable["thread_id"]), configurable.get("checkpoint_ns", "")
+
+
+def create_sqlite_checkpointer(
+    path: str = DEFAULT_SQLITE_PATH,
+    *,
+    max_checkpoints: int = DEFAULT_MAX_CHECKPOINTS,
+    serde: Optional[SerializerProtocol] = None,
+) -> BaseCheckpointSaver[str]:
+    """Create a SQLite checkpointer that keeps the newest checkpoints of each thread."""
+    from langgraph.checkpoint.sqlite import SqliteSaver
+
+    max_checkpoints = _max_checkpoints(max_checkpoints)
+
+    class BoundedSqliteSaver(_ExecutorAsyncMixin, _ChannelBlobsMixin, SqliteSaver):
+        def setup(self) -> None:
+            if self.is_setup:
+                return
+            super().setup()
+            self.conn.executescript(_SQLITE_BLOBS_TABLE)
+
+        def put(self, config, checkpoint, metadata, new_versions):  # type: ignore[no-untyped-def]
+            next_config = super().put(config, checkpoint, metadata, new_versions)
+            key = _thread_key(config)
+            kept = (
+                "SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? "
+                "ORDER BY checkpoint_id DESC LIMIT ?"
+            )
+            with self.cursor() as cur:
+                for table in ("checkpoints", "writes"):
+                    cur.execute(
+                        f"DELETE FROM {table} WHERE thread_id = ? AND checkpoint_ns = ? "
+                        f"AND checkpoint_id NOT IN ({kept})",
+                        (*key, *key, max_checkpoints),
+                    )
+                cur.execute(_SQLITE_PRUNE_BLOBS, (*key, *key))
+            return next_config
+
+        def delete_thread(self, thread_id: str) -> None:
+            super().delete_thread(thread_id)
+            with self.cursor() as cur:
+                cur.execute("DELETE FROM checkpoint_blobs WHERE thread_id = ?", (str(thread_id),))
+
+        def _stored_channels(self, thread_id: str, checkpoint_ns: str, versions: dict[str, str]) -> set[str]:
+            return set(self._select_blobs("channel", thread_id, checkpoint_ns, versions))
+
+        def _get_blobs(
+            self, thread_id: str, checkpoint_ns: str, versions: dict[str, str]
+        ) -> dict[str, tuple[str, bytes]]:
+            rows = self._select_blobs("channel, type, blob", thread_id, checkpoint_ns, versions)
+            return {channel: (type_, blob) for channel, type_, blob in rows}
+
+        def _select_blobs(
+            self, columns: str, thread_id: str, checkpoint_ns: str, versions: dict[str, str]
+        ) -> Sequence[Any]:
+            if not versions:
+                return []
+            pairs = ", ".join("(?, ?)" for _ in versions)
+            with self.cursor(transaction=False) as cur:
+                cur.execute(
+                    f"SELECT {columns} FROM checkpoint_blobs WHERE thread_id = ? AND checkpoint_ns = ? "
+                    f"AND (channel, version) IN (VALUES {pairs})",
+                    (thread_id, checkpoint_ns, *(value for item in versions.items() for value in item)),
+                )
+                return cur.fetchall()
+
+        def _put_blobs(
+            self,
+            thread_id: str,
+            checkpoint_ns: str,
+            checkpoint_id: str,
+            blobs: Sequence[tuple[str, str, str, bytes]],
+        ) -> None:
+            with self.cursor() as cur:
+                cur.executemany(
+                    "INSERT OR IGNORE INTO checkpoint_blobs "
+                    "(thread_id, checkpoint_ns, channel, version, checkpoint_id, type, blob) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [(thread_id, checkpoint_ns, *blob[:2], checkpoint_id, *blob[2:]) for blob in blobs],
+                )
+
+    conn = sqlite3.connect(path, check_same_thread=False)
+    return BoundedSqliteSaver(conn, serde=serde)
+
+
+def create_mongo_checkpointer(
+    uri: str,
+    *,
+    max_checkpoints: int = DEFAULT_MAX_CHECKPOINTS,
+    serde: Optional[SerializerProtocol] = None,
+) -> BaseCheckpointSaver[str]:
+    """Create a MongoDB checkpointer that keeps the newest checkpoints of each thread."""
+    from langgraph.checkpoint.mongodb import MongoDBSaver
+    from pymongo import MongoClient
+
+    max_checkpoints = _max_checkpoints(max_checkpoints)
+
+    class BoundedMongoDBSaver(_ExecutorAsyncMixin, _ChannelBlobsMixin, MongoDBSaver):
+        def put(self, config, checkpoint, metadata, new_versions):  # type: ignore[no-untyped-def]
+            next_config = super().put(config, checkpoint, metadata, new_versions)
+            query = {
+                "thread_id": config["configurable"]["thread_id"],
+                "checkpoint_ns": config["configurable"]["checkpoint_ns"],
+            }
+            oldest_kept = list(
+                self.checkpoint_collection.find(query, {"checkpoint_id": 1})
+                .sort("checkpoint_id", -1)
+                .skip(max_checkpoints - 1)
+                .limit(1)
+            )
+            if oldest_kept:
+                stale = {**query, "checkpoint_id": {"$lt": oldest_kept[0]["checkpoint_id"]}}
+                self.checkpoint_collection.delete_many(stale)
+                self.writes_collection.delete_many(stale)
+                self._prune_blobs(*_thread_key(config), oldest_kept[0]["checkpoint_id"])
+            return next_config
+
+        def delete_thread(self, thread_id: str) -> None:
+            super().delete_thread(thread_id)
+            self.blob_collection.delete_many({"thread_id": str(thread_id)})
+
+        @property
+        def blob_collection(self) -> Any:
+            return self.db["checkpoint_blobs"]
+
+        def _prune_blobs(self, thread_id: str, checkpoint_ns: str, oldest_kept: str) -> None:
+            # The oldest kept checkpoint still reads the newest blob of each
+            # channel written at or before it; older blobs are unreachable.
+            query = {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns}
+            for channel in self.blob_collection.distinct("channel", query):
+                latest = self.blob_collection.find_one(
+                    {**query, "channel": channel, "checkpoint_id": {"$lte": oldest_kept}},
+                    {"checkpoint_id": 1},
+                    sort=[("checkpoint_id", -1)],
+                )
+                if latest:
+                    self.blob_collection.delete_many(
+                        {**query, "channel": channel, "checkpoint_id": {"$lt": latest["checkpoint_id"]}}
+                    )
+
+        def _stored_channels(self, thread_id: str, checkpoint_ns: str, versions: dict[str, str]) -> set[str]:
+            return {doc["channel"] for doc in self._find_blobs({"channel": 1}, thread_id, checkpoint_ns, versions)}
+
+        def _get_blobs(
+            self, thread_id: str, checkpoint_ns: str, versions: dict[str, str]
+        ) -> dict[str, tuple[str, bytes]]:
+            docs = self._find_blobs({"channel": 1, "type": 1, "blob": 1}, thread_id, checkpoint_ns, versions)
+            return {doc["channel"]: (doc["type"], doc["blob"]) for doc in docs}
+
+        def _find_blobs(
+            self, projection: dict[str, int], thread_id: str, checkpoint_ns: str, versions: dict[str, str]
+        ) -> Sequence[Any]:
+            if not versions:
+                return []
+            query = {
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "$or": [{"channel": channel, "version": version} for channel, version in versions.items()],
+            }
+            return [*self.blob_collection.find(query, projection)]
+
+        def _put_blobs(
+            self,
+            thread_id: str,
+            checkpoint_ns: str,
+            checkpoint_id: str,
+            blobs: Sequence[tuple[str, str, str, bytes]],
+        ) -> None:
+            from pymongo import UpdateOne
+
+            requests = []
+            for channel, version, type_, blob in blobs:
+                key = {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "channel": channel, "version": version}
+                fields = {**key, "checkpoint_id": checkpoint_id, "type": type_, "blob": blob}
+                requests.append(UpdateOne(key, {"$setOnInsert": fields}, upsert=True))
+            self.blob_collection.bulk_write(requests)
+
+    saver = BoundedMongoDBSaver(MongoClient(uri))
+    saver.blob_collection.create_index(
+        keys=[("thread_id", 1), ("checkpoint_ns", 1), ("channel", 1), ("version", 1)], unique=True
+    )
+    if serde is not None:
+        saver.serde = serde
+    return saver
+
+
+def create_checkpointer(kind: Optional[str] = None) -> BaseCheckpointSaver[str]:
+    """Create the checkpointer selected by ``kind`` or the ``CHECKPOINTER`` variable."""
+    kind = (kind or os.getenv("CHECKPOINTER") or "memory").lower()
+    uri = os.getenv("CHECKPOINTER_URI")
+    max_checkpoints = int(os.getenv("CHECKPOINTER_MAX_CHECKPOINTS", DEFAULT_MAX_CHECKPOINTS))
+    serde = None
+    if os.getenv("CHECKPOINTER_COMPRESS", "1") != "0":
+        serde = CompressedSerializer()
+
+    if kind == "memory":
+        max_threads = int(os.getenv("CHECKPOINTER_MAX_THREADS", DEFAULT_MAX_THREADS))
+        return BoundedMemorySaver(max_threads=max_threads, max_checkpoints=max_checkpoints, serde=serde)
+    if kind == "sqlite":
+        return create_sqlite_checkpointer(uri or DEFAULT_SQLITE_PATH, max_checkpoints=max_checkpoints, serde=serde)
+    if kind == "mongo":
+        uri = uri or os.getenv("MONGODB_URI")
+        if not uri:
+            raise ValueError("CHECKPOINTER=mongo requires CHECKPOINTER_URI or MONGODB_URI")
+        return create_mongo_checkpointer(uri, max_checkpoints=max_checkpoints, serde=serde)
+    raise ValueError(f"Unknown checkpointer: {kind}")
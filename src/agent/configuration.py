@@ -2,8 +2,8 @@
 
 from __future__ import annotations
 
-from dataclasses import dataclass, fields, field
-from typing import Optional
+from dataclasses import dataclass, field, fields
+from typing import Any, Optional
 
 from langchain_core.runnables import RunnableConfig
 
@@ -14,12 +14,46 @@ class Configuration:
 
     # by default, we set the language as the language platform
     tenant_id: str = "brais"
-    expert_id: str = "experto_de_brais"
-    expert_profile: dict = field(default_factory=lambda: {
-        "name": None,
-        "description": None,
-        "instructions": None,
-    })
+    # expert whose profile is kept in the profile store; the thread id when None
+    expert_id: Optional[str] = None
+    # whole profile sent by clients that own it, even when every field is
+    # empty; the profile store is then neither read nor written. Leave it
+    # None to load the profile of (tenant_id, expert_id) from the store
+    expert_profile: Optional[dict[str, Any]] = None
+    # apply the field values carried by UpdateMemory locally, and only fall back
+    # to the langmem memory manager when a merge is needed
+    local_profile_updates: bool = True
+    # token budget for the conversation history sent to the model; older
+    # exchanges are folded into a rolling summary once it is exceeded
+    history_token_budget: int = 3000
+    # number of most recent exchanges that are always kept verbatim
+    history_keep_exchanges: int = 3
+    # serve field-help suggestions from the response cache when possible;
+    # set to False to force a fresh generation for this request
+    field_help_cache: bool = True
+    # answer questions that only read the profile ("what's my expert's name?")
+    # locally from the synced profile, without calling the model
+    profile_fast_path: bool = True
+    # version of the stored profile the client last saw; when it is the cached
+    # version the profile is served without a round trip to the store
+    profile_version: Optional[int] = None
+    # time budget of a turn in seconds; model calls time out when it runs out
+    # and nodes answer with a degraded result instead. None means no budget
+    deadline_seconds: Optional[float] = None
+    # latency quantile of a node's model calls (e.g. 0.95) after which an
+    # identical request is fired and the first answer wins; off when None.
+    # Calls whose tokens are streamed to the client are never hedged
+    hedge_quantile: Optional[float] = None
+    # chat model of every call site without an entry in model_policy
+    default_model: str = "gpt-4o"
+    # models per node ("message_manager") or field-help field
+    # ("expert_field_assistant.name"), with fallbacks and escalation; see
+    # agent.model_policy for the format
+    model_policy: dict[str, Any] = field(default_factory=dict)
+    # draft field-help suggestions for the unset fields in the background once
+    # a field is set, and serve them while the profile is unchanged; see
+    # agent.speculation
+    speculative_field_help: bool = False
 
     @classmethod
     def from_runnable_config(
@@ -0,0 +1,210 @@
+"""Per-turn time budget for model calls, with hedged requests for the slow tail.
+
+``Configuration.deadline_seconds`` gives every turn a time budget. sync_profile
+turns it into the absolute ``deadline`` of the turn in the state, and every
+model call runs with the time left as its timeout. The same time left is the
+timeout of the HTTP request itself (see :func:`request_timeout`), so a call
+that gives up does not leave its request running. A call that runs out raises
+:class:`DeadlineExceeded`, and the node answers with a degraded result instead
+of stalling or failing the turn.
+
+With ``Configuration.hedge_quantile`` set, a call still running after that
+latency quantile of its node (from the ``llm.duration_ms`` histogram) fires a
+second, identical request. The first answer wins and the other request is
+cancelled; synchronous calls cannot be interrupted, so there the loser runs
+until its request timeout. Calls whose tokens are streamed to the client are
+never hedged, since the answer could differ from the tokens already shown.
+``deadline.hedges``, ``deadline.hedge_wins`` and ``deadline.degraded`` count
+what happened, labelled by node.
+
+Synchronous calls run on one shared pool of ``DEADLINE_MAX_WORKERS`` threads.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Coroutine, Mapping, Optional, TypeVar
+
+from langchain_core.callbacks import BaseCallbackManager
+from langchain_core.runnables import RunnableConfig
+from langchain_core.runnables.config import var_child_runnable_config
+from langchain_core.tracers._streaming import _StreamingCallbackHandler
+
+from agent.configuration import Configuration
+from agent.metrics import metrics
+
+# Observations of a node's latency needed before its calls are hedged.
+MIN_HEDGE_SAMPLES = 20
+# Two requests per call, for every call the default scheduler runs at once.
+DEFAULT_MAX_WORKERS = 64
+
+# time.monotonic() by which the model request in flight has to finish
+_request_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar(
+    "request_deadline", default=None
+)
+_executor_lock = threading.Lock()
+_executor: Optional[ThreadPoolExecutor] = None
+
+T = TypeVar("T")
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when a model call cannot finish within the time left for the turn."""
+
+
+def turn_deadline(config: RunnableConfig) -> Optional[float]:
+    """Return the absolute deadline of a turn starting now, None without a budget."""
+    budget = Configuration.from_runnable_config(config).deadline_seconds
+    return None if budget is None else time.time() + budget
+
+
+def time_left(state: Mapping[str, Any]) -> Optional[float]:
+    """Return the seconds left until the deadline of the turn, None without one."""
+    deadline = state.get("deadline")
+    return None if deadline is None else deadline - time.time()
+
+
+def request_timeout() -> Optional[float]:
+    """Return the timeout for a model request made now, None when it is not bounded."""
+    deadline = _request_deadline.get()
+    return None if deadline is None else max(0.0, deadline - time.monotonic())
+
+
+def degraded(node: str) -> None:
+    """Count a degraded result of ``node``."""
+    metrics.increment("deadline.degraded", node=node)
+
+
+def _streams_tokens(config: RunnableConfig) -> bool:
+    """Tell whether the run streams model tokens to the client, e.g. ``stream_mode="messages"``."""
+    callbacks = config.get("callbacks")
+    handlers = callbacks.handlers if isinstance(callbacks, BaseCallbackManager) else callbacks or []
+    return any(isinstance(handler, _StreamingCallbackHandler) for handler in handlers)
+
+
+def _plan(node: str, state: Mapping[str, Any], config: RunnableConfig, hedge: bool) -> tuple[Optional[float], Optional[float]]:
+    """Return the timeout of a call and the delay after which it is hedged."""
+    timeout = time_left(state)
+    if timeout is not None and timeout <= 0:
+        raise DeadlineExceeded(f"No time left for the {node} model call")
+    quantile = Configuration.from_runnable_config(config).hedge_quantile
+    delay = None
+    if hedge and quantile is not None and not _streams_tokens(config):
+        delay_ms = metrics.quantile("llm.duration_ms", quantile, min_count=MIN_HEDGE_SAMPLES, node=node)
+        if delay_ms is not None and (timeout is None or delay_ms / 1000 < timeout):
+            delay = delay_ms / 1000
+    return timeout, delay
+
+
+def _context(deadline: Optional[float], silent: bool = False) -> contextvars.Context:
+    """Return a copy of the current context for a request that has to finish by ``deadline``.
+
+    In a silent context runnables run without callbacks.
+    """
+    context = contextvars.copy_context()
+    context.run(_request_deadline.set, deadline)
+    if silent:
+        config = var_child_runnable_config.get() or {}
+        context.run(var_child_runnable_config.set, {**config, "callbacks": None})
+    return context
+
+
+def _shared_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=int(os.getenv("DEADLINE_MAX_WORKERS", DEFAULT_MAX_WORKERS)),
+                thread_name_prefix="deadline",
+            )
+        return _executor
+
+
+def _remaining(timeout: Optional[float], started: float) -> Optional[float]:
+    return None if timeout is None else max(0.0, timeout - (time.monotonic() - started))
+
+
+def call_within_deadline(
+    node: str, state: Mapping[str, Any], config: RunnableConfig, func: Callable[[], T], *, hedge: bool = True
+) -> T:
+    """Run ``func`` with the time left for the turn as timeout, hedging slow calls.
+
+    Raises:
+        DeadlineExceeded: the call did not finish in time.
+    """
+    timeout, delay = _plan(node, state, config, hedge)
+    if timeout is None and delay is None:
+        return func()
+
+    started = time.monotonic()
+    deadline = None if timeout is None else started + timeout
+    executor = _shared_executor()
+    futures: list[Future[T]] = [executor.submit(_context(deadline).run, func)]
+    try:
+        done, _ = wait(futures, timeout=delay if delay is not None else timeout)
+        if not done and delay is not None:
+            metrics.increment("deadline.hedges", node=node)
+            futures.append(executor.submit(_context(deadline, silent=True).run, func))
+        while True:
+            done, pending = wait(futures, timeout=_remaining(timeout, started), return_when=FIRST_COMPLETED)
+            if not done:
+                raise DeadlineExceeded(f"The {node} model call did not finish in time")
+            winner = next((future for future in futures if future in done and future.exception() is None), None)
+            if winner is not None or not pending:
+                winner = winner or next(iter(done))
+                if winner is not futures[0]:
+                    metrics.increment("deadline.hedge_wins", node=node)
+                return winner.result()
+            # The first to finish failed; wait for the other request.
+            futures = list(pending)
+    finally:
+        # Requests that did not start are dropped; running ones end at their request timeout.
+        for future in futures:
+            future.cancel()
+
+
+async def acall_within_deadline(
+    node: str,
+    state: Mapping[str, Any],
+    config: RunnableConfig,
+    func: Callable[[], Coroutine[Any, Any, T]],
+    *,
+    hedge: bool = True,
+) -> T:
+    """Async version of call_within_deadline; the losing request is cancelled."""
+    timeout, delay = _plan(node, state, config, hedge)
+    if timeout is None and delay is None:
+        return await func()
+
+    loop = asyncio.get_running_loop()
+    started = time.monotonic()
+    deadline = None if timeout is None else started + timeout
+    primary: asyncio.Task[T] = loop.create_task(func(), context=_context(deadline))
+    tasks = [primary]
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay if delay is not None else timeout)
+        if not done and delay is not None:
+            metrics.increment("deadline.hedges", node=node)
+            tasks.append(loop.create_task(func(), context=_context(deadline, silent=True)))
+        while True:
+            done, pending = await asyncio.wait(
+                tasks, timeout=_remaining(timeout, started), return_when=asyncio.FIRST_COMPLETED
+            )
+            if not done:
+                raise DeadlineExceeded(f"The {node} model call did not finish in time")
+            winner = next((task for task in tasks if task in done and task.exception() is None), None)
+            if winner is not None or not pending:
+                winner = winner or next(iter(done))
+                if winner is not primary:
+                    metrics.increment("deadline.hedge_wins", node=node)
+                return winner.result()
+            # The first to finish failed; wait for the other request.
+            tasks = list(pending)
+    finally:
+        for task in tasks:
+            task.cancel()
@@ -1,56 +1,145 @@
-from typing import Literal
+import functools
+import os
+from typing import Any, Awaitable, Callable, Union
 
-import certifi
-from dotenv import load_dotenv
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableConfig, RunnableLambda
 from langgraph.constants import END, START
-
-from agent.nodes.expert_field_assistant import expert_field_assistant
-from agent.nodes.sync_profile import sync_profile
-from agent.state import ExpertCreatorAssistant
-from langgraph.checkpoint.memory import MemorySaver
 from langgraph.graph import StateGraph
+from langgraph.pregel import Pregel
+from langgraph.types import Send
 
 from agent.configuration import Configuration
-from agent.nodes.message_manager import message_manager
-from agent.nodes.update_expert import update_expert
+from agent.state import ExpertCreatorAssistant
+from agent.tools import tool_node
 
-# Load environment variables
-load_dotenv()
 
+def route_message(state: ExpertCreatorAssistant) -> Union[str, list[Send]]:
+    """Send every tool call of the model's response to the node that answers it.
 
-def route_message(state: ExpertCreatorAssistant) -> Literal[END, "update_expert", "expert_field_assistant"]:
-    """Reflect on the memories and chat history to decide whether to update the memory collection."""
+    All UpdateMemory calls go to a single update_expert run, which applies
+    their patches in order; each help call gets its own expert_field_assistant
+    run. The runs execute concurrently and message_manager runs once after them.
+    """
     message = state['messages'][-1]
-    if len(message.tool_calls) == 0:
+    tool_calls = message.tool_calls if isinstance(message, AIMessage) else []
+    if len(tool_calls) == 0:
         return END
 
-    tool_call = message.tool_calls[0]
-    args = tool_call.get('args', {})
+    updates = [tool_call for tool_call in tool_calls if tool_node(tool_call) == "update_expert"]
+    helps = [tool_call for tool_call in tool_calls if tool_node(tool_call) == "expert_field_assistant"]
+    sends = [Send("update_expert", {**state, "tool_calls": updates})] if updates else []
+    sends += [Send("expert_field_assistant", {**state, "tool_calls": [tool_call]}) for tool_call in helps]
+    return sends
+
+
+async def aroute_message(state: ExpertCreatorAssistant) -> Union[str, list[Send]]:
+    """Async version of route_message, so async runs route without a thread pool hop."""
+    return route_message(state)
+
+
+def _node(
+    func: Callable[[ExpertCreatorAssistant, RunnableConfig], Any],
+    afunc: Callable[[ExpertCreatorAssistant, RunnableConfig], Awaitable[Any]],
+) -> RunnableLambda[ExpertCreatorAssistant, Any]:
+    """Wrap a node so ``invoke``/``stream`` run ``func`` and ``ainvoke``/``astream`` run ``afunc``."""
+    return RunnableLambda(func, afunc=afunc, name=func.__name__)
+
+
+def _load_env() -> None:
+    """Load variables from .env, unless the environment was already provided.
+
+    Under langgraph-api the server loads .env itself (see langgraph.json).
+    """
+    if os.getenv("OPENAI_API_KEY") is None:
+        from dotenv import load_dotenv
+
+        load_dotenv()
+
+
+def build_workflow() -> StateGraph:
+    """Define the StateGraph; the node modules are only imported here."""
+    # Node modules read their settings from the environment when imported.
+    _load_env()
+
+    from agent.nodes.compact_history import acompact_history, compact_history
+    from agent.nodes.expert_field_assistant import (
+        aexpert_field_assistant,
+        expert_field_assistant,
+    )
+    from agent.nodes.message_manager import amessage_manager, message_manager
+    from agent.nodes.profile_fast_path import aprofile_fast_path, profile_fast_path
+    from agent.nodes.sync_profile import async_profile, sync_profile
+    from agent.nodes.update_expert import aupdate_expert, update_expert
+
+    workflow = StateGraph(ExpertCreatorAssistant, config_schema=Configuration)
+
+    workflow.add_node("sync_profile", _node(sync_profile, async_profile))
+    workflow.add_node(
+        "profile_fast_path",
+        _node(profile_fast_path, aprofile_fast_path),
+        destinations=("compact_history", END),
+    )
+    workflow.add_node("compact_history", _node(compact_history, acompact_history))
+    workflow.add_node("message_manager", _node(message_manager, amessage_manager))
+    workflow.add_node("update_expert", _node(update_expert, aupdate_expert))
+    workflow.add_node("expert_field_assistant", _node(expert_field_assistant, aexpert_field_assistant))
+    workflow.add_edge(START, "sync_profile")
+    workflow.add_edge("sync_profile", "profile_fast_path")
+    workflow.add_edge("compact_history", "message_manager")
+    workflow.add_conditional_edges(
+        "message_manager",
+        RunnableLambda[ExpertCreatorAssistant, Any](route_message, afunc=aroute_message),
+        [END, "update_expert", "expert_field_assistant"],
+    )
+    workflow.add_edge("update_expert", "message_manager")
+    workflow.add_edge("expert_field_assistant", "message_manager")
+    return workflow
+
+
+@functools.cache
+def load_graph() -> Pregel:
+    """Compile the graph on first use and return the same instance afterwards.
+
+    This is also the graph factory langgraph.json points at. With
+    ``AGENT_WARM_UP`` set, the model clients are initialized right away.
+    """
+    from agent.checkpointer import create_checkpointer
+    from agent.instrumentation import instrumentation
 
-    if args.get('update_type') == "expert":
-        return "update_expert"
-    elif args.get('tool_type') == "help":
-        return "expert_field_assistant"
-    else:
-        raise ValueError(f"Unexpected tool call args: {args}")
+    # Checkpointer backend selected by the CHECKPOINTER environment variable
+    within_thread_memory = create_checkpointer()
 
+    # Compile the workflow with the checkpointer; every run reports node and LLM metrics
+    compiled = build_workflow().compile(checkpointer=within_thread_memory).with_config(callbacks=[instrumentation])
+    if os.getenv("AGENT_WARM_UP", "").lower() in ("1", "true", "yes"):
+        warm_up()
+    return compiled
 
-# Define the StateGraph
-workflow = StateGraph(ExpertCreatorAssistant, config_schema=Configuration)
 
-workflow.add_node("sync_profile", sync_profile)
-workflow.add_node("message_manager", message_manager)
-workflow.add_node("update_expert", update_expert)
-workflow.add_node("expert_field_assistant", expert_field_assistant)
-workflow.add_edge(START, "sync_profile")
-workflow.add_edge("sync_profile", "message_manager")
-workflow.add_conditional_edges("message_manager", route_message)
-workflow.add_edge("update_expert", "message_manager")
-workflow.add_edge("expert_field_assistant", "message_manager")
+def warm_up() -> None:
+    """Initialize what the first request would otherwise pay for.
 
-within_thread_memory = MemorySaver()
+    Builds the shared clients of the default model and the runnables every
+    node uses on it, with their HTTP pool, and imports langmem for the memory
+    manager fallback.
+    """
+    from agent.nodes import compact_history, expert_field_assistant, message_manager
+    from agent.profile import PROFILE_FIELDS
 
-# Compile the workflow with the checkpointer
-graph = workflow.compile(checkpointer=within_thread_memory)
+    # Call sites with their own model policy build their clients on first use.
+    model = Configuration().default_model
+    message_manager._model(model)
+    compact_history._model(model)
+    for field in PROFILE_FIELDS:
+        expert_field_assistant.field_help_chain(field, model)
+    import langmem  # type: ignore[import-untyped]  # noqa: F401
 
 
+def __getattr__(name: str) -> Any:
+    # ``from agent.graph import graph`` keeps working, compiled on first access.
+    if name == "graph":
+        return load_graph()
+    if name == "workflow":
+        return build_workflow()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,97 @@
+"""Token-budgeted view of the conversation history.
+
+Older exchanges are folded into a rolling summary kept in state, and only the
+most recent exchanges are sent to the model verbatim. The summary is extended
+incrementally with the messages that fell out of the verbatim window since the
+last compaction, so its cost does not grow with the length of the session.
+"""
+
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from typing import Optional, Sequence
+
+from langchain_core.messages import BaseMessage, SystemMessage
+from langchain_core.messages.utils import count_tokens_approximately
+from langchain_core.runnables import RunnableConfig
+
+from agent.configuration import Configuration
+from agent.message_log import as_log, message_log
+from agent.state import ExpertCreatorAssistant
+
+_MAX_CACHED_COUNTS = 10_000
+
+_token_counts: OrderedDict[tuple[str, int], int] = OrderedDict()
+_token_counts_lock = threading.Lock()
+
+
+def count_tokens(message: BaseMessage) -> int:
+    """Return the approximate token count of a message, cached by message id."""
+    if message.id is None:
+        return count_tokens_approximately([message])
+
+    key = (message.id, len(str(message.content)))
+    with _token_counts_lock:
+        count = _token_counts.get(key)
+        if count is not None:
+            _token_counts.move_to_end(key)
+            return count
+
+    count = count_tokens_approximately([message])
+    with _token_counts_lock:
+        _token_counts[key] = count
+        if len(_token_counts) > _MAX_CACHED_COUNTS:
+            _token_counts.popitem(last=False)
+    return count
+
+
+def unsummarized_start(messages: Sequence[BaseMessage], summarized_until: Optional[str]) -> int:
+    """Return the index of the first message not yet folded into the summary."""
+    index = as_log(messages).position(summarized_until)
+    return 0 if index is None else index + 1
+
+
+def exchange_starts(messages: Sequence[BaseMessage], start: int) -> list[int]:
+    """Return the indexes, from ``start`` on, where a human turn begins."""
+    return as_log(messages).human_positions(start)
+
+
+def _budgeted_start(state: ExpertCreatorAssistant, config: RunnableConfig) -> tuple[list[BaseMessage], int]:
+    """Return the summary prefix and the index of the first message that fits the budget."""
+    configuration = Configuration.from_runnable_config(config)
+    messages = message_log(state)
+    start = unsummarized_start(messages, state.get("summarized_until"))
+
+    summary = state.get("summary")
+    prefix: list[BaseMessage] = []
+    budget = configuration.history_token_budget
+    if summary:
+        prefix = [SystemMessage(content=f"Summary of the earlier conversation:\n{summary}")]
+        budget -= count_tokens_approximately(prefix)
+
+    total = sum(count_tokens(msg) for msg in messages[start:])
+    for exchange_start in exchange_starts(messages, start)[1:]:
+        if total <= budget:
+            break
+        total -= sum(count_tokens(msg) for msg in messages[start:exchange_start])
+        start = exchange_start
+    return prefix, start
+
+
+def budgeted_history(state: ExpertCreatorAssistant, config: RunnableConfig) -> list[BaseMessage]:
+    """Return the conversation history to send to a model.
+
+    The rolling summary, if any, comes first as a system message, followed by
+    the messages that have not been summarized yet. If those still exceed the
+    token budget, whole exchanges are dropped from the front, always keeping
+    the latest one so tool calls are never separated from their results.
+    """
+    prefix, start = _budgeted_start(state, config)
+    return prefix + list(state["messages"][start:])
+
+
+def budgeted_chat_view(state: ExpertCreatorAssistant, config: RunnableConfig) -> list[BaseMessage]:
+    """Return budgeted_history without tool calls and tool results, read from the chat view index."""
+    prefix, start = _budgeted_start(state, config)
+    return prefix + message_log(state).chat_view(start)
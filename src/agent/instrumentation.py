@@ -0,0 +1,185 @@
+"""Per-node and per-thread instrumentation of graph runs.
+
+``Instrumentation`` is a callback handler attached to the compiled graph. For
+every node run it records wall time and payload sizes, and for every chat
+model call inside a node its latency and time to first token, as histograms
+labelled by node in ``agent.metrics``. Token usage is counted once, by
+``agent.llm.record_token_usage``. Totals per thread, tokens included, are
+kept in a bounded LRU map, and metrics are pushed to the configured exporters
+at the end of a graph run once the export interval has passed.
+
+``sampled_debug`` is the logging used on the hot path: nothing is formatted
+unless debug logging is enabled, and then only for ``LOG_SAMPLE_RATE`` of the
+calls.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import LLMResult
+
+from agent.message_log import MessageLog, message_size
+from agent.metrics import Metrics, metrics
+
+DEFAULT_MAX_THREADS = 1024
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.1"))
+
+
+def sampled_debug(logger: logging.Logger, msg: str, *args: Any, rate: Optional[float] = None) -> None:
+    """Log at debug level for a random ``rate`` share of calls, formatting lazily."""
+    if logger.isEnabledFor(logging.DEBUG) and random.random() < (LOG_SAMPLE_RATE if rate is None else rate):
+        logger.debug(msg, *args)
+
+
+def payload_size(value: Any) -> int:
+    """Approximate size of a node input or output in characters, without serializing it."""
+    if isinstance(value, BaseMessage):
+        return message_size(value)
+    if isinstance(value, MessageLog):
+        return value.size
+    if isinstance(value, str):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(payload_size(item) for item in value.values())
+    if isinstance(value, list | tuple):
+        return sum(payload_size(item) for item in value)
+    update = getattr(value, "update", None)  # langgraph Command
+    return payload_size(update) if isinstance(update, dict | list | tuple) else 0
+
+
+def _node_run(name: Optional[str], tags: Optional[list[str]], metadata: Optional[dict[str, Any]]) -> Optional[str]:
+    node: Optional[str] = (metadata or {}).get("langgraph_node")
+    if node and name == node and any(tag.startswith("graph:step:") for tag in tags or ()):
+        return node
+    return None
+
+
+class Instrumentation(BaseCallbackHandler):
+    """Callback handler recording node and LLM timings, tokens and payload sizes.
+
+    Histograms, all labelled by ``node``:
+
+    - ``node.duration_ms``, ``node.input_size`` and ``node.output_size``;
+    - ``llm.duration_ms`` and ``llm.time_to_first_token_ms``.
+
+    Failed node runs are counted in ``node.errors``.
+    """
+
+    run_inline = True
+
+    def __init__(self, metrics: Metrics = metrics, *, max_threads: int = DEFAULT_MAX_THREADS) -> None:
+        """Record into ``metrics``, keeping the totals of the ``max_threads`` most recent threads."""
+        self.metrics = metrics
+        self.max_threads = max_threads
+        self._lock = threading.Lock()
+        self._nodes: dict[UUID, tuple[str, Optional[str], float]] = {}
+        self._llms: dict[UUID, tuple[str, Optional[str], float]] = {}
+        self._first_token: set[UUID] = set()
+        self._threads: OrderedDict[str, dict[str, float]] = OrderedDict()
+
+    def thread_stats(self, thread_id: str) -> dict[str, float]:
+        """Return the totals recorded for a thread, empty if it was never seen or evicted."""
+        with self._lock:
+            return dict(self._threads.get(thread_id, {}))
+
+    def _add_thread(self, thread_id: Optional[str], **values: float) -> None:
+        if thread_id is None:
+            return
+        with self._lock:
+            totals = self._threads.get(thread_id)
+            if totals is None:
+                totals = self._threads[thread_id] = {}
+                if len(self._threads) > self.max_threads:
+                    self._threads.popitem(last=False)
+            else:
+                self._threads.move_to_end(thread_id)
+            for key, value in values.items():
+                totals[key] = totals.get(key, 0) + value
+
+    def on_chain_start(self, serialized: Optional[dict[str, Any]], inputs: Any, *, run_id: UUID,
+                       parent_run_id: Optional[UUID] = None, tags: Optional[list[str]] = None,
+                       metadata: Optional[dict[str, Any]] = None, **kwargs: Any) -> None:
+        """Start timing a node run and record the size of its input."""
+        node = _node_run(kwargs.get("name"), tags, metadata)
+        if node is None:
+            return
+        self._nodes[run_id] = (node, (metadata or {}).get("thread_id"), time.perf_counter())
+        self.metrics.observe("node.input_size", payload_size(inputs), node=node)
+
+    def on_chain_end(self, outputs: Any, *, run_id: UUID, parent_run_id: Optional[UUID] = None,
+                     **kwargs: Any) -> None:
+        """Record the duration and output size of a node run; graph runs also export due metrics."""
+        if parent_run_id is None:
+            self.metrics.export_if_due()
+        started = self._nodes.pop(run_id, None)
+        if started is None:
+            return
+        node, thread_id, start = started
+        elapsed = (time.perf_counter() - start) * 1000
+        self.metrics.observe("node.duration_ms", elapsed, node=node)
+        self.metrics.observe("node.output_size", payload_size(outputs), node=node)
+        self._add_thread(thread_id, node_runs=1, node_ms=elapsed)
+
+    def on_chain_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        """Count a failed node run."""
+        started = self._nodes.pop(run_id, None)
+        if started is not None:
+            self.metrics.increment("node.errors", node=started[0])
+
+    def on_chat_model_start(self, serialized: Optional[dict[str, Any]], messages: list[list[BaseMessage]], *,
+                            run_id: UUID, metadata: Optional[dict[str, Any]] = None, **kwargs: Any) -> None:
+        """Start timing a model call made by a node."""
+        node: Optional[str] = (metadata or {}).get("langgraph_node")
+        if node:
+            self._llms[run_id] = (node, (metadata or {}).get("thread_id"), time.perf_counter())
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs: Any) -> None:
+        """Record the time to the first streamed token of a model call."""
+        started = self._llms.get(run_id)
+        if started is not None and run_id not in self._first_token:
+            self._first_token.add(run_id)
+            self.metrics.observe("llm.time_to_first_token_ms", (time.perf_counter() - started[2]) * 1000,
+                                 node=started[0])
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        """Record the duration of a model call and add its tokens to the thread's totals."""
+        self._first_token.discard(run_id)
+        started = self._llms.pop(run_id, None)
+        if started is None:
+            return
+        node, thread_id, start = started
+        elapsed = (time.perf_counter() - start) * 1000
+        self.metrics.observe("llm.duration_ms", elapsed, node=node)
+        usage = _usage(response)
+        prompt = usage.get("input_tokens", 0)
+        cached = (usage.get("input_token_details") or {}).get("cache_read", 0)
+        completion = usage.get("output_tokens", 0)
+        self._add_thread(thread_id, llm_calls=1, llm_ms=elapsed, prompt_tokens=prompt,
+                         cached_prompt_tokens=cached, completion_tokens=completion)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        """Forget a failed model call."""
+        self._first_token.discard(run_id)
+        self._llms.pop(run_id, None)
+
+
+def _usage(response: LLMResult) -> dict[str, Any]:
+    for generations in response.generations:
+        for generation in generations:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage:
+                return dict(usage)
+    return {}
+
+
+instrumentation = Instrumentation()
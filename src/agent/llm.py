@@ -0,0 +1,292 @@
+"""Process-wide registry of long-lived chat model clients.
+
+Nodes ask the registry for a model, or for a runnable pre-built on top of one
+(tools bound, prompt chained), instead of constructing ``ChatOpenAI`` on every
+call. Clients share one bounded, keep-alive HTTP connection pool, so TLS
+sessions and tool schema conversion are reused across turns and threads.
+
+``langchain_openai`` and ``httpx`` are imported when the first default client
+is built, so importing the graph stays cheap for processes that never call a
+model or use another factory.
+
+Default clients send the time left for the turn (``agent.deadline``) as the
+timeout of every request.
+
+Nodes make their model calls with :func:`invoke` / :func:`ainvoke`, which
+queue the call on the scheduler, bound it by the deadline of the turn and run
+it on the models of the node's policy.
+"""
+
+from __future__ import annotations
+
+import functools
+import logging
+import threading
+from collections import OrderedDict
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Awaitable,
+    Callable,
+    Hashable,
+    Mapping,
+    Optional,
+    Sequence,
+    TypeVar,
+    Union,
+)
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.runnables import Runnable, RunnableConfig
+
+from agent.deadline import (
+    acall_within_deadline,
+    call_within_deadline,
+    request_timeout,
+    time_left,
+)
+from agent.metrics import metrics
+from agent.model_policy import (
+    ModelPolicy,
+    acall_with_policy,
+    call_with_policy,
+    model_policy,
+)
+from agent.scheduler import PRIORITY_INTERACTIVE, llm_request, scheduler
+
+if TYPE_CHECKING:
+    import httpx
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_CLIENTS = 8
+DEFAULT_MAX_RUNNABLES = 64
+DEFAULT_MAX_CONNECTIONS = 100
+DEFAULT_MAX_KEEPALIVE_CONNECTIONS = 20
+DEFAULT_KEEPALIVE_EXPIRY = 30.0
+
+ChatModelFactory = Callable[..., BaseChatModel]
+MemoryManagerFactory = Callable[..., Runnable[Any, Any]]
+RunnableBuilder = Callable[[BaseChatModel], Runnable[Any, Any]]
+
+T = TypeVar("T")
+
+
+@functools.cache
+def _chat_openai() -> ChatModelFactory:
+    from langchain_openai import ChatOpenAI
+
+    class DeadlineChatOpenAI(ChatOpenAI):
+        """ChatOpenAI whose requests time out with the deadline of the turn."""
+
+        def _get_request_payload(self, input_: Any, *, stop: Optional[list[str]] = None, **kwargs: Any) -> dict[str, Any]:
+            timeout = request_timeout()
+            if timeout is not None:
+                kwargs.setdefault("timeout", timeout)
+            return super()._get_request_payload(input_, stop=stop, **kwargs)
+
+    return DeadlineChatOpenAI
+
+
+def _settings_key(model: str, settings: dict[str, Any]) -> tuple[Hashable, ...]:
+    return (model, tuple(sorted(settings.items())))
+
+
+class ModelRegistry:
+    """Hand out shared chat model clients keyed by model name and settings.
+
+    Both the clients and the runnables built on top of them are kept in
+    bounded LRU maps, so a process serving many model/setting combinations
+    does not accumulate clients without limit.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_clients: int = DEFAULT_MAX_CLIENTS,
+        max_runnables: int = DEFAULT_MAX_RUNNABLES,
+        limits: Optional[httpx.Limits] = None,
+        factory: Optional[ChatModelFactory] = None,
+        memory_manager_factory: Optional[MemoryManagerFactory] = None,
+    ) -> None:
+        """Keep up to ``max_clients`` clients and ``max_runnables`` runnables sharing one HTTP pool.
+
+        ``factory`` builds the clients and ``memory_manager_factory`` the memory
+        managers; by default a ``ChatOpenAI`` on the shared pool with ``limits``
+        and langmem's ``create_memory_manager``.
+        """
+        self.max_clients = max_clients
+        self.max_runnables = max_runnables
+        self.limits = limits
+        self._factory = factory
+        self._memory_manager_factory = memory_manager_factory
+        self._lock = threading.RLock()
+        self._clients: OrderedDict[tuple[Hashable, ...], BaseChatModel] = OrderedDict()
+        self._runnables: OrderedDict[tuple[Hashable, ...], Runnable[Any, Any]] = OrderedDict()
+        self._http_client: Optional[httpx.Client] = None
+        self._http_async_client: Optional[httpx.AsyncClient] = None
+
+    def set_factory(self, factory: Optional[ChatModelFactory]) -> None:
+        """Replace the function used to build clients and drop cached ones.
+
+        Passing ``None`` restores the default ``ChatOpenAI`` factory.
+        """
+        with self._lock:
+            self._factory = factory
+            self._clients.clear()
+            self._runnables.clear()
+
+    def set_memory_manager_factory(self, factory: Optional[MemoryManagerFactory]) -> None:
+        """Replace the function used to build memory managers.
+
+        Passing ``None`` restores langmem's ``create_memory_manager``.
+        """
+        self._memory_manager_factory = factory
+
+    def create_memory_manager(self, model: str, **kwargs: Any) -> Runnable[Any, Any]:
+        """Create a langmem memory manager on top of the shared client for ``model``."""
+        factory = self._memory_manager_factory
+        if factory is None:
+            from langmem import create_memory_manager  # type: ignore[import-untyped]
+
+            factory = create_memory_manager
+        return factory(self.get_chat_model(model), **kwargs)
+
+    def get_chat_model(self, model: str, **settings: Any) -> BaseChatModel:
+        """Return the shared client for ``model`` with the given settings."""
+        key = _settings_key(model, settings)
+        with self._lock:
+            client = self._clients.get(key)
+            if client is not None:
+                self._clients.move_to_end(key)
+                return client
+            factory = self._factory or self._default_factory
+            client = factory(model, **settings)
+            self._clients[key] = client
+            if len(self._clients) > self.max_clients:
+                self._clients.popitem(last=False)
+            return client
+
+    def get_runnable(
+        self, name: str, build: RunnableBuilder, model: str, **settings: Any
+    ) -> Runnable[Any, Any]:
+        """Return a runnable built once per ``name`` on top of a shared client.
+
+        ``build`` receives the shared client and returns the runnable to cache,
+        e.g. the model with tools bound or a prompt chained in front of it.
+        """
+        key = (name, *_settings_key(model, settings))
+        with self._lock:
+            runnable = self._runnables.get(key)
+            if runnable is not None:
+                self._runnables.move_to_end(key)
+                return runnable
+            runnable = build(self.get_chat_model(model, **settings))
+            self._runnables[key] = runnable
+            if len(self._runnables) > self.max_runnables:
+                self._runnables.popitem(last=False)
+            return runnable
+
+    def clear(self) -> None:
+        """Drop every cached client and runnable and close the HTTP pool."""
+        with self._lock:
+            self._clients.clear()
+            self._runnables.clear()
+            if self._http_client is not None:
+                self._http_client.close()
+                self._http_client = None
+            # The async client is bound to the event loop that used it, so it is
+            # simply released rather than closed from synchronous code.
+            self._http_async_client = None
+
+    def _default_factory(self, model: str, **settings: Any) -> BaseChatModel:
+        import httpx
+
+        if self.limits is None:
+            self.limits = httpx.Limits(
+                max_connections=DEFAULT_MAX_CONNECTIONS,
+                max_keepalive_connections=DEFAULT_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=DEFAULT_KEEPALIVE_EXPIRY,
+            )
+        if self._http_client is None:
+            self._http_client = httpx.Client(limits=self.limits)
+        if self._http_async_client is None:
+            self._http_async_client = httpx.AsyncClient(limits=self.limits)
+        # Usage is also reported on streamed responses, cached prompt tokens included.
+        settings.setdefault("stream_usage", True)
+        return _chat_openai()(
+            model=model,
+            http_client=self._http_client,
+            http_async_client=self._http_async_client,
+            **settings,
+        )
+
+
+registry = ModelRegistry()
+
+
+def record_token_usage(node: str, message: BaseMessage) -> None:
+    """Count the prompt, cached prompt and completion tokens reported for a response.
+
+    The ratio of ``llm.cached_prompt_tokens`` to ``llm.prompt_tokens`` per node is
+    the provider-side prompt cache hit rate.
+    """
+    usage = getattr(message, "usage_metadata", None)
+    if not usage:
+        return
+    cached = (usage.get("input_token_details") or {}).get("cache_read", 0)
+    metrics.increment("llm.prompt_tokens", usage.get("input_tokens", 0), node=node)
+    metrics.increment("llm.cached_prompt_tokens", cached, node=node)
+    metrics.increment("llm.completion_tokens", usage.get("output_tokens", 0), node=node)
+    logger.debug("%s usage: %s prompt tokens (%s cached), %s completion tokens",
+                 node, usage.get("input_tokens", 0), cached, usage.get("output_tokens", 0))
+
+
+def invoke(
+    node: str,
+    config: RunnableConfig,
+    state: Mapping[str, Any],
+    build: Callable[[str], T],
+    *,
+    prompt: Union[str, Sequence[BaseMessage]],
+    priority: int = PRIORITY_INTERACTIVE,
+    policy: Optional[ModelPolicy] = None,
+    validate: Optional[Callable[[T], bool]] = None,
+    hedge: bool = True,
+) -> T:
+    """Make a model call of ``node`` for the turn of ``state``.
+
+    The call waits for its turn on the scheduler (``prompt`` sizes it and keys
+    coalescing), no longer than the time left for the turn, runs within the
+    deadline of the turn and goes through the models of ``policy``, the node's
+    own by default. ``build`` makes the call
+    with the model name it is given; ``validate`` and ``hedge`` are passed on
+    to ``call_with_policy`` and ``call_within_deadline``.
+
+    Raises:
+        DeadlineExceeded: the call did not finish in time.
+    """
+    policy = policy or model_policy(config, node)
+    return scheduler.call(llm_request(node, config, prompt, priority), lambda: call_within_deadline(
+        node, state, config, lambda: call_with_policy(node, policy, build, validate), hedge=hedge,
+    ), timeout=time_left(state))
+
+
+async def ainvoke(
+    node: str,
+    config: RunnableConfig,
+    state: Mapping[str, Any],
+    build: Callable[[str], Awaitable[T]],
+    *,
+    prompt: Union[str, Sequence[BaseMessage]],
+    priority: int = PRIORITY_INTERACTIVE,
+    policy: Optional[ModelPolicy] = None,
+    validate: Optional[Callable[[T], bool]] = None,
+    hedge: bool = True,
+) -> T:
+    """Async version of invoke; ``build`` returns the awaitable to run."""
+    policy = policy or model_policy(config, node)
+    return await scheduler.acall(llm_request(node, config, prompt, priority), lambda: acall_within_deadline(
+        node, state, config, lambda: acall_with_policy(node, policy, build, validate), hedge=hedge,
+    ), timeout=time_left(state))
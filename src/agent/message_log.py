@@ -0,0 +1,196 @@
+"""Message list that indexes itself as messages are appended.
+
+``ExpertCreatorAssistant.messages`` is reduced with :func:`add_messages_indexed`
+instead of ``add_messages``. It merges updates the same way, but keeps the
+channel value as a :class:`MessageLog`, which knows the position of every
+message id, of the human and AI messages, of the last message that made tool
+calls and of the messages in the chat view sent to field-help generations,
+and their total size for instrumentation.
+Appending new messages only indexes the new ones, so nodes look up what they
+need without walking the whole history every turn, and the reducer no longer
+re-indexes every id on every write like ``add_messages`` does: successive logs
+share one append-only index and only see its entries below their own length.
+Each write still copies the list of message references, a C-level copy, since
+the value has to stay a plain list (checkpoints, ``Send`` payloads and the API
+server serialize it) and the values already streamed to callers must not change.
+
+Checkpointers store the log as a plain list; the first write of a run
+indexes it again, once.
+"""
+
+from __future__ import annotations
+
+import bisect
+import threading
+import uuid
+from typing import Any, Iterable, Mapping, Optional, Sequence, cast
+
+from langchain_core.messages import (
+    AIMessage,
+    BaseMessage,
+    HumanMessage,
+    RemoveMessage,
+    SystemMessage,
+    ToolCall,
+    convert_to_messages,
+    message_chunk_to_message,
+)
+from langgraph.graph.message import Messages, add_messages
+
+
+def message_size(message: BaseMessage) -> int:
+    """Approximate size of a message in characters: its content and tool call arguments."""
+    return len(str(message.content)) + sum(len(str(call.get("args"))) for call in getattr(message, "tool_calls", ()))
+
+
+def in_chat_view(message: BaseMessage) -> bool:
+    """Tell whether a message belongs to the chat history shown to field-help generations."""
+    return (
+        isinstance(message, SystemMessage | HumanMessage | AIMessage)
+        and not message.additional_kwargs.get('tool_calls')
+    )
+
+
+class _Index:
+    """Indexes of an append-only run of messages, shared by the logs that extend it.
+
+    A log only sees the entries below its own length, so appending to the
+    longest log extends the index in place and earlier logs are unaffected.
+    """
+
+    __slots__ = ("positions", "human", "ai", "chat", "tool_calls", "sizes", "length", "lock")
+
+    def __init__(self) -> None:
+        # position of every message id
+        self.positions: dict[str, int] = {}
+        # positions of the human, AI, chat view and tool-calling messages, ascending
+        self.human: list[int] = []
+        self.ai: list[int] = []
+        self.chat: list[int] = []
+        self.tool_calls: list[int] = []
+        # running sum of message_size, one entry per message
+        self.sizes: list[int] = []
+        self.length = 0
+        self.lock = threading.Lock()
+
+    def append(self, messages: Iterable[BaseMessage]) -> None:
+        """Index ``messages`` as the next entries."""
+        for message in messages:
+            index = self.length
+            if message.id is not None:
+                self.positions[message.id] = index
+            self.sizes.append((self.sizes[-1] if self.sizes else 0) + message_size(message))
+            if isinstance(message, HumanMessage):
+                self.human.append(index)
+            elif isinstance(message, AIMessage):
+                self.ai.append(index)
+                if message.tool_calls:
+                    self.tool_calls.append(index)
+            if in_chat_view(message):
+                self.chat.append(index)
+            self.length += 1
+
+
+class MessageLog(list[BaseMessage]):
+    """List of messages with incrementally maintained indexes."""
+
+    __slots__ = ("_index",)
+
+    def __init__(self, messages: Iterable[BaseMessage] = ()) -> None:
+        """Index ``messages`` into a new log."""
+        super().__init__(messages)
+        self._index = _Index()
+        self._index.append(self)
+
+    def __reduce__(self) -> tuple[type[MessageLog], tuple[list[BaseMessage]]]:
+        """Pickle and copy as the plain list; the copy is indexed again."""
+        return MessageLog, (list(self),)
+
+    def extended(self, messages: Sequence[BaseMessage]) -> MessageLog:
+        """Return a new log with ``messages`` appended; only they are indexed.
+
+        The new log shares the index of this one when this is the longest log
+        over it; extending an older log starts a new index.
+        """
+        with self._index.lock:
+            shared = self._index.length == len(self)
+            if shared:
+                self._index.append(messages)
+        if not shared:
+            return MessageLog([*self, *messages])
+        log = MessageLog.__new__(MessageLog)
+        list.__init__(log, self)
+        list.extend(log, messages)
+        log._index = self._index
+        return log
+
+    def _before(self, positions: list[int]) -> int:
+        """Return how many of the ascending ``positions`` fall inside this log."""
+        return bisect.bisect_left(positions, len(self))
+
+    @property
+    def size(self) -> int:
+        """Sum of message_size over the messages."""
+        return self._index.sizes[len(self) - 1] if self else 0
+
+    def position(self, message_id: Optional[str]) -> Optional[int]:
+        """Return the position of the message with ``message_id``, None if absent."""
+        index = self._index.positions.get(message_id) if message_id is not None else None
+        return index if index is not None and index < len(self) else None
+
+    def last_human(self) -> Optional[HumanMessage]:
+        """Return the last human message, None if there is none."""
+        count = self._before(self._index.human)
+        return cast(HumanMessage, self[self._index.human[count - 1]]) if count else None
+
+    def last_ai(self, count: int) -> list[AIMessage]:
+        """Return up to the last ``count`` AI messages, oldest first."""
+        end = self._before(self._index.ai)
+        return [cast(AIMessage, self[index]) for index in self._index.ai[max(end - count, 0):end]] if count > 0 else []
+
+    def last_tool_calls(self) -> list[ToolCall]:
+        """Return the tool calls of the last message that made any."""
+        count = self._before(self._index.tool_calls)
+        return cast(AIMessage, self[self._index.tool_calls[count - 1]]).tool_calls if count else []
+
+    def human_positions(self, start: int) -> list[int]:
+        """Return the positions of the human messages from ``start`` on."""
+        human = self._index.human
+        return human[bisect.bisect_left(human, start):self._before(human)]
+
+    def chat_view(self, start: int) -> list[BaseMessage]:
+        """Return the chat view messages from ``start`` on."""
+        chat = self._index.chat
+        return [self[index] for index in chat[bisect.bisect_left(chat, start):self._before(chat)]]
+
+
+def as_log(messages: Sequence[BaseMessage]) -> MessageLog:
+    """Return ``messages`` as a MessageLog, indexing them if they are a plain list."""
+    return messages if isinstance(messages, MessageLog) else MessageLog(messages)
+
+
+def message_log(state: Mapping[str, Any]) -> MessageLog:
+    """Return the messages of a state as a MessageLog."""
+    return as_log(state["messages"])
+
+
+def add_messages_indexed(left: Any, right: Any) -> MessageLog:
+    """Merge like ``add_messages`` and keep the result indexed.
+
+    Appending messages with new ids, the common case, reuses the indexes of
+    ``left``; removals and replacements by id fall back to ``add_messages``.
+    """
+    log = as_log(left if isinstance(left, list) else [left])
+    if not isinstance(right, list):
+        right = [right]
+    new = [message_chunk_to_message(message) for message in convert_to_messages(right)]
+    for message in new:
+        if message.id is None:
+            message.id = str(uuid.uuid4())
+    if (
+        any(isinstance(message, RemoveMessage) or log.position(message.id) is not None for message in new)
+        or len({message.id for message in new}) != len(new)
+    ):
+        # add_messages returns a list when given lists.
+        return MessageLog(cast(list[BaseMessage], add_messages(cast(Messages, list(log)), cast(Messages, new))))
+    return log.extended(new)
@@ -0,0 +1,217 @@
+"""In-process counters and histograms for the agent's runtime behaviour.
+
+Metrics are pushed to pluggable exporters: anything with an
+``export(snapshot)`` method. ``METRICS_EXPORTER`` picks one at import time,
+either ``log`` or the ``module:attribute`` path of an exporter factory, and
+``METRICS_EXPORT_INTERVAL`` how often, in seconds, ``export_if_due`` pushes.
+"""
+
+from __future__ import annotations
+
+import bisect
+import importlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Optional, Protocol, Sequence
+
+logger = logging.getLogger(__name__)
+
+LabelKey = tuple[tuple[str, Any], ...]
+
+# Upper bounds shared by every histogram; they span milliseconds, queue depths and
+# bytes alike, with an implicit overflow bucket above the last one.
+DEFAULT_BUCKETS: tuple[float, ...] = (
+    1, 2, 5, 10, 25, 50, 100, 250, 500, 1_000, 2_500, 5_000, 10_000, 25_000, 50_000, 100_000,
+)
+DEFAULT_EXPORT_INTERVAL = 60.0
+
+
+def _label_key(labels: dict[str, Any]) -> LabelKey:
+    return tuple(sorted(labels.items()))
+
+
+class Histogram:
+    """Bucketed distribution of observed values with count, sum, min and max."""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        """Count values up to each of the sorted upper bounds ``buckets``, and above the last."""
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = float("inf")
+        self.max = float("-inf")
+
+    def observe(self, value: float) -> None:
+        """Add ``value`` to its bucket and to the totals."""
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """Estimate the ``q`` quantile as the upper bound of the bucket holding it."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(self.buckets[index], self.max) if index < len(self.buckets) else self.max
+        return self.max
+
+    def as_dict(self) -> dict[str, Any]:
+        """Return the totals, the p50/p95/p99 estimates and the bucket counts."""
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "min": self.min if self.count else 0.0,
+            "max": self.max if self.count else 0.0,
+            "p50": self.quantile(0.50),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "buckets": {
+                **{str(bound): count for bound, count in zip(self.buckets, self.counts)},
+                "+Inf": self.counts[-1],
+            },
+        }
+
+
+class MetricsExporter(Protocol):
+    """Destination for metric snapshots, e.g. a log, a file or a metrics backend."""
+
+    def export(self, snapshot: dict[str, Any]) -> None:
+        """Send ``snapshot``, as returned by ``Metrics.snapshot``."""
+        ...
+
+
+class LoggingExporter:
+    """Write each snapshot as one JSON log line."""
+
+    def __init__(self, logger_name: str = "agent.metrics.export", level: int = logging.INFO) -> None:
+        """Log to ``logger_name`` at ``level``."""
+        self.logger = logging.getLogger(logger_name)
+        self.level = level
+
+    def export(self, snapshot: dict[str, Any]) -> None:
+        """Log ``snapshot`` as sorted JSON if the level is enabled."""
+        if self.logger.isEnabledFor(self.level):
+            self.logger.log(self.level, "%s", json.dumps(snapshot, sort_keys=True, default=str))
+
+
+class Metrics:
+    """Thread-safe registry of named counters and histograms with optional labels."""
+
+    def __init__(self, *, export_interval: float = DEFAULT_EXPORT_INTERVAL) -> None:
+        """Export at most every ``export_interval`` seconds from ``export_if_due``."""
+        self.export_interval = export_interval
+        self._lock = threading.Lock()
+        self._counters: dict[tuple[str, LabelKey], float] = {}
+        self._histograms: dict[tuple[str, LabelKey], Histogram] = {}
+        self._exporters: list[MetricsExporter] = []
+        self._last_export = time.monotonic()
+
+    def increment(self, name: str, value: float = 1, **labels: Any) -> None:
+        """Add ``value`` to the counter ``name`` for the given labels."""
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def counter(self, name: str, **labels: Any) -> float:
+        """Return the current value of a counter, 0 if it was never incremented."""
+        with self._lock:
+            return self._counters.get((name, _label_key(labels)), 0)
+
+    def observe(self, name: str, value: float, **labels: Any) -> None:
+        """Record ``value`` in the histogram ``name`` for the given labels."""
+        key = (name, _label_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def histogram(self, name: str, **labels: Any) -> Optional[dict[str, Any]]:
+        """Return a histogram as a dict, None if nothing was observed."""
+        with self._lock:
+            histogram = self._histograms.get((name, _label_key(labels)))
+            return histogram.as_dict() if histogram is not None else None
+
+    def quantile(self, name: str, q: float, *, min_count: int = 1, **labels: Any) -> Optional[float]:
+        """Estimate the ``q`` quantile of a histogram, None with fewer than ``min_count`` observations."""
+        with self._lock:
+            histogram = self._histograms.get((name, _label_key(labels)))
+            if histogram is None or histogram.count < min_count:
+                return None
+            return histogram.quantile(q)
+
+    def snapshot(self) -> dict[str, dict[str, list[dict[str, Any]]]]:
+        """Return every metric as ``{"counters": {name: [...]}, "histograms": {name: [...]}}``.
+
+        Counter entries are ``{"labels": ..., "value": ...}``; histogram entries
+        carry the labels next to the fields of ``Histogram.as_dict``.
+        """
+        with self._lock:
+            counters = [(key, {"value": value}) for key, value in self._counters.items()]
+            histograms = [(key, histogram.as_dict()) for key, histogram in self._histograms.items()]
+        snapshot: dict[str, dict[str, list[dict[str, Any]]]] = {"counters": {}, "histograms": {}}
+        for kind, items in (("counters", counters), ("histograms", histograms)):
+            for (name, labels), fields in sorted(items, key=lambda item: (item[0][0], str(item[0][1]))):
+                snapshot[kind].setdefault(name, []).append({"labels": dict(labels), **fields})
+        return snapshot
+
+    def add_exporter(self, exporter: MetricsExporter) -> None:
+        """Push future snapshots to ``exporter`` as well."""
+        with self._lock:
+            self._exporters.append(exporter)
+
+    def remove_exporter(self, exporter: MetricsExporter) -> None:
+        """Stop pushing snapshots to ``exporter``."""
+        with self._lock:
+            self._exporters.remove(exporter)
+
+    def export(self) -> None:
+        """Push a snapshot to every exporter; a failing exporter does not stop the others."""
+        with self._lock:
+            exporters = list(self._exporters)
+            self._last_export = time.monotonic()
+        if not exporters:
+            return
+        snapshot = self.snapshot()
+        for exporter in exporters:
+            try:
+                exporter.export(snapshot)
+            except Exception:
+                logger.exception("Metrics exporter %r failed", exporter)
+
+    def export_if_due(self) -> None:
+        """Export when ``export_interval`` seconds have passed since the last export."""
+        if self._exporters and time.monotonic() - self._last_export >= self.export_interval:
+            self.export()
+
+    def reset(self) -> None:
+        """Drop every counter and histogram."""
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+
+def create_exporter(spec: str) -> MetricsExporter:
+    """Build the exporter named by ``spec``: ``log`` or a ``module:factory`` path."""
+    if spec == "log":
+        return LoggingExporter()
+    module_name, _, attribute = spec.partition(":")
+    if not attribute:
+        raise ValueError(f"Unknown metrics exporter: {spec}")
+    factory: Callable[[], MetricsExporter] = getattr(importlib.import_module(module_name), attribute)
+    return factory()
+
+
+metrics = Metrics(export_interval=float(os.getenv("METRICS_EXPORT_INTERVAL", DEFAULT_EXPORT_INTERVAL)))
+if os.getenv("METRICS_EXPORTER"):
+    metrics.add_exporter(create_exporter(os.environ["METRICS_EXPORTER"]))
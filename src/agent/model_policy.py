@@ -0,0 +1,180 @@
+"""Per-node and per-field choice of chat model, with fallbacks and escalation.
+
+``Configuration.model_policy`` maps each call site to the models it uses. Call
+sites are the nodes that call a model (``message_manager``,
+``compact_history``, ``update_expert`` and ``expert_field_assistant``) and, for
+field help, the node and the field (``expert_field_assistant.name``), which
+wins over the node. An entry is a model name, a list of model names or a dict:
+
+    {"models": ["gpt-4o-mini", "gpt-4o"], "escalate_to": "gpt-4o"}
+
+The first model answers and the others are tried in order when a call fails.
+When an answer fails validation, e.g. profile fields that are not a valid
+``Expert``, it is asked again once on ``escalate_to``. Call sites without an
+entry use ``Configuration.default_model``.
+
+Every answer records the model and tier that produced it (``primary``,
+``fallback`` or ``escalation``) in ``llm.tier_calls``, ``llm.tier_duration_ms``
+and ``llm.tier_tokens``, labelled by node, model and tier, so the latency and
+token spend of each tier can be compared per deployment. ``llm.fallbacks``
+and ``llm.escalations`` count how often the first choice was not enough.
+"""
+
+from __future__ import annotations
+
+import logging
+import time
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Iterator,
+    NamedTuple,
+    Optional,
+    TypeVar,
+    cast,
+)
+
+from langchain_core.runnables import RunnableConfig
+from pydantic import ValidationError
+
+from agent.configuration import Configuration
+from agent.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+TIER_PRIMARY = "primary"
+TIER_FALLBACK = "fallback"
+TIER_ESCALATION = "escalation"
+
+T = TypeVar("T")
+
+
+class ModelPolicy(NamedTuple):
+    """Models of one call site, see ``model_policy``."""
+
+    # the first model answers; the rest are tried in order when a call fails
+    models: tuple[str, ...]
+    # model asked again when an answer fails validation, None to keep the answer
+    escalate_to: Optional[str] = None
+
+
+def _parse(site: str, entry: Any) -> ModelPolicy:
+    if isinstance(entry, str):
+        return ModelPolicy((entry,))
+    if isinstance(entry, list | tuple) and entry:
+        return ModelPolicy(tuple(entry))
+    if isinstance(entry, dict) and entry.get("models"):
+        models = entry["models"]
+        return ModelPolicy((models,) if isinstance(models, str) else tuple(models), entry.get("escalate_to"))
+    raise ValueError(f"Invalid model policy for {site!r}: {entry!r}")
+
+
+def model_policy(config: RunnableConfig, node: str, field: Optional[str] = None) -> ModelPolicy:
+    """Return the models a node uses, for one profile field when ``field`` is given."""
+    configuration = Configuration.from_runnable_config(config)
+    policies = configuration.model_policy or {}
+    for site in ((f"{node}.{field}",) if field else ()) + (node,):
+        if site in policies:
+            return _parse(site, policies[site])
+    return ModelPolicy((configuration.default_model,))
+
+
+def _chain(policy: ModelPolicy) -> Iterator[tuple[str, str, bool]]:
+    """Yield every model of the chain with its tier and whether it is the last one."""
+    for index, model in enumerate(policy.models):
+        yield model, TIER_PRIMARY if index == 0 else TIER_FALLBACK, index == len(policy.models) - 1
+
+
+def _escalates(policy: ModelPolicy, model: str) -> bool:
+    return policy.escalate_to is not None and policy.escalate_to != model
+
+
+def _valid(validate: Optional[Callable[[Any], bool]], result: Any) -> bool:
+    if validate is None:
+        return True
+    try:
+        return validate(result)
+    except ValidationError:
+        return False
+
+
+def _fell_back(node: str, model: str, error: Exception) -> None:
+    logger.warning("%s call on %s failed (%s), falling back to the next model", node, model, error)
+    metrics.increment("llm.fallbacks", node=node, model=model)
+
+
+def _record(node: str, model: str, tier: str, started: float, result: Any) -> None:
+    labels = {"node": node, "model": model, "tier": tier}
+    metrics.increment("llm.tier_calls", 1, **labels)
+    metrics.observe("llm.tier_duration_ms", (time.perf_counter() - started) * 1000, **labels)
+    usage = getattr(result, "usage_metadata", None)
+    if usage:
+        metrics.increment("llm.tier_tokens", usage.get("total_tokens", 0), **labels)
+
+
+def call_with_policy(
+    node: str, policy: ModelPolicy, func: Callable[[str], T], validate: Optional[Callable[[T], bool]] = None
+) -> T:
+    """Call ``func`` with the models of ``policy`` until one answers, escalating invalid answers.
+
+    ``validate`` tells whether an answer is acceptable; raising a pydantic
+    ``ValidationError``, there or in ``func``, also counts as invalid. Without
+    ``escalate_to`` an invalid answer is returned, and the error re-raised, as is.
+    """
+    for model, tier, last in _chain(policy):
+        started = time.perf_counter()
+        try:
+            result = func(model)
+        except ValidationError:
+            if not _escalates(policy, model):
+                raise
+            break
+        except Exception as error:
+            if last:
+                raise
+            _fell_back(node, model, error)
+            continue
+        _record(node, model, tier, started, result)
+        if _valid(validate, result) or not _escalates(policy, model):
+            return result
+        break
+    # Only calls that escalate get here, so escalate_to is set.
+    escalate_to = cast(str, policy.escalate_to)
+    metrics.increment("llm.escalations", node=node, model=escalate_to)
+    started = time.perf_counter()
+    result = func(escalate_to)
+    _record(node, escalate_to, TIER_ESCALATION, started, result)
+    return result
+
+
+async def acall_with_policy(
+    node: str,
+    policy: ModelPolicy,
+    func: Callable[[str], Awaitable[T]],
+    validate: Optional[Callable[[T], bool]] = None,
+) -> T:
+    """Async version of call_with_policy; ``func`` returns the awaitable to run."""
+    for model, tier, last in _chain(policy):
+        started = time.perf_counter()
+        try:
+            result = await func(model)
+        except ValidationError:
+            if not _escalates(policy, model):
+                raise
+            break
+        except Exception as error:
+            if last:
+                raise
+            _fell_back(node, model, error)
+            continue
+        _record(node, model, tier, started, result)
+        if _valid(validate, result) or not _escalates(policy, model):
+            return result
+        break
+    escalate_to = cast(str, policy.escalate_to)
+    metrics.increment("llm.escalations", node=node, model=escalate_to)
+    started = time.perf_counter()
+    result = await func(escalate_to)
+    _record(node, escalate_to, TIER_ESCALATION, started, result)
+    return result
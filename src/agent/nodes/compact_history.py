@@ -0,0 +1,94 @@
+"""Fold old exchanges into a rolling summary so the prompt stays within the history budget."""
+
+from typing import Any, Optional
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import get_buffer_string
+from langchain_core.runnables import RunnableConfig
+
+from agent.configuration import Configuration
+from agent.deadline import DeadlineExceeded, degraded
+from agent.history import count_tokens, exchange_starts, unsummarized_start
+from agent.llm import ainvoke, invoke, record_token_usage, registry
+from agent.message_log import message_log
+from agent.scheduler import PRIORITY_BACKGROUND
+from agent.state import ExpertCreatorAssistant
+
+_SUMMARY_PROMPT = """You maintain a running summary of a conversation in which a user is defining a custom "Expert" profile with an assistant.
+
+Current summary:
+{summary}
+
+Extend the current summary with the new messages below. Keep what the user asked for, decided and rejected, and drop small talk. Do not restate profile field values, they are tracked separately. Respond with the updated summary only.
+
+New messages:
+{messages}
+"""
+
+
+def _summary_prompt(state: ExpertCreatorAssistant, config: RunnableConfig) -> Optional[tuple[str, Optional[str]]]:
+    """Return the summarization prompt and the id of the last folded message.
+
+    Returns None while the unsummarized history fits in the token budget.
+    """
+    configuration = Configuration.from_runnable_config(config)
+    messages = message_log(state)
+    start = unsummarized_start(messages, state.get("summarized_until"))
+
+    keep_exchanges = max(1, configuration.history_keep_exchanges)
+    starts = exchange_starts(messages, start)
+    if len(starts) <= keep_exchanges:
+        return None
+
+    total = sum(count_tokens(msg) for msg in messages[start:])
+    if total <= configuration.history_token_budget:
+        return None
+
+    folded = messages[start:starts[-keep_exchanges]]
+    prompt = _SUMMARY_PROMPT.format(
+        summary=state.get("summary") or "(empty)",
+        messages=get_buffer_string(folded),
+    )
+    return prompt, folded[-1].id
+
+
+def _model(model: str) -> BaseChatModel:
+    return registry.get_chat_model(model, temperature=0)
+
+
+def compact_history(state: ExpertCreatorAssistant, config: RunnableConfig) -> dict[str, Any]:
+    """Fold exchanges older than the verbatim window into the rolling summary.
+
+    Nothing happens while the unsummarized history fits in the token budget.
+    """
+    request = _summary_prompt(state, config)
+    if request is None:
+        return {}
+
+    prompt, summarized_until = request
+    try:
+        response = invoke("compact_history", config, state, lambda model: _model(model).invoke(prompt),
+                          prompt=prompt, priority=PRIORITY_BACKGROUND)
+    except DeadlineExceeded:
+        # The history is folded on a later turn instead.
+        degraded("compact_history")
+        return {}
+    record_token_usage("compact_history", response)
+    return {"summary": response.content, "summarized_until": summarized_until}
+
+
+async def acompact_history(state: ExpertCreatorAssistant, config: RunnableConfig) -> dict[str, Any]:
+    """Async version of compact_history."""
+    request = _summary_prompt(state, config)
+    if request is None:
+        return {}
+
+    prompt, summarized_until = request
+    try:
+        response = await ainvoke("compact_history", config, state, lambda model: _model(model).ainvoke(prompt),
+                                 prompt=prompt, priority=PRIORITY_BACKGROUND)
+    except DeadlineExceeded:
+        degraded("compact_history")
+        return {}
+    record_token_usage("compact_history", response)
+    return {"summary": response.content, "summarized_until": summarized_until}
@@ -1,86 +1,333 @@
-from langchain_core.messages import SystemMessage, HumanMessage, ToolMessage
-from langchain_core.output_parsers import StrOutputParser
+import asyncio
+from functools import partial
+from typing import Any, Hashable, NamedTuple, Optional
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import (
+    AIMessageChunk,
+    BaseMessage,
+    BaseMessageChunk,
+    HumanMessage,
+    SystemMessage,
+    ToolMessage,
+)
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain_openai import ChatOpenAI
+from langchain_core.runnables import Runnable, RunnableConfig
+from langchain_core.runnables.config import get_executor_for_config
+
+from agent.cache import field_help_cache, fingerprint
+from agent.configuration import Configuration
+from agent.deadline import DeadlineExceeded, degraded, time_left
+from agent.history import budgeted_chat_view
+from agent.llm import ainvoke, invoke, record_token_usage, registry
+from agent.model_policy import ModelPolicy, model_policy
+from agent.profile import NOT_SET, PROFILE_FIELDS, resolve_profile
+from agent.scheduler import PRIORITY_BACKGROUND, PRIORITY_TOOL
+from agent.speculation import profile_key, speculative_drafts
 from agent.state import ExpertCreatorAssistant
+from agent.tools import pending_tool_calls
+from agent.tools.expert_field_assistant_tool import ExpertFieldAssistantTool
 
-from langchain_core.messages import HumanMessage, AIMessage
+# Specialized system prompt for field assistance. It is identical for every field and
+# every tenant, so together with the history it forms a prefix the provider can cache.
+FIELD_HELP_SYSTEM_PROMPT = """You are an AI subroutine that helps generate and refine the Expert's name, description, and instructions.
 
+You are an expert content assistant for a custom "Expert" profile. The Expert profile consists of the following fields:
 
-def clean_chat_history(messages):
-    return [
-        msg for msg in messages
-        if isinstance(msg, (HumanMessage, AIMessage))
-           and not msg.additional_kwargs.get('tool_calls')
-    ]
+- Name: A simple, clear identifier.
+- Description: A brief summary.
+- Instructions: A system prompt that guides the Expert’s behavior and must follow best practices.
 
+Proposed instructions must adhere to best practices:
+1. Clarity and conciseness.
+2. A structured format with bullet points if needed.
+3. Inclusion of all necessary components to guide the Expert's behavior.
+"""
 
-def expert_field_assistant(state: ExpertCreatorAssistant):
-    messages = state["messages"]
-
-    help_field = ""
-    tool_call_id = None
-    for msg in reversed(messages):
-        if hasattr(msg, 'tool_calls') and msg.tool_calls:
-            help_field = msg.tool_calls[0]["args"]["field"]
-            tool_call_id = msg.tool_calls[0]["id"]
-            break
-
-    # Specialized system prompt for field assistance.
-    FIELD_HELP_PROMPT_TEMPLATE = """
-    You are an expert content assistant for a custom "Expert" profile. The Expert profile consists of the following fields:
-    
-    - Name: A simple, clear identifier.
-    - Description: A brief summary.
-    - Instructions: A system prompt that guides the Expert’s behavior and must follow best practices.
-
-    The user is asking for help with the "{help_field}" field.
-    
-    Your task:
-    - For the "{help_field}" field, provide clear and actionable suggestions to generate or refine its content.
-    {extra_instructions}
-    
-    Respond with a concise suggestion for the "{help_field}" field.
-    """
-
-    extra_instructions = ""
-
-    if help_field == "instructions":
-        extra_instructions = (
-            "Ensure the proposed instructions adhere to best practices:\n"
-            "1. Clarity and conciseness.\n"
-            "2. A structured format with bullet points if needed.\n"
-            "3. Inclusion of all necessary components to guide the Expert's behavior."
-        )
+# Field-specific request, sent after the chat history.
+FIELD_HELP_PROMPT_TEMPLATE = """The user is asking for help with the "{help_field}" field.
+
+Your task:
+- For the "{help_field}" field, provide clear and actionable suggestions to generate or refine its content.
+
+Respond with a concise suggestion for the "{help_field}" field.
+"""
+
+# Sent after the field request when other fields are drafted in the same call.
+DRAFTS_PROMPT = """Drafts proposed for the other fields of this Expert:
+{drafts}
 
-    system_prompt = SystemMessage(
-        "You are an AI subroutine that helps generate and refine the Expert's name, description, and instructions.")
+Keep your suggestion consistent with them."""
 
-    human_prompt = HumanMessage(FIELD_HELP_PROMPT_TEMPLATE.format(
-        help_field=help_field,
-        extra_instructions=extra_instructions
-    ))
+# Fields whose draft is conditioned on the drafts of these other fields when
+# they are requested together; the rest are generated concurrently first.
+DRAFT_DEPENDENCIES = {"instructions": ("name", "description")}
+
+# Suggestion given for a field whose generation did not finish before the deadline of the turn.
+DEGRADED_SUGGESTION = "No suggestion for the {help_field} field could be generated in time."
+
+_LABELS = {"name": "Name", "description": "Description", "instructions": "Instructions"}
+
+
+def _build_chain(help_field: str, llm: BaseChatModel) -> Runnable[dict[str, Any], BaseMessage]:
+    """Build the prompt | model chain for one profile field."""
+    system_prompt = SystemMessage(FIELD_HELP_SYSTEM_PROMPT)
+    human_prompt = HumanMessage(FIELD_HELP_PROMPT_TEMPLATE.format(help_field=help_field))
 
     prompt_template = ChatPromptTemplate.from_messages([
         system_prompt,
         MessagesPlaceholder(variable_name="chat_history"),
         human_prompt,
+        MessagesPlaceholder(variable_name="drafts", optional=True),
     ])
 
-    llm = ChatOpenAI(model="gpt-4o")
+    return prompt_template | llm
+
+
+class _HelpRequest(NamedTuple):
+    # models of the field, see agent.model_policy
+    policy: ModelPolicy
+    chain_input: dict[str, Any]
+    cache_key: Optional[str]
+    # name the call is scheduled and counted under, e.g. speculation.name
+    node: str
+    priority: int
+    prompt: list[BaseMessage]
+    field: str
+    call: "_HelpCall"
+
+
+class _HelpCall(NamedTuple):
+    fields: list[str]
+    tool_call_id: Optional[str]
+    chat_history: list[BaseMessage]
+    profile: dict[str, Any]
+    use_cache: bool
+    config: RunnableConfig
+    # deadline of the turn, see agent.deadline
+    deadline: Optional[float]
+    # thread id and profile key of the speculative drafts to serve, see agent.speculation
+    speculation: Optional[tuple[str, Hashable]] = None
+    # drafted in the background by speculate()
+    speculative: bool = False
+
+
+def field_help_chain(help_field: str, model: str) -> Runnable[dict[str, Any], BaseMessage]:
+    """Return the shared help chain for a field on ``model``, built on first use."""
+    return registry.get_runnable(
+        f"expert_field_assistant.{help_field}", partial(_build_chain, help_field), model
+    )
+
+
+def _help_calls(state: ExpertCreatorAssistant, config: RunnableConfig) -> list[_HelpCall]:
+    """Return the requested fields and tool call id of every help call, with what their generations share."""
+    configuration = Configuration.from_runnable_config(config)
+    chat_history = budgeted_chat_view(state, config)  # Pass the budgeted message history
+    profile = resolve_profile(state) or {}
+    thread_id = (config.get("configurable") or {}).get("thread_id")
+    speculation = (thread_id, profile_key(state)) if configuration.speculative_field_help and thread_id else None
+    return [
+        _HelpCall(
+            ExpertFieldAssistantTool(**tool_call["args"]).requested_fields() or list(PROFILE_FIELDS),
+            tool_call["id"], chat_history, profile, configuration.field_help_cache, config, state.get("deadline"),
+            speculation,
+        )
+        for tool_call in pending_tool_calls(state, "expert_field_assistant")
+    ]
+
+
+def _waves(fields: list[str]) -> list[list[str]]:
+    """Split the fields into groups generated concurrently, dependencies first."""
+    first = [field for field in fields if not set(DRAFT_DEPENDENCIES.get(field, ())) & set(fields)]
+    rest = [field for field in fields if field not in first]
+    return [wave for wave in (first, rest) if wave]
+
+
+def _prepare(call: _HelpCall, help_field: str, drafts: dict[str, str]) -> _HelpRequest:
+    """Return the help chain for one field, its input and its cache key."""
+    related = {field: drafts[field] for field in DRAFT_DEPENDENCIES.get(help_field, ()) if field in drafts}
+    chain_input: dict[str, Any] = {"chat_history": call.chat_history}
+    if related:
+        chain_input["drafts"] = [HumanMessage(DRAFTS_PROMPT.format(
+            drafts="\n".join(f"{_LABELS[field]}: {draft}" for field, draft in related.items())
+        ))]
+    policy = model_policy(call.config, "expert_field_assistant", help_field)
+    cache_key = None
+    if call.use_cache:
+        # The drafts condition the suggestion, so they are part of the key.
+        cache_key = fingerprint(
+            help_field,
+            {**call.profile, **{f"draft_{field}": draft for field, draft in related.items()}},
+            call.chat_history,
+            policy.models[0],
+        )
+    node, priority = ("speculation", PRIORITY_BACKGROUND) if call.speculative else ("expert_field_assistant", PRIORITY_TOOL)
+    prompt = call.chat_history + chain_input.get("drafts", [])
+    return _HelpRequest(policy, chain_input, cache_key, f"{node}.{help_field}", priority, prompt, help_field, call)
+
+
+def _cached(request: _HelpRequest) -> Optional[str]:
+    return None if request.cache_key is None else field_help_cache.get(request.cache_key)
+
+
+def _speculation(request: _HelpRequest) -> Optional[tuple[str, Hashable]]:
+    """Return the thread and profile key of the draft that may answer the request, None if none may."""
+    # Drafts are generated on their own, so they do not fit a request conditioned on other drafts.
+    if request.call.speculative or "drafts" in request.chain_input:
+        return None
+    return request.call.speculation
+
+
+def _finish(request: _HelpRequest, response: BaseMessage) -> str:
+    record_token_usage("speculation" if request.call.speculative else "expert_field_assistant", response)
+    if request.cache_key is not None:
+        field_help_cache.set(request.cache_key, response.text())
+    return response.text()
+
+
+def _degraded(request: _HelpRequest) -> str:
+    degraded("expert_field_assistant")
+    return DEGRADED_SUGGESTION.format(help_field=request.field)
+
+
+def _generate(request: _HelpRequest) -> str:
+    speculation = _speculation(request)
+    if speculation is not None:
+        draft = speculative_drafts.serve(*speculation, request.field, time_left({"deadline": request.call.deadline}))
+        # None when the draft failed or was not ready in time: generate it now.
+        if draft is not None:
+            return draft
+
+    cached = _cached(request)
+    if cached is not None:
+        return cached
+
+    def stream(model: str) -> BaseMessageChunk:
+        # Stream the chain with chat history, so the graph's `messages` stream mode
+        # delivers the suggestion token by token while it is being generated.
+        response: BaseMessageChunk = AIMessageChunk(content="")
+        for chunk in field_help_chain(request.field, model).stream(request.chain_input):
+            response += chunk
+        return response
+
+    try:
+        response = invoke(request.node, request.call.config, {"deadline": request.call.deadline}, stream,
+                          prompt=request.prompt, priority=request.priority, policy=request.policy, hedge=False)
+    except DeadlineExceeded:
+        return _degraded(request)
+    return _finish(request, response)
+
+
+async def _agenerate(request: _HelpRequest) -> str:
+    speculation = _speculation(request)
+    if speculation is not None:
+        draft = await speculative_drafts.aserve(
+            *speculation, request.field, time_left({"deadline": request.call.deadline})
+        )
+        if draft is not None:
+            return draft
+
+    cached = _cached(request)
+    if cached is not None:
+        return cached
+
+    async def astream(model: str) -> BaseMessageChunk:
+        response: BaseMessageChunk = AIMessageChunk(content="")
+        async for chunk in field_help_chain(request.field, model).astream(request.chain_input):
+            response += chunk
+        return response
+
+    try:
+        response = await ainvoke(request.node, request.call.config, {"deadline": request.call.deadline}, astream,
+                                 prompt=request.prompt, priority=request.priority, policy=request.policy, hedge=False)
+    except DeadlineExceeded:
+        return _degraded(request)
+    return _finish(request, response)
+
+
+def _tool_message(call: _HelpCall, drafts: dict[str, str]) -> ToolMessage:
+    if len(call.fields) == 1:
+        content = drafts[call.fields[0]]
+    else:
+        content = "\n\n".join(f"{_LABELS[field]}:\n{drafts[field]}" for field in call.fields)
+    # The tokens were already streamed; the suggestions are committed once as the tool result.
+    return ToolMessage(
+        content=content,
+        tool_call_id=call.tool_call_id
+    )
+
+
+def _draft(call: _HelpCall, config: RunnableConfig) -> ToolMessage:
+    drafts: dict[str, str] = {}
+    for wave in _waves(call.fields):
+        requests = [_prepare(call, field, drafts) for field in wave]
+        if len(requests) == 1:
+            results = [_generate(requests[0])]
+        else:
+            with get_executor_for_config(config) as executor:
+                results = list(executor.map(_generate, requests))
+        drafts.update(zip(wave, results))
+    return _tool_message(call, drafts)
+
+
+async def _adraft(call: _HelpCall) -> ToolMessage:
+    drafts: dict[str, str] = {}
+    for wave in _waves(call.fields):
+        results = await asyncio.gather(*(_agenerate(_prepare(call, field, drafts)) for field in wave))
+        drafts.update(zip(wave, results))
+    return _tool_message(call, drafts)
+
+
+def expert_field_assistant(state: ExpertCreatorAssistant, config: RunnableConfig) -> dict[str, Any]:
+    """Draft every requested field, the fields of a wave concurrently, and answer each call with one tool result."""
+    return {"messages": [_draft(call, config) for call in _help_calls(state, config)]}
+
+
+async def aexpert_field_assistant(state: ExpertCreatorAssistant, config: RunnableConfig) -> dict[str, Any]:
+    """Async version of expert_field_assistant."""
+    return {"messages": list(await asyncio.gather(*(_adraft(call) for call in _help_calls(state, config))))}
+
+
+def _speculative_call(
+    state: ExpertCreatorAssistant, config: RunnableConfig, key: Hashable, profile: dict[str, Any]
+) -> Optional[tuple[str, _HelpCall]]:
+    """Return the thread id and the call drafting the unset fields, None if nothing is drafted."""
+    configuration = Configuration.from_runnable_config(config)
+    thread_id = (config.get("configurable") or {}).get("thread_id")
+    unset = [field for field in PROFILE_FIELDS if profile.get(field) in (None, NOT_SET)]
+    # Nothing is known about the Expert until a field is set.
+    if not configuration.speculative_field_help or thread_id is None or len(unset) in (0, len(PROFILE_FIELDS)):
+        return None
+    # Fields already drafted for this profile, served or not, are not drafted again.
+    unset = speculative_drafts.missing(thread_id, key, unset)
+    if not unset:
+        return None
+    # Only the settings travel to the background: none of the run's callbacks or internals.
+    background: RunnableConfig = {"configurable": {
+        name: value for name, value in (config.get("configurable") or {}).items() if not name.startswith("__")
+    }}
+    call = _HelpCall(
+        unset, None, budgeted_chat_view(state, config), profile, configuration.field_help_cache, background, None,
+        (thread_id, key), True,
+    )
+    return thread_id, call
+
 
-    chain = (prompt_template | llm | StrOutputParser())
+def speculate(state: ExpertCreatorAssistant, config: RunnableConfig, key: Hashable, profile: dict[str, Any]) -> None:
+    """Start background drafts of the unset fields of ``profile``, whose key is ``key``; see agent.speculation."""
+    speculative = _speculative_call(state, config, key, profile)
+    if speculative is None:
+        return
+    thread_id, call = speculative
+    for field in call.fields:
+        speculative_drafts.submit(thread_id, key, field, partial(_generate, _prepare(call, field, {})))
 
-    # Invoke the chain with chat history
-    response = chain.invoke({
-        "chat_history": clean_chat_history(messages) # Pass the entire message history
-    })
 
-    return {
-        "messages": [
-            ToolMessage(
-                content=response,
-                tool_call_id=tool_call_id
-            )
-        ]
-    }
+def aspeculate(state: ExpertCreatorAssistant, config: RunnableConfig, key: Hashable, profile: dict[str, Any]) -> None:
+    """Version of speculate that drafts as tasks on the running event loop."""
+    speculative = _speculative_call(state, config, key, profile)
+    if speculative is None:
+        return
+    thread_id, call = speculative
+    for field in call.fields:
+        speculative_drafts.asubmit(thread_id, key, field, partial(_agenerate, _prepare(call, field, {})))
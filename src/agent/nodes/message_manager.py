@@ -1,36 +1,31 @@
 import logging
-from langchain_core.messages import SystemMessage
-from langchain_core.runnables import RunnableConfig
-from langchain_openai import ChatOpenAI
-
-from agent.state import ExpertCreatorAssistant, Expert
+from typing import Any
+
+from langchain_core.language_models import BaseChatModel, LanguageModelInput
+from langchain_core.messages import AIMessage, BaseMessage, SystemMessage
+from langchain_core.runnables import Runnable, RunnableConfig
+from pydantic import BaseModel
+
+from agent.deadline import DeadlineExceeded, degraded
+from agent.history import budgeted_history
+from agent.instrumentation import sampled_debug
+from agent.llm import ainvoke, invoke, record_token_usage, registry
+from agent.profile import resolve_profile
+from agent.state import Expert, ExpertCreatorAssistant
 from agent.tools.expert_field_assistant_tool import ExpertFieldAssistantTool
-from src.agent.tools.update_memory import UpdateMemory
+from agent.tools.update_memory import UpdateMemory
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 
-def message_manager(state: ExpertCreatorAssistant, config: RunnableConfig):
-    """
-    Process the user's message using the synchronized expert profile stored in state.
-    It uses the profile as provided by sync_profile, which guarantees that missing fields
-    are set to "NOT SET". The system prompt then instructs the LLM to use ONLY those values.
-    """
-    model = ChatOpenAI(model="gpt-4o", temperature=0)
-
-    SYSTEM_PROMPT = """You are a helpful chatbot.
+SYSTEM_PROMPT = """You are a helpful chatbot.
 
 You are designed to assist the user in creating and updating a custom Expert profile.
 
 ⚠️ CRITICAL SOURCE OF TRUTH ⚠️
-Current Expert Profile:
-Name: {name}
-Description: {description}
-Instructions: {instructions}
+The current values of the Expert Profile are given in the "Current Expert Profile" message at the end of the conversation.
 
-⚠️ IMPORTANT RULE: The above values are the ONLY accurate and current values for the Expert Profile.
+⚠️ IMPORTANT RULE: Those values are the ONLY accurate and current values for the Expert Profile.
 COMPLETELY IGNORE any references to profile values in previous conversation history.
 If any field in the Current Expert Profile is "NOT SET", consider that field as unset and NEVER fill it in using historical data.
 
@@ -44,34 +39,102 @@ DO NOT reference any old values mentioned in previous messages.
 Instructions for processing user messages:
 
 1. Evaluate the user's input to determine if new or updated information is provided regarding the Expert profile.
-2. If updates are provided, update the corresponding field(s) by calling the UpdateMemory tool with type `expert`.
+2. If updates are provided, update the corresponding field(s) by calling the UpdateMemory tool with type `expert`, passing the complete new value of every changed field.
 3. Respond naturally to the user's message, addressing only one field at a time.
-4. When referring to the Expert profile, ONLY use the values provided in the "Current Expert Profile" section above.
-5. If the user asks for help generating the content for any of the Expert's attributes (name, description, or instructions), call the **ExpertFieldAssistant** tool with type `help`.
+4. When referring to the Expert profile, ONLY use the values provided in the "Current Expert Profile" message.
+5. If the user asks for help generating the content for any of the Expert's attributes (name, description, or instructions), call the **ExpertFieldAssistant** tool with type `help`. When they want help with several fields or the whole Expert, request all of them in one call with `fields`.
+6. When a message needs several tool calls (e.g. an update and a request for help), make all of them in the same response; they run together.
+"""
+
+# Answer given when the turn runs out of time before the model answers.
+DEGRADED_RESPONSE = "Sorry, this is taking longer than expected. Please send your message again."
+
+# Per-session part of the prompt. It goes after the history so that the static
+# system prompt, the tool schemas and the history form a prefix that the
+# provider can cache across tenants and turns.
+PROFILE_PROMPT = """⚠️ Current Expert Profile:
+Name: {name}
+Description: {description}
+Instructions: {instructions}
 """
 
+
+def _bind_tools(llm: BaseChatModel) -> Runnable[LanguageModelInput, BaseMessage]:
+    return llm.bind_tools([UpdateMemory, ExpertFieldAssistantTool], parallel_tool_calls=True)
+
+
+def _model(model: str) -> Runnable[LanguageModelInput, BaseMessage]:
+    return registry.get_runnable("message_manager", _bind_tools, model, temperature=0)
+
+
+def _valid_tool_calls(response: BaseMessage) -> bool:
+    """Tell whether every tool call of the response parses against its schema."""
+    if getattr(response, "invalid_tool_calls", None):
+        return False
+    schemas: dict[str, type[BaseModel]] = {"UpdateMemory": UpdateMemory, "ExpertFieldAssistantTool": ExpertFieldAssistantTool}
+    for tool_call in getattr(response, "tool_calls", ()):
+        if tool_call["name"] not in schemas:
+            return False
+        # The fields of UpdateMemory are those of Expert; a ValidationError escalates.
+        schemas[tool_call["name"]].model_validate(tool_call["args"])
+    return True
+
+
+def _prepare_messages(state: ExpertCreatorAssistant, config: RunnableConfig) -> list[BaseMessage]:
+    """Build the model input: static system prompt, budgeted history, then the current profile."""
     # Get the expert profile from state (already synchronized by sync_profile)
-    expert_data = state.get("expert_profile", {})
+    expert_data = resolve_profile(state) or {}
     expert_profile = Expert(**expert_data)
 
-    system_msg = SYSTEM_PROMPT.format(
+    profile_msg = PROFILE_PROMPT.format(
         name=expert_profile.name,
         description=expert_profile.description,
         instructions=expert_profile.instructions
     )
 
-    logger.info(
-        f"Current Expert Profile - Name: {expert_profile.name}, Description: {expert_profile.description}, Instructions: {expert_profile.instructions}")
-    logger.info(f"Processing user message: {state['messages'][-1].content if state['messages'] else 'No messages'}")
+    sampled_debug(logger, "Processing message %r with profile %s",
+                  state["messages"][-1].content if state["messages"] else None, expert_data)
 
-    # Invoke the model with the system prompt as the sole source of truth plus conversation history.
-    response = model.bind_tools([UpdateMemory, ExpertFieldAssistantTool], parallel_tool_calls=False).invoke(
-        [SystemMessage(content=system_msg)] + state["messages"]
+    # The profile message is the sole source of truth; it closes the prompt to keep the prefix cacheable.
+    return (
+        [SystemMessage(content=SYSTEM_PROMPT)]
+        + budgeted_history(state, config)
+        + [SystemMessage(content=profile_msg)]
     )
 
-    logger.info(f"Model response: {response.content}")
 
-    return {
-        "messages": [response],
-        "expert_profile": state["expert_profile"]
-    }
+def _finish(state: ExpertCreatorAssistant, response: BaseMessage) -> dict[str, Any]:
+    sampled_debug(logger, "Model response: %r", response.content)
+    record_token_usage("message_manager", response)
+
+    return {"messages": [response]}
+
+
+def _degraded() -> dict[str, Any]:
+    degraded("message_manager")
+    return {"messages": [AIMessage(content=DEGRADED_RESPONSE)]}
+
+
+def message_manager(state: ExpertCreatorAssistant, config: RunnableConfig) -> dict[str, Any]:
+    """Process the user's message using the synchronized expert profile stored in state.
+    It uses the profile as provided by sync_profile, which guarantees that missing fields
+    are set to "NOT SET". The system prompt then instructs the LLM to use ONLY those values.
+    """
+    messages = _prepare_messages(state, config)
+    try:
+        response = invoke("message_manager", config, state, lambda model: _model(model).invoke(messages),
+                          prompt=messages, validate=_valid_tool_calls)
+    except DeadlineExceeded:
+        return _degraded()
+    return _finish(state, response)
+
+
+async def amessage_manager(state: ExpertCreatorAssistant, config: RunnableConfig) -> dict[str, Any]:
+    """Async version of message_manager."""
+    messages = _prepare_messages(state, config)
+    try:
+        response = await ainvoke("message_manager", config, state, lambda model: _model(model).ainvoke(messages),
+                                 prompt=messages, validate=_valid_tool_calls)
+    except DeadlineExceeded:
+        return _degraded()
+    return _finish(state, response)
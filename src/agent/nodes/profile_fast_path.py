@@ -0,0 +1,105 @@
+"""Answer questions that only read the Expert profile without calling the model."""
+
+import logging
+import re
+from typing import Any, Optional
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.runnables import RunnableConfig
+from langgraph.constants import END
+from langgraph.types import Command
+
+from agent.configuration import Configuration
+from agent.instrumentation import sampled_debug
+from agent.message_log import message_log
+from agent.metrics import metrics
+from agent.profile import NOT_SET, PROFILE_FIELDS, resolve_profile
+from agent.state import ExpertCreatorAssistant
+
+logger = logging.getLogger(__name__)
+
+_FIELD_WORDS = {
+    "name": "name",
+    "description": "description",
+    "instructions": "instructions",
+    "instruction": "instructions",
+    "prompt": "instructions",
+    "system prompt": "instructions",
+}
+
+# Only whole messages that do nothing but ask to read the profile match, so a
+# question followed by a change request ("what's the name? make it shorter")
+# still goes to the model. A bare field ("the instructions.") is usually the
+# answer to "which field do you want help with?", so it needs a question or verb.
+_POLITE = r"(?:please\s+|can you\s+|could you\s+)?"
+_OWNER = r"(?:my|the|our)\s+(?:current\s+)?(?:expert(?:'s)?\s+)?"
+_FIELD = r"(?P<field>" + "|".join(sorted(map(re.escape, _FIELD_WORDS), key=len, reverse=True)) + r")"
+_END = r"\s*(?:please\s*)?[?.!]*\s*"
+
+_FIELD_PATTERNS = [
+    re.compile(rf"{_POLITE}(?:what(?:'s| is| are)|tell me|show(?: me)?|remind me(?: of)?)\s+{_OWNER}{_FIELD}{_END}"),
+    re.compile(rf"(?:does|do)\s+(?:my|the)\s+expert\s+have\s+(?:a\s+|an\s+|any\s+)?{_FIELD}(?:\s+yet)?{_END}"),
+]
+_PROFILE_PATTERNS = [
+    re.compile(rf"{_POLITE}(?:what(?:'s| is)|show(?: me)?|tell me|display)\s+{_OWNER}(?:expert\s+)?profile{_END}"),
+    re.compile(rf"{_POLITE}(?:what does|how does)\s+my\s+expert\s+look(?:\s+like)?(?: now| so far)?{_END}"),
+]
+
+_LABELS = {"name": "Name", "description": "Description", "instructions": "Instructions"}
+_ARTICLES = {"name": "a name", "description": "a description", "instructions": "instructions"}
+
+
+def match_intent(text: str) -> Optional[str]:
+    """Return the profile field a message asks to read, ``"profile"`` for all of them, or None."""
+    text = " ".join(text.lower().split()).replace("’", "'")
+    for pattern in _PROFILE_PATTERNS:
+        if pattern.fullmatch(text):
+            return "profile"
+    for pattern in _FIELD_PATTERNS:
+        found = pattern.fullmatch(text)
+        if found:
+            return _FIELD_WORDS[found.group("field")]
+    return None
+
+
+def answer(intent: str, profile: dict[str, Any]) -> str:
+    """Answer a read intent from the synced profile, following the message_manager rules."""
+
+    def describe(field: str) -> str:
+        value: Optional[str] = profile.get(field)
+        if value is None or value == NOT_SET:
+            return f"The Expert does not have {_ARTICLES[field]} yet."
+        if "\n" in value:
+            return f"{_LABELS[field]}:\n{value}"
+        return f"{_LABELS[field]}: {value}"
+
+    if intent == "profile":
+        return "Here is the current Expert profile:\n\n" + "\n".join(describe(field) for field in PROFILE_FIELDS)
+    return describe(intent)
+
+
+def profile_fast_path(state: ExpertCreatorAssistant, config: RunnableConfig) -> Command[str]:
+    """Answer pure profile-read questions locally and send every other turn to the model."""
+    configuration = Configuration.from_runnable_config(config)
+    if not configuration.profile_fast_path:
+        return Command(goto="compact_history")
+
+    # Only the message of this turn, which is the last one before the model answers.
+    messages = message_log(state)
+    human = messages[-1] if messages and isinstance(messages[-1], HumanMessage) else None
+    intent = match_intent(str(human.content)) if human is not None else None
+    if intent is None:
+        metrics.increment("profile_fast_path.misses")
+        return Command(goto="compact_history")
+
+    metrics.increment("profile_fast_path.hits", intent=intent)
+    sampled_debug(logger, "Answering %s read locally", intent)
+    return Command(
+        goto=END,
+        update={"messages": [AIMessage(content=answer(intent, resolve_profile(state) or {}))]},
+    )
+
+
+async def aprofile_fast_path(state: ExpertCreatorAssistant, config: RunnableConfig) -> Command[str]:
+    """Async version of profile_fast_path; the profile is already in the blob cache after sync_profile."""
+    return profile_fast_path(state, config)
@@ -1,72 +1,181 @@
+import logging
+from typing import Any, Hashable, Optional
+
 from langchain_core.messages import AIMessage
 from langchain_core.runnables import RunnableConfig
-import logging
 
 from agent.configuration import Configuration
-from agent.state import ExpertCreatorAssistant, Expert
+from agent.deadline import turn_deadline
+from agent.instrumentation import sampled_debug
+from agent.nodes.expert_field_assistant import aspeculate, speculate
+from agent.profile import (
+    NOT_SET,
+    aresolve_profile,
+    changed_fields,
+    describe_change,
+    emit_profile_patch,
+    field_hashes,
+    profile_update,
+    resolve_profile,
+)
+from agent.profile_store import StoredProfile, profile_store, store_key
+from agent.speculation import profile_key
+from agent.state import Expert, ExpertCreatorAssistant
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
 
 
-def sync_profile(state: ExpertCreatorAssistant, config: RunnableConfig):
+def _client_profile(configuration: Configuration) -> Optional[dict[str, Any]]:
+    """Return the profile the client sent, None when it relies on the store.
+
+    A profile with every field empty is still the client's: a new expert.
     """
-    Comprehensively synchronize the expert profile from the configuration.
+    return None if configuration.expert_profile is None else dict(configuration.expert_profile)
+
+
+def _stored(config: RunnableConfig, configuration: Configuration) -> Optional[StoredProfile]:
+    key = store_key(config)
+    if key is None:
+        return None
+    try:
+        return profile_store.get(*key, configuration.profile_version)
+    except LookupError:
+        # The in-memory blob backend evicted the values; the thread keeps its own copy.
+        logger.warning("Stored profile %s/%s is not readable", *key)
+        return None
+
+
+async def _astored(config: RunnableConfig, configuration: Configuration) -> Optional[StoredProfile]:
+    key = store_key(config)
+    if key is None:
+        return None
+    try:
+        return await profile_store.aget(*key, configuration.profile_version)
+    except LookupError:
+        logger.warning("Stored profile %s/%s is not readable", *key)
+        return None
+
+
+def _from_store(current_profile: Optional[dict[str, Any]], stored: Optional[StoredProfile]) -> tuple[dict[str, Any], Optional[int]]:
+    if stored is None:
+        # Nothing stored yet: keep what the thread already has.
+        return current_profile or {}, None
+    return stored.profile, stored.version
+
+
+def _synced(config_profile: dict[str, Any]) -> dict[str, Any]:
+    # Ensure missing fields are explicitly set to "NOT SET"
+    synced_profile = {
+        "name": config_profile.get("name") or NOT_SET,
+        "description": config_profile.get("description") or NOT_SET,
+        "instructions": config_profile.get("instructions") or NOT_SET
+    }
+    return Expert(**synced_profile).model_dump()
+
+
+def _deadline_update(state: ExpertCreatorAssistant, config: RunnableConfig) -> dict[str, Any]:
+    # The turn starts here, so its time budget does too.
+    deadline = turn_deadline(config)
+    return {} if deadline is None and state.get("deadline") is None else {"deadline": deadline}
+
+
+def _profile_key(state: ExpertCreatorAssistant, update: dict[str, Any]) -> Hashable:
+    """Return the key of the profile once ``update`` is applied, see agent.speculation."""
+    return profile_key({
+        "profile_hashes": update.get("profile_hashes", state.get("profile_hashes")),
+        "profile_version": update.get("profile_version", state.get("profile_version")),
+    })
+
+
+def _sync(
+    state: ExpertCreatorAssistant,
+    config: RunnableConfig,
+    current_profile: Optional[dict[str, Any]],
+    synced_profile: dict[str, Any],
+    version: Optional[int],
+) -> dict[str, Any]:
+    """Comprehensively synchronize the expert profile from the configuration.
 
     This node ensures that the graph's state is aligned with the latest
     configuration, which could have been updated by the front-end.
     Any missing field is set to "NOT SET".
+
+    Changes are detected by comparing per-field content hashes. A compact
+    description of the changed fields is added to the conversation only when
+    something changed; the full profile already travels in the system prompt.
+    The state keeps the profile together with the hashes of its fields.
+    Clients streaming ``custom`` events get the changed fields as a profile patch.
     """
-    # Extract configuration
-    configuration = Configuration.from_runnable_config(config)
-    config_profile = configuration.expert_profile
+    synced_hashes = field_hashes(synced_profile)
+    version_update = {} if version is None or version == state.get("profile_version") else {"profile_version": version}
+    current_version = state.get("profile_version") if version is None else version
 
-    # Ensure missing fields are explicitly set to "NOT SET"
-    synced_profile = {
-        "name": config_profile.get("name") or "NOT SET",
-        "description": config_profile.get("description") or "NOT SET",
-        "instructions": config_profile.get("instructions") or "NOT SET"
-    }
-    synced_profile = Expert(**synced_profile).model_dump()
-
-    # Get the current state's expert profile (if exists)
-    current_profile = state.get('expert_profile', Expert().model_dump())
-    logging.info(f"Current profile: {current_profile}")
-
-    # Track changes between the current profile and the new synced profile
-    changes = []
-    if current_profile.get("name") != synced_profile.get("name"):
-        changes.append(
-            f"Expert's name changed from '{current_profile.get('name', 'NOT SET')}' to '{synced_profile.get('name', 'NOT SET')}'"
-        )
-    if current_profile.get("description") != synced_profile.get("description"):
-        changes.append(
-            f"Expert's description updated from '{current_profile.get('description', 'NOT SET')}' to '{synced_profile.get('description', 'NOT SET')}'"
-        )
-    if current_profile.get("instructions") != synced_profile.get("instructions"):
-        changes.append("Expert's instructions have been modified")
-
-    # Construct a string representing the current state of the expert
-    current_state = (
-        f"Name: {synced_profile.get('name', 'NOT SET')}\n"
-        f"Description: {synced_profile.get('description', 'NOT SET')}\n"
-        f"Instructions: {synced_profile.get('instructions', 'NOT SET')}"
-    )
+    if current_profile is None:
+        # First run on this thread: there is nothing to report a change against.
+        emit_profile_patch(config, synced_profile, current_version, full=True)
+        return {**profile_update(synced_profile), **version_update}
 
-    # Prepare sync message including changes and current expert state
-    if changes:
-        sync_message = AIMessage(
-            content="Profile synchronization detected:\n" +
-                    "\n".join(f"• {change}" for change in changes) +
-                    "\n\nCurrent Expert State:\n" + current_state
-        )
-    else:
-        sync_message = AIMessage(
-            content="Profile synchronized. No changes detected.\n\nCurrent Expert State:\n" + current_state
-        )
+    current_hashes = state.get("profile_hashes") or field_hashes(current_profile)
+    changes = changed_fields(current_hashes, synced_hashes)
+    sampled_debug(logger, "Profile fields changed by the configuration: %s", changes)
+
+    if changes or version_update:
+        emit_profile_patch(config, {field: synced_profile.get(field) for field in changes}, current_version)
+    if not changes:
+        # Threads checkpointed without hashes or without values get them written once.
+        if state.get("expert_profile") is not None and "profile_hashes" in state:
+            return version_update
+        return {**profile_update(synced_profile), **version_update}
+
+    sync_message = AIMessage(
+        content="Profile synchronization detected:\n" +
+                "\n".join(
+                    f"• {describe_change(field, current_profile.get(field), synced_profile.get(field))}"
+                    for field in changes
+                )
+    )
 
     # Return the synchronized profile and a sync message
     return {
-        "expert_profile": synced_profile,
+        **profile_update(synced_profile),
+        **version_update,
         "messages": [sync_message]
     }
+
+
+def sync_profile(state: ExpertCreatorAssistant, config: RunnableConfig) -> dict[str, Any]:
+    """Synchronize the expert profile from the configuration or the profile store.
+
+    Clients either send the whole profile in ``expert_profile`` or only the
+    ``profile_version`` they last saw, in which case the profile of
+    (tenant_id, expert_id), or of the thread, is loaded from the store.
+    """
+    configuration = Configuration.from_runnable_config(config)
+    deadline = _deadline_update(state, config)
+    current_profile = resolve_profile(state)
+    client_profile = _client_profile(configuration)
+    if client_profile is not None:
+        config_profile, version = client_profile, None
+    else:
+        config_profile, version = _from_store(current_profile, _stored(config, configuration))
+    synced_profile = _synced(config_profile)
+    update = _sync(state, config, current_profile, synced_profile, version)
+    # Help with the fields still unset is likely to be asked for next.
+    speculate(state, config, _profile_key(state, update), synced_profile)
+    return {**update, **deadline}
+
+
+async def async_profile(state: ExpertCreatorAssistant, config: RunnableConfig) -> dict[str, Any]:
+    """Async version of sync_profile; store reads leave the event loop only on cache misses."""
+    configuration = Configuration.from_runnable_config(config)
+    deadline = _deadline_update(state, config)
+    current_profile = await aresolve_profile(state)
+    client_profile = _client_profile(configuration)
+    if client_profile is not None:
+        config_profile, version = client_profile, None
+    else:
+        config_profile, version = _from_store(current_profile, await _astored(config, configuration))
+    synced_profile = _synced(config_profile)
+    update = _sync(state, config, current_profile, synced_profile, version)
+    aspeculate(state, config, _profile_key(state, update), synced_profile)
+    return {**update, **deadline}
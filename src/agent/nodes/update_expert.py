@@ -1,15 +1,36 @@
 import logging
+from typing import Any, Optional, cast
 
-from langmem import create_memory_manager
-
+from langchain_core.messages import BaseMessage, ToolMessage
+from langchain_core.runnables import RunnableConfig
 from langgraph.types import Command
-from langchain_core.messages import ToolMessage, HumanMessage, AIMessage
+from pydantic import ValidationError
 
-from agent.state import ExpertCreatorAssistant, Expert
+from agent.configuration import Configuration
+from agent.deadline import DeadlineExceeded, degraded
+from agent.instrumentation import sampled_debug
+from agent.llm import ainvoke, invoke, registry
+from agent.message_log import message_log
+from agent.profile import (
+    NOT_SET,
+    PROFILE_FIELDS,
+    emit_profile_patch,
+    profile_update,
+    resolve_profile,
+)
+from agent.profile_store import StoredProfile, VersionConflict, profile_store, store_key
+from agent.scheduler import PRIORITY_TOOL
+from agent.state import Expert, ExpertCreatorAssistant
+from agent.tools import pending_tool_calls
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Attempts at writing a profile update that keeps losing the version race.
+MAX_SAVE_ATTEMPTS = 3
+
+# Result of an update whose merge did not finish before the deadline of the turn.
+SKIPPED_UPDATE = "expert not updated: the change could not be merged in time, ask the user to repeat it"
+
 
 # Updated instructions with placeholders for recent messages and the current expert profile from state.
 _CUSTOM_EXPERT_INSTRUCTIONS = """You are a memory manager that focuses on capturing details about a custom "Expert" the user is defining.
@@ -29,33 +50,47 @@ Steps:
 """
 
 
-def update_expert(state: ExpertCreatorAssistant):
+def apply_profile_patch(current_expert_profile: dict[str, Any], tool_args: dict[str, Any]) -> Optional[dict[str, Any]]:
+    """Apply the field values carried by an UpdateMemory call to the current profile.
 
-    # Get the current expert profile from state (synchronized earlier via sync_profile).
-    current_expert_profile = state.get("expert_profile", {})
+    Returns the updated profile, or None when the call does not carry a usable
+    patch (no field values, a merge was requested, or the result is not a valid
+    Expert) and the memory manager has to resolve the update instead.
+    """
+    if tool_args.get("needs_merge"):
+        return None
+
+    patch = {
+        field: tool_args[field]
+        for field in Expert.model_fields
+        if tool_args.get(field)
+    }
+    if not patch:
+        return None
+
+    try:
+        return Expert.model_validate({**current_expert_profile, **patch}).model_dump()
+    except ValidationError:
+        logger.warning("Invalid profile patch for fields %s, falling back to memory manager", list(patch))
+        return None
 
-    # Find the last HumanMessage, last AIMessage, and last ToolMessage in the conversation.
-    last_human_message = None
-    last_ai_messages = []
 
-    for msg in reversed(state["messages"]):
-        if not last_human_message and isinstance(msg, HumanMessage):
-            last_human_message = msg
-        if isinstance(msg, AIMessage):
-            if len(last_ai_messages) < 3:
-                last_ai_messages.append(msg)
-        if last_human_message and len(last_ai_messages) == 3:
-            break
+def _memory_manager_request(state: ExpertCreatorAssistant) -> tuple[str, dict[str, list[BaseMessage]]]:
+    """Build the memory manager instructions and input from the recent messages."""
+    # Get the current expert profile from state (synchronized earlier via sync_profile).
+    current_expert_profile = resolve_profile(state) or {}
 
-    # Reverse the AI messages so they appear in chronological order.
-    last_ai_messages = list(reversed(last_ai_messages))
+    # Find the last HumanMessage and the last three AIMessages, in chronological order.
+    messages = message_log(state)
+    last_human_message = messages.last_human()
+    last_ai_messages = messages.last_ai(3)
 
     # Combine the contents of the three messages (if they exist) into a single string.
     recent_messages_parts = []
     if last_human_message:
-        recent_messages_parts.append("Human: " + last_human_message.content)
+        recent_messages_parts.append("Human: " + last_human_message.text())
     for ai_msg in last_ai_messages:
-        recent_messages_parts.append("AI: " + ai_msg.content)
+        recent_messages_parts.append("AI: " + ai_msg.text())
 
     recent_messages_str = "\n\n".join(recent_messages_parts)
 
@@ -68,49 +103,199 @@ def update_expert(state: ExpertCreatorAssistant):
         current_expert_profile=current_expert_profile_str
     )
 
-    # Create a memory manager with the optimized instructions.
-    manager = create_memory_manager(
-        "gpt-4o",
-        instructions=optimized_instructions,
-        schemas=[Expert],
-    )
-
     # Prepare input: use the last HumanMessage and the last two AIMessage objects (if available).
-    input_messages = []
+    input_messages: list[BaseMessage] = []
     if last_human_message is not None:
         input_messages.append(last_human_message)
     input_messages.extend(last_ai_messages)
-    logger.info(f"Input messages: {input_messages}")
+    sampled_debug(logger, "Memory manager input messages: %s", input_messages)
 
     input_data = {
         "messages": input_messages,
     }
+    return optimized_instructions, input_data
+
+
+def _memory_manager(model: str, instructions: str) -> Any:
+    # Create a memory manager with the optimized instructions on top of the shared client.
+    return registry.create_memory_manager(
+        model,
+        instructions=instructions,
+        schemas=[Expert],
+    )
+
+
+def _extracted_expert(profile_expert: list[Any]) -> bool:
+    """Tell whether the memory manager extracted an Expert; anything else escalates."""
+    return bool(profile_expert) and isinstance(profile_expert[0][1], Expert)
 
-    # Invoke the memory manager.
-    profile_expert = manager.invoke(input_data)
 
+def _extract_profile(profile_expert: list[Any]) -> dict[str, Any]:
     if profile_expert and len(profile_expert) > 0:
-        updated_expert = profile_expert[0][1]  # Extract the Expert instance.
-        expert_profile_value = updated_expert.dict()  # Convert to dict.
-    else:
-        expert_profile_value = Expert()
-
-    # Retrieve tool call metadata from the most recent message that has tool_calls.
-    tool_call_id = None
-    for msg in reversed(state["messages"]):
-        if hasattr(msg, "tool_calls") and msg.tool_calls:
-            tool_call_id = msg.tool_calls[0]["id"]
-            break
+        updated_expert = cast(Expert, profile_expert[0][1])  # Extract the Expert instance.
+        return updated_expert.model_dump()  # Convert to dict.
+    return Expert().model_dump()  # type: ignore[call-arg]
+
+
+def merge_with_memory_manager(state: ExpertCreatorAssistant, config: RunnableConfig) -> dict[str, Any]:
+    """Resolve the profile update with a langmem memory manager over the recent messages."""
+    instructions, input_data = _memory_manager_request(state)
+    # Invoke the memory manager.
+    return _extract_profile(invoke(
+        "update_expert", config, state, lambda model: _memory_manager(model, instructions).invoke(input_data),
+        prompt=input_data["messages"], priority=PRIORITY_TOOL, validate=_extracted_expert,
+    ))
+
+
+async def amerge_with_memory_manager(state: ExpertCreatorAssistant, config: RunnableConfig) -> dict[str, Any]:
+    """Async version of merge_with_memory_manager."""
+    instructions, input_data = _memory_manager_request(state)
+    return _extract_profile(await ainvoke(
+        "update_expert", config, state, lambda model: _memory_manager(model, instructions).ainvoke(input_data),
+        prompt=input_data["messages"], priority=PRIORITY_TOOL, validate=_extracted_expert,
+    ))
+
+
+def _local_update(state: ExpertCreatorAssistant, config: RunnableConfig) -> tuple[Optional[dict[str, Any]], list[str]]:
+    """Return the locally patched profile (None if a merge is needed) and the tool call ids.
+
+    The patches of every UpdateMemory call in the response are applied in the
+    order the model made them, so a field set twice keeps the last value.
+    """
+    configuration = Configuration.from_runnable_config(config)
+
+    tool_calls = pending_tool_calls(state, "update_expert")
+    tool_call_ids = [cast(str, tool_call["id"]) for tool_call in tool_calls]
+    if not configuration.local_profile_updates:
+        return None, tool_call_ids
+
+    expert_profile_value: Optional[dict[str, Any]] = resolve_profile(state) or {}
+    for tool_call in tool_calls:
+        expert_profile_value = apply_profile_patch(expert_profile_value or {}, tool_call.get("args", {}))
+        if expert_profile_value is None:
+            # The memory manager resolves all of them from the recent messages.
+            return None, tool_call_ids
+    return expert_profile_value, tool_call_ids
 
+
+def _changes(state: ExpertCreatorAssistant, expert_profile_value: dict[str, Any]) -> dict[str, Any]:
+    current = resolve_profile(state) or {}
+    return {field: expert_profile_value.get(field) for field in PROFILE_FIELDS
+            if expert_profile_value.get(field) != current.get(field)}
+
+
+def _rebase(latest: Optional[StoredProfile], changes: dict[str, Any]) -> tuple[dict[str, Any], int]:
+    """Re-apply the fields this update changed on top of the latest stored profile."""
+    if latest is None:
+        return changes, 0
+    return {**latest.profile, **changes}, latest.version
+
+
+def save_profile(
+    state: ExpertCreatorAssistant, config: RunnableConfig, expert_profile_value: dict[str, Any]
+) -> tuple[dict[str, Any], Optional[int]]:
+    """Write the updated profile to the profile store with optimistic concurrency.
+
+    When another worker updated the profile since this thread read it, the
+    fields changed by this update are re-applied on top of the latest version
+    and the write is retried. Returns the profile as stored and its version.
+    Nothing is written when the client owns the profile and sends it whole, or
+    when the run has no key to store it under.
+    """
+    key = _save_key(config)
+    if key is None:
+        return expert_profile_value, state.get("profile_version")
+    changes = _changes(state, expert_profile_value)
+    # A thread that never saw a stored version rebases onto whatever is there.
+    expected = state.get("profile_version") or 0
+    for _ in range(MAX_SAVE_ATTEMPTS - 1):
+        try:
+            return expert_profile_value, profile_store.put(*key, expert_profile_value, expected).version
+        except VersionConflict:
+            expert_profile_value, expected = _rebase(profile_store.get(*key), changes)
+    return expert_profile_value, profile_store.put(*key, expert_profile_value, expected).version
+
+
+async def asave_profile(
+    state: ExpertCreatorAssistant, config: RunnableConfig, expert_profile_value: dict[str, Any]
+) -> tuple[dict[str, Any], Optional[int]]:
+    """Async version of save_profile."""
+    key = _save_key(config)
+    if key is None:
+        return expert_profile_value, state.get("profile_version")
+    changes = _changes(state, expert_profile_value)
+    expected = state.get("profile_version") or 0
+    for _ in range(MAX_SAVE_ATTEMPTS - 1):
+        try:
+            return expert_profile_value, (await profile_store.aput(*key, expert_profile_value, expected)).version
+        except VersionConflict:
+            expert_profile_value, expected = _rebase(await profile_store.aget(*key), changes)
+    return expert_profile_value, (await profile_store.aput(*key, expert_profile_value, expected)).version
+
+
+def _save_key(config: RunnableConfig) -> Optional[tuple[str, str]]:
+    if Configuration.from_runnable_config(config).expert_profile is not None:
+        return None
+    return store_key(config)
+
+
+def _finish(expert_profile_value: dict[str, Any], version: Optional[int], tool_call_ids: list[str]) -> Command[Any]:
     # Return a Command object that updates the state.
     return Command(
         update={
-            "expert_profile": expert_profile_value,
+            # Unset fields use the same placeholder as sync_profile, so the next
+            # turn does not see them as changed.
+            **profile_update({field: expert_profile_value.get(field) or NOT_SET for field in PROFILE_FIELDS}),
+            "profile_version": version,
+            # Every call is answered, so the model sees a result for each tool_call_id.
             "messages": [
                 ToolMessage(
                     content="updated expert",
                     tool_call_id=tool_call_id
                 )
+                for tool_call_id in tool_call_ids
             ]
         }
     )
+
+
+def _skipped(tool_call_ids: list[str]) -> Command[Any]:
+    # The profile is left as it was; the model can ask the user to repeat the change.
+    degraded("update_expert")
+    return Command(
+        update={
+            "messages": [
+                ToolMessage(
+                    content=SKIPPED_UPDATE,
+                    tool_call_id=tool_call_id
+                )
+                for tool_call_id in tool_call_ids
+            ]
+        }
+    )
+
+
+def update_expert(state: ExpertCreatorAssistant, config: RunnableConfig) -> Command[Any]:
+    """Apply the UpdateMemory calls of the last message to the profile and save it."""
+    expert_profile_value, tool_call_ids = _local_update(state, config)
+    if expert_profile_value is None:
+        try:
+            expert_profile_value = merge_with_memory_manager(state, config)
+        except DeadlineExceeded:
+            return _skipped(tool_call_ids)
+    expert_profile_value, version = save_profile(state, config, expert_profile_value)
+    emit_profile_patch(config, _changes(state, expert_profile_value), version)
+    return _finish(expert_profile_value, version, tool_call_ids)
+
+
+async def aupdate_expert(state: ExpertCreatorAssistant, config: RunnableConfig) -> Command[Any]:
+    """Async version of update_expert."""
+    expert_profile_value, tool_call_ids = _local_update(state, config)
+    if expert_profile_value is None:
+        try:
+            expert_profile_value = await amerge_with_memory_manager(state, config)
+        except DeadlineExceeded:
+            return _skipped(tool_call_ids)
+    expert_profile_value, version = await asave_profile(state, config, expert_profile_value)
+    emit_profile_patch(config, _changes(state, expert_profile_value), version)
+    return _finish(expert_profile_value, version, tool_call_ids)
@@ -0,0 +1,151 @@
+"""Helpers to fingerprint, store and diff Expert profiles.
+
+Graph state keeps the field values together with their per-field hashes,
+so a checkpoint restores the profile with whatever blob store the process
+has. Profile store versions only hold the hashes; their values live once in
+the content-addressed blob store.
+
+Nodes that change the profile send a :class:`ProfilePatchEvent` to the
+graph's ``custom`` stream with only the changed fields and the new version,
+so clients keep their copy of the profile current without fetching the
+thread state or streaming ``values``.
+"""
+
+from __future__ import annotations
+
+import difflib
+from typing import Any, Final, Literal, Mapping, Optional
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.constants import CONF, CONFIG_KEY_STREAM_WRITER
+from typing_extensions import TypedDict
+
+from agent.blobs import blob_hash, blob_store
+
+NOT_SET = "NOT SET"
+PROFILE_FIELDS = ("name", "description", "instructions")
+
+# Upper bound on the number of diff lines reported for a long field.
+MAX_DIFF_LINES = 12
+
+PROFILE_PATCH_EVENT: Final = "profile_patch"
+
+
+class ProfilePatchEvent(TypedDict):
+    """Custom stream event carrying the fields a turn changed."""
+
+    type: Literal["profile_patch"]
+    # new value of every changed field, None for a field that is not set
+    patch: dict[str, Optional[str]]
+    # version of the profile in the profile store, None if it is not stored
+    version: Optional[int]
+    # the patch holds every field and replaces the client's copy
+    full: bool
+
+
+def hash_value(value: Optional[str]) -> str:
+    """Return the content hash of a single profile field value."""
+    return blob_hash(value or "")
+
+
+def field_hashes(profile: dict[str, Any]) -> dict[str, str]:
+    """Return the content hash of every profile field."""
+    return {field: hash_value(profile.get(field)) for field in PROFILE_FIELDS}
+
+
+def changed_fields(old_hashes: dict[str, str], new_hashes: dict[str, str]) -> list[str]:
+    """Return the fields whose content hash differs, in profile field order."""
+    return [field for field in PROFILE_FIELDS if old_hashes.get(field) != new_hashes.get(field)]
+
+
+def store_profile(profile: dict[str, Any]) -> dict[str, str]:
+    """Store the field values in the blob store and return their hashes."""
+    blob_store.put_many(profile.get(field) or "" for field in PROFILE_FIELDS)
+    return field_hashes(profile)
+
+
+async def astore_profile(profile: dict[str, Any]) -> dict[str, str]:
+    """Async version of store_profile."""
+    await blob_store.aput_many(profile.get(field) or "" for field in PROFILE_FIELDS)
+    return field_hashes(profile)
+
+
+def _from_blobs(hashes: Mapping[str, str], values: dict[str, str]) -> Optional[dict[str, Any]]:
+    if any(hashes.get(field) not in values for field in PROFILE_FIELDS):
+        return None
+    return {field: values[hashes[field]] or None for field in PROFILE_FIELDS}
+
+
+def load_profile(hashes: Mapping[str, str]) -> Optional[dict[str, Any]]:
+    """Return the profile with the given field hashes, None if a value is not stored."""
+    return _from_blobs(hashes, blob_store.get_many(hashes[field] for field in PROFILE_FIELDS if field in hashes))
+
+
+async def aload_profile(hashes: Mapping[str, str]) -> Optional[dict[str, Any]]:
+    """Async version of load_profile."""
+    return _from_blobs(hashes, await blob_store.aget_many(hashes[field] for field in PROFILE_FIELDS if field in hashes))
+
+
+def profile_update(profile: dict[str, Any]) -> dict[str, Any]:
+    """Return the state update setting the thread's profile to ``profile``."""
+    return {"expert_profile": dict(profile), "profile_hashes": field_hashes(profile)}
+
+
+def resolve_profile(state: Mapping[str, Any]) -> Optional[dict[str, Any]]:
+    """Return the thread's current profile, None before the first sync.
+
+    Checkpoints that only kept ``profile_hashes`` are read back from the blob
+    store; the next sync writes their values into the state again.
+    """
+    profile = state.get("expert_profile")
+    hashes = state.get("profile_hashes")
+    if profile is None and hashes:
+        return load_profile(hashes)
+    return profile
+
+
+async def aresolve_profile(state: Mapping[str, Any]) -> Optional[dict[str, Any]]:
+    """Async version of resolve_profile."""
+    profile = state.get("expert_profile")
+    hashes = state.get("profile_hashes")
+    if profile is None and hashes:
+        return await aload_profile(hashes)
+    return profile
+
+
+def stored_profile(profile: dict[str, Any]) -> dict[str, Any]:
+    """Return the profile fields with ``NOT_SET`` placeholders replaced by None."""
+    return {field: None if profile.get(field) in (None, NOT_SET) else profile.get(field) for field in PROFILE_FIELDS}
+
+
+def describe_change(field: str, old: Optional[str], new: Optional[str]) -> str:
+    """Describe the change of one field compactly, as a diff for multi-line values."""
+    old = old or NOT_SET
+    new = new or NOT_SET
+    if "\n" not in old and "\n" not in new and len(old) + len(new) <= 200:
+        return f"Expert's {field} changed from '{old}' to '{new}'"
+
+    diff = [
+        line for line in difflib.unified_diff(old.splitlines(), new.splitlines(), lineterm="", n=0)
+        if not line.startswith(("---", "+++", "@@"))
+    ]
+    if len(diff) > MAX_DIFF_LINES:
+        omitted = len(diff) - MAX_DIFF_LINES
+        diff = diff[:MAX_DIFF_LINES] + [f"... ({omitted} more changed lines)"]
+    return f"Expert's {field} changed:\n" + "\n".join(diff)
+
+
+def emit_profile_patch(
+    config: RunnableConfig, patch: Mapping[str, Optional[str]], version: Optional[int], *, full: bool = False
+) -> None:
+    """Send the changed profile fields to the ``custom`` stream of the run, if it has one."""
+    writer = (config.get(CONF) or {}).get(CONFIG_KEY_STREAM_WRITER)
+    if writer is None:
+        return
+    event: ProfilePatchEvent = {
+        "type": PROFILE_PATCH_EVENT,
+        "patch": {field: None if value in (None, NOT_SET) else value for field, value in patch.items()},
+        "version": version,
+        "full": full,
+    }
+    writer(event)
@@ -0,0 +1,409 @@
+"""Versioned, server-side store of Expert profiles keyed by tenant and expert.
+
+The store is the source of truth for a profile: clients send the
+``profile_version`` they last saw instead of the whole profile, and
+``sync_profile`` loads the profile from here, usually straight from the
+in-process cache. Writes use optimistic concurrency: ``put`` only succeeds
+when the caller saw the latest version, so workers sharing a backend never
+overwrite each other's updates silently.
+
+Every version is kept as the hashes of its field values, which live once in
+the content-addressed blob store, so the history can be listed, diffed and
+rolled back cheaply. A run without an ``expert_id`` keeps its profile under
+its thread id, so threads never share a profile by accident.
+
+``PROFILE_STORE`` selects the backend: ``memory`` (default, per process),
+``sqlite`` (a database file, ``PROFILE_STORE_URI``) or ``mongo`` (shared,
+``PROFILE_STORE_URI`` or ``MONGODB_URI``). The blob store uses the same one.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Callable, NamedTuple, Optional, Protocol, TypeVar
+
+from agent.blobs import DEFAULT_SQLITE_PATH
+from agent.configuration import Configuration
+from agent.metrics import metrics
+from agent.profile import (
+    PROFILE_FIELDS,
+    aload_profile,
+    astore_profile,
+    describe_change,
+    load_profile,
+    store_profile,
+    stored_profile,
+)
+
+if TYPE_CHECKING:
+    from langchain_core.runnables import RunnableConfig
+    from pymongo.collection import Collection
+
+DEFAULT_CACHE_SIZE = 4096
+
+T = TypeVar("T")
+
+
+class VersionConflict(Exception):
+    """Raised when a profile changed since the version the writer read."""
+
+    def __init__(self, tenant_id: str, expert_id: str, expected: int, current: int) -> None:
+        """Report that the profile is at ``current`` while the writer read ``expected``."""
+        super().__init__(
+            f"Profile {tenant_id}/{expert_id} is at version {current}, expected {expected}"
+        )
+        self.expected = expected
+        self.current = current
+
+
+class StoredProfile(NamedTuple):
+    """A profile with the version it was stored as."""
+
+    profile: dict[str, Any]
+    version: int
+
+
+class ProfileVersion(NamedTuple):
+    """One entry of a profile's version log."""
+
+    version: int
+    # content hash of every field value in the blob store
+    refs: dict[str, str]
+    created_at: float
+
+
+class ProfileBackend(Protocol):
+    """Append-only log of the versions of every profile.
+
+    Version 0 means the profile was never written; ``append`` with
+    ``expected_version=0`` creates it. ``blocking`` tells whether calls do
+    I/O and must leave the event loop.
+    """
+
+    blocking: bool
+
+    def latest(self, tenant_id: str, expert_id: str) -> Optional[ProfileVersion]:
+        """Return the newest version of the profile, None if it was never written."""
+        ...
+
+    def version(self, tenant_id: str, expert_id: str, version: int) -> Optional[ProfileVersion]:
+        """Return the given version of the profile, None if there is no such version."""
+        ...
+
+    def history(self, tenant_id: str, expert_id: str) -> list[ProfileVersion]:
+        """Return every version of the profile, oldest first."""
+        ...
+
+    def append(self, tenant_id: str, expert_id: str, refs: dict[str, str], expected_version: int) -> ProfileVersion:
+        """Write version ``expected_version + 1``; raise VersionConflict if the profile is at another version."""
+        ...
+
+
+class InMemoryProfileBackend:
+    """Per-process profile versions, for development and single-worker deployments."""
+
+    blocking = False
+
+    def __init__(self) -> None:
+        """Start with no profiles."""
+        self._lock = threading.Lock()
+        self._versions: dict[tuple[str, str], list[ProfileVersion]] = {}
+
+    def latest(self, tenant_id: str, expert_id: str) -> Optional[ProfileVersion]:
+        """Return the last version of the profile's list."""
+        versions = self._versions.get((tenant_id, expert_id))
+        return versions[-1] if versions else None
+
+    def version(self, tenant_id: str, expert_id: str, version: int) -> Optional[ProfileVersion]:
+        """Return the version at its position in the profile's list."""
+        versions = self._versions.get((tenant_id, expert_id), [])
+        return versions[version - 1] if 0 < version <= len(versions) else None
+
+    def history(self, tenant_id: str, expert_id: str) -> list[ProfileVersion]:
+        """Return a copy of the profile's list of versions."""
+        return list(self._versions.get((tenant_id, expert_id), []))
+
+    def append(self, tenant_id: str, expert_id: str, refs: dict[str, str], expected_version: int) -> ProfileVersion:
+        """Append the next version under the lock, which makes the version check atomic."""
+        with self._lock:
+            versions = self._versions.setdefault((tenant_id, expert_id), [])
+            if len(versions) != expected_version:
+                raise VersionConflict(tenant_id, expert_id, expected_version, len(versions))
+            record = ProfileVersion(expected_version + 1, dict(refs), time.time())
+            versions.append(record)
+            return record
+
+
+class SqliteProfileBackend:
+    """Profile versions in a SQLite database file, one row per version.
+
+    The primary key on (tenant_id, expert_id, version) is the optimistic
+    lock, like the unique index of the Mongo backend.
+    """
+
+    blocking = True
+
+    def __init__(self, path: str = DEFAULT_SQLITE_PATH) -> None:
+        """Open the database at ``path``, creating the versions table if needed."""
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS profile_versions (tenant_id TEXT NOT NULL, expert_id TEXT NOT NULL, "
+                "version INTEGER NOT NULL, refs TEXT NOT NULL, created_at REAL NOT NULL, "
+                "PRIMARY KEY (tenant_id, expert_id, version))"
+            )
+
+    @staticmethod
+    def _record(row: Optional[tuple[int, str, float]]) -> Optional[ProfileVersion]:
+        return ProfileVersion(row[0], json.loads(row[1]), row[2]) if row else None
+
+    def _query(self, where: str, args: tuple[Any, ...]) -> list[tuple[int, str, float]]:
+        with self._lock:
+            return self._conn.execute(
+                f"SELECT version, refs, created_at FROM profile_versions WHERE {where}", args
+            ).fetchall()
+
+    def latest(self, tenant_id: str, expert_id: str) -> Optional[ProfileVersion]:
+        """Return the row with the highest version of the profile."""
+        rows = self._query("tenant_id = ? AND expert_id = ? ORDER BY version DESC LIMIT 1", (tenant_id, expert_id))
+        return self._record(rows[0] if rows else None)
+
+    def version(self, tenant_id: str, expert_id: str, version: int) -> Optional[ProfileVersion]:
+        """Return the row of the given version."""
+        rows = self._query("tenant_id = ? AND expert_id = ? AND version = ?", (tenant_id, expert_id, version))
+        return self._record(rows[0] if rows else None)
+
+    def history(self, tenant_id: str, expert_id: str) -> list[ProfileVersion]:
+        """Return the rows of the profile ordered by version."""
+        rows = self._query("tenant_id = ? AND expert_id = ? ORDER BY version", (tenant_id, expert_id))
+        return [ProfileVersion(row[0], json.loads(row[1]), row[2]) for row in rows]
+
+    def append(self, tenant_id: str, expert_id: str, refs: dict[str, str], expected_version: int) -> ProfileVersion:
+        """Insert the next version; the primary key rejects a concurrent insert of the same one."""
+        latest = self.latest(tenant_id, expert_id)
+        current = latest.version if latest else 0
+        if current != expected_version:
+            raise VersionConflict(tenant_id, expert_id, expected_version, current)
+        record = ProfileVersion(expected_version + 1, dict(refs), time.time())
+        try:
+            with self._lock, self._conn:
+                self._conn.execute(
+                    "INSERT INTO profile_versions (tenant_id, expert_id, version, refs, created_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (tenant_id, expert_id, record.version, json.dumps(record.refs), record.created_at),
+                )
+        except sqlite3.IntegrityError:
+            raise VersionConflict(tenant_id, expert_id, expected_version, expected_version + 1) from None
+        return record
+
+
+class MongoProfileBackend:
+    """Profile versions shared by every worker, one document per version.
+
+    The unique index on (tenant_id, expert_id, version) is the optimistic
+    lock: of two writers that read the same version, only one can insert
+    the next.
+    """
+
+    blocking = True
+
+    def __init__(self, uri: str, *, db_name: str = "agent_profiles", collection_name: str = "profile_versions") -> None:
+        """Connect to ``collection_name`` of ``db_name`` at ``uri`` and ensure its unique index."""
+        from pymongo import ASCENDING, DESCENDING, MongoClient
+
+        self.collection: Collection[dict[str, Any]] = MongoClient(uri)[db_name][collection_name]
+        self.collection.create_index(
+            [("tenant_id", ASCENDING), ("expert_id", ASCENDING), ("version", DESCENDING)], unique=True
+        )
+
+    @staticmethod
+    def _record(doc: dict[str, Any]) -> ProfileVersion:
+        return ProfileVersion(doc["version"], doc["refs"], doc["created_at"])
+
+    def latest(self, tenant_id: str, expert_id: str) -> Optional[ProfileVersion]:
+        """Return the document with the highest version of the profile."""
+        doc = self.collection.find_one({"tenant_id": tenant_id, "expert_id": expert_id}, sort=[("version", -1)])
+        return None if doc is None else self._record(doc)
+
+    def version(self, tenant_id: str, expert_id: str, version: int) -> Optional[ProfileVersion]:
+        """Return the document of the given version."""
+        doc = self.collection.find_one({"tenant_id": tenant_id, "expert_id": expert_id, "version": version})
+        return None if doc is None else self._record(doc)
+
+    def history(self, tenant_id: str, expert_id: str) -> list[ProfileVersion]:
+        """Return the documents of the profile ordered by version."""
+        cursor = self.collection.find({"tenant_id": tenant_id, "expert_id": expert_id}, sort=[("version", 1)])
+        return [self._record(doc) for doc in cursor]
+
+    def append(self, tenant_id: str, expert_id: str, refs: dict[str, str], expected_version: int) -> ProfileVersion:
+        """Insert the next version; the unique index rejects a concurrent insert of the same one."""
+        from pymongo.errors import DuplicateKeyError
+
+        latest = self.latest(tenant_id, expert_id)
+        current = latest.version if latest else 0
+        if current != expected_version:
+            raise VersionConflict(tenant_id, expert_id, expected_version, current)
+        record = ProfileVersion(expected_version + 1, dict(refs), time.time())
+        try:
+            self.collection.insert_one({
+                "tenant_id": tenant_id, "expert_id": expert_id, "version": record.version,
+                "refs": record.refs, "created_at": record.created_at,
+            })
+        except DuplicateKeyError:
+            raise VersionConflict(tenant_id, expert_id, expected_version, expected_version + 1) from None
+        return record
+
+
+class ProfileStore:
+    """Profile store front end with an in-process LRU cache of the latest versions.
+
+    A read naming the version the client last saw is served from the cache
+    when that version is cached; any other read goes to the backend.
+    ``profile_store.cache.hits`` and ``.misses`` count the outcome.
+    """
+
+    def __init__(self, backend: ProfileBackend, *, max_size: int = DEFAULT_CACHE_SIZE) -> None:
+        """Store versions in ``backend``, caching the latest version of ``max_size`` profiles."""
+        self.backend = backend
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._cache: OrderedDict[tuple[str, str], StoredProfile] = OrderedDict()
+
+    def _cached(self, tenant_id: str, expert_id: str, version: Optional[int]) -> Optional[StoredProfile]:
+        if version is None:
+            return None
+        with self._lock:
+            stored = self._cache.get((tenant_id, expert_id))
+            if stored is None or stored.version != version:
+                return None
+            self._cache.move_to_end((tenant_id, expert_id))
+        metrics.increment("profile_store.cache.hits")
+        return stored
+
+    def _remember(self, tenant_id: str, expert_id: str, stored: StoredProfile) -> StoredProfile:
+        with self._lock:
+            self._cache[(tenant_id, expert_id)] = stored
+            self._cache.move_to_end((tenant_id, expert_id))
+            while len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+        return stored
+
+    async def _acall(self, func: Callable[..., T], *args: Any) -> T:
+        return await asyncio.to_thread(func, *args) if self.backend.blocking else func(*args)
+
+    @staticmethod
+    def _resolve(record: ProfileVersion) -> StoredProfile:
+        profile = load_profile(record.refs)
+        if profile is None:
+            raise LookupError(f"Profile version {record.version} refers to missing blobs")
+        return StoredProfile(profile, record.version)
+
+    def get(self, tenant_id: str, expert_id: str, version: Optional[int] = None) -> Optional[StoredProfile]:
+        """Return the latest profile, from the cache when ``version`` is the cached one."""
+        cached = self._cached(tenant_id, expert_id, version)
+        if cached is not None:
+            return cached
+        metrics.increment("profile_store.cache.misses")
+        record = self.backend.latest(tenant_id, expert_id)
+        return None if record is None else self._remember(tenant_id, expert_id, self._resolve(record))
+
+    def put(self, tenant_id: str, expert_id: str, profile: dict[str, Any], expected_version: int) -> StoredProfile:
+        """Store ``profile`` as the version after ``expected_version``.
+
+        Raises:
+            VersionConflict: ``expected_version`` is not the latest version.
+        """
+        profile = stored_profile(profile)
+        record = self.backend.append(tenant_id, expert_id, store_profile(profile), expected_version)
+        return self._remember(tenant_id, expert_id, StoredProfile(profile, record.version))
+
+    async def aget(self, tenant_id: str, expert_id: str, version: Optional[int] = None) -> Optional[StoredProfile]:
+        """Async version of get."""
+        cached = self._cached(tenant_id, expert_id, version)
+        if cached is not None:
+            return cached
+        metrics.increment("profile_store.cache.misses")
+        record = await self._acall(self.backend.latest, tenant_id, expert_id)
+        if record is None:
+            return None
+        profile = await aload_profile(record.refs)
+        if profile is None:
+            raise LookupError(f"Profile version {record.version} refers to missing blobs")
+        return self._remember(tenant_id, expert_id, StoredProfile(profile, record.version))
+
+    async def aput(self, tenant_id: str, expert_id: str, profile: dict[str, Any], expected_version: int) -> StoredProfile:
+        """Async version of put."""
+        profile = stored_profile(profile)
+        refs = await astore_profile(profile)
+        record = await self._acall(self.backend.append, tenant_id, expert_id, refs, expected_version)
+        return self._remember(tenant_id, expert_id, StoredProfile(profile, record.version))
+
+    def history(self, tenant_id: str, expert_id: str) -> list[ProfileVersion]:
+        """Return every version of a profile, oldest first."""
+        return self.backend.history(tenant_id, expert_id)
+
+    def get_version(self, tenant_id: str, expert_id: str, version: int) -> Optional[StoredProfile]:
+        """Return one version of a profile, None if it does not exist."""
+        record = self.backend.version(tenant_id, expert_id, version)
+        return None if record is None else self._resolve(record)
+
+    def diff(self, tenant_id: str, expert_id: str, old: int, new: int) -> dict[str, str]:
+        """Describe every field that differs between two versions, keyed by field."""
+        old_record = self.backend.version(tenant_id, expert_id, old)
+        new_record = self.backend.version(tenant_id, expert_id, new)
+        if old_record is None or new_record is None:
+            raise LookupError(f"Profile {tenant_id}/{expert_id} has no version {old if old_record is None else new}")
+        changed = [field for field in PROFILE_FIELDS if old_record.refs.get(field) != new_record.refs.get(field)]
+        if not changed:
+            return {}
+        old_profile = self._resolve(old_record).profile
+        new_profile = self._resolve(new_record).profile
+        return {field: describe_change(field, old_profile[field], new_profile[field]) for field in changed}
+
+    def rollback(self, tenant_id: str, expert_id: str, version: int, expected_version: int) -> StoredProfile:
+        """Make the content of ``version`` the latest version again; the history is kept.
+
+        Raises:
+            LookupError: ``version`` does not exist.
+            VersionConflict: ``expected_version`` is not the latest version.
+        """
+        record = self.backend.version(tenant_id, expert_id, version)
+        if record is None:
+            raise LookupError(f"Profile {tenant_id}/{expert_id} has no version {version}")
+        appended = self.backend.append(tenant_id, expert_id, record.refs, expected_version)
+        return self._remember(tenant_id, expert_id, StoredProfile(self._resolve(record).profile, appended.version))
+
+
+def store_key(config: RunnableConfig) -> Optional[tuple[str, str]]:
+    """Return the (tenant_id, expert_id) the profile of a run is stored under.
+
+    The thread id stands in for a missing ``expert_id``; None when there is neither.
+    """
+    configuration = Configuration.from_runnable_config(config)
+    expert_id = configuration.expert_id or (config.get("configurable") or {}).get("thread_id")
+    return None if expert_id is None else (configuration.tenant_id, str(expert_id))
+
+
+def create_profile_store() -> ProfileStore:
+    """Create the profile store configured by the environment."""
+    kind = os.getenv("PROFILE_STORE", "memory").lower()
+    if kind == "memory":
+        return ProfileStore(InMemoryProfileBackend())
+    if kind == "sqlite":
+        return ProfileStore(SqliteProfileBackend(os.getenv("PROFILE_STORE_URI") or DEFAULT_SQLITE_PATH))
+    if kind == "mongo":
+        uri = os.getenv("PROFILE_STORE_URI") or os.getenv("MONGODB_URI")
+        if not uri:
+            raise ValueError("PROFILE_STORE=mongo requires PROFILE_STORE_URI or MONGODB_URI")
+        return ProfileStore(MongoProfileBackend(uri))
+    raise ValueError(f"Unknown profile store: {kind}")
+
+
+profile_store = create_profile_store()
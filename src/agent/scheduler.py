@@ -0,0 +1,461 @@
+"""Scheduling layer under every model call the graph makes.
+
+Nodes submit their model calls through ``scheduler.call`` / ``scheduler.acall``
+with an :class:`LLMRequest` saying who is asking:
+
+- an identical request already in flight for the same thread, e.g. from a
+  duplicate submit of the front end, is coalesced: the later caller waits for
+  the first call and shares its result instead of calling the model again;
+- every tenant has one token bucket for requests and one for tokens, so a
+  burst from one tenant queues behind its own limits instead of causing 429s
+  for everybody;
+- at most ``max_concurrency`` calls run at once. Waiting calls are admitted
+  by priority (interactive turns, then tool work, then background work) and
+  then in arrival order; a full queue rejects new calls;
+- a call given a ``timeout``, the time left for its turn, waits at most that
+  long for admission or for the call it shares, then raises
+  :class:`~agent.deadline.DeadlineExceeded` without taking any budget.
+
+``LLM_MAX_CONCURRENCY``, ``LLM_MAX_QUEUE``, ``LLM_TENANT_RPM`` and
+``LLM_TENANT_TPM`` configure the process-wide ``scheduler``; 0 means no limit.
+Queue depth, wait time, throttled, coalesced, rejected and timed-out calls
+are reported as ``llm_scheduler.*`` metrics.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import itertools
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future, wait
+from dataclasses import dataclass
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Hashable,
+    NamedTuple,
+    NoReturn,
+    Optional,
+    Sequence,
+    TypeVar,
+    Union,
+    cast,
+)
+
+from langchain_core.messages import BaseMessage, HumanMessage
+from langchain_core.messages.utils import count_tokens_approximately
+from langchain_core.runnables import RunnableConfig
+
+from agent.configuration import Configuration
+from agent.deadline import DeadlineExceeded
+from agent.metrics import metrics
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_TOOL = 1
+PRIORITY_BACKGROUND = 2
+
+# Longest a waiting call sleeps before checking again whether it can run.
+MAX_WAIT = 1.0
+
+T = TypeVar("T")
+
+
+class SchedulerOverloaded(Exception):
+    """Raised when the queue of model calls waiting to run is full."""
+
+
+class LLMRequest(NamedTuple):
+    """A model call to admit, made by ``node`` for ``tenant_id``."""
+
+    node: str
+    tenant_id: str
+    priority: int = PRIORITY_INTERACTIVE
+    # estimated prompt tokens, charged to the tenant up front
+    tokens: int = 0
+    # requests with the same key share one in-flight call; None never coalesces
+    key: Optional[Hashable] = None
+
+
+@dataclass(frozen=True)
+class TenantLimits:
+    """Rate limits of one tenant."""
+
+    # model calls per minute, 0 for no limit
+    requests_per_minute: float = 0
+    # prompt and completion tokens per minute, 0 for no limit
+    tokens_per_minute: float = 0
+
+
+class TokenBucket:
+    """Holds up to a minute of budget and refills continuously.
+
+    The level may go negative when a call used more tokens than estimated;
+    the tenant then waits until the debt is refilled.
+    """
+
+    def __init__(self, per_minute: float, clock: Callable[[], float] = time.monotonic) -> None:
+        """Start full, with ``per_minute`` of budget refilled over each minute of ``clock``."""
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.level = per_minute
+        self.clock = clock
+        self.updated = clock()
+
+    def _refill(self) -> None:
+        now = self.clock()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, amount: float) -> float:
+        """Return the seconds until ``amount`` can be taken, 0 if it can be now."""
+        self._refill()
+        # A request larger than the bucket runs once the bucket is full.
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount: float) -> None:
+        """Charge ``amount`` to the bucket, even past empty."""
+        self._refill()
+        self.level -= amount
+
+    def refund(self, amount: float) -> None:
+        """Give back ``amount`` taken for a call that did not run."""
+        self._refill()
+        self.level = min(self.capacity, self.level + amount)
+
+
+@dataclass(eq=False)
+class _Ticket:
+    request: LLMRequest
+    seq: int
+    enqueued_at: float
+    wake: Callable[[], object] = lambda: None
+    throttled: bool = False
+    admitted: bool = False
+
+
+class LLMScheduler:
+    """Admit model calls under per-tenant rate limits and a global concurrency cap."""
+
+    def __init__(
+        self,
+        *,
+        max_concurrency: int = 0,
+        max_queue: int = 0,
+        default_limits: TenantLimits = TenantLimits(),
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        """Run up to ``max_concurrency`` calls with up to ``max_queue`` waiting, 0 for no limit.
+
+        Tenants without limits of their own get ``default_limits``.
+        """
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.default_limits = default_limits
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._seq = itertools.count()
+        self._running = 0
+        # waiting calls in admission order: priority, then arrival
+        self._waiting: list[_Ticket] = []
+        self._limits: dict[str, TenantLimits] = {}
+        self._buckets: dict[str, tuple[Optional[TokenBucket], Optional[TokenBucket]]] = {}
+        self._in_flight: dict[Hashable, Future[Any]] = {}
+
+    def set_limits(self, tenant_id: str, limits: Optional[TenantLimits]) -> None:
+        """Override the limits of one tenant; None restores the default limits."""
+        with self._lock:
+            if limits is None:
+                self._limits.pop(tenant_id, None)
+            else:
+                self._limits[tenant_id] = limits
+            self._buckets.pop(tenant_id, None)
+
+    def _tenant_buckets(self, tenant_id: str) -> tuple[Optional[TokenBucket], Optional[TokenBucket]]:
+        buckets = self._buckets.get(tenant_id)
+        if buckets is None:
+            limits = self._limits.get(tenant_id, self.default_limits)
+            buckets = self._buckets[tenant_id] = (
+                TokenBucket(limits.requests_per_minute, self.clock) if limits.requests_per_minute else None,
+                TokenBucket(limits.tokens_per_minute, self.clock) if limits.tokens_per_minute else None,
+            )
+        return buckets
+
+    def _tenant_delay(self, request: LLMRequest) -> float:
+        requests, tokens = self._tenant_buckets(request.tenant_id)
+        return max(
+            requests.delay(1) if requests else 0.0,
+            tokens.delay(request.tokens) if tokens else 0.0,
+        )
+
+    def _enqueue(self, request: LLMRequest) -> _Ticket:
+        with self._lock:
+            if self.max_queue and len(self._waiting) >= self.max_queue:
+                metrics.increment("llm_scheduler.rejected", node=request.node)
+                raise SchedulerOverloaded(f"{len(self._waiting)} model calls are already waiting")
+            ticket = _Ticket(request, next(self._seq), self.clock())
+            self._waiting.append(ticket)
+            self._waiting.sort(key=lambda waiting: (waiting.request.priority, waiting.seq))
+            metrics.observe("llm_scheduler.queue_depth", len(self._waiting))
+        return ticket
+
+    def _dispatch(self) -> list[_Ticket]:
+        """Admit waiting calls in order while slots are free; return them. Holds the lock."""
+        admitted: list[_Ticket] = []
+        waiting: list[_Ticket] = []
+        for ticket in self._waiting:
+            if self.max_concurrency and self._running >= self.max_concurrency:
+                waiting.append(ticket)
+                continue
+            if self._tenant_delay(ticket.request):
+                # A throttled call does not hold back the calls of other tenants.
+                ticket.throttled = True
+                waiting.append(ticket)
+                continue
+            self._running += 1
+            ticket.admitted = True
+            requests, tokens = self._tenant_buckets(ticket.request.tenant_id)
+            if requests:
+                requests.take(1)
+            if tokens:
+                tokens.take(ticket.request.tokens)
+            admitted.append(ticket)
+        self._waiting = waiting
+        return admitted
+
+    @staticmethod
+    def _wake(tickets: list[_Ticket], caller: Optional[_Ticket] = None) -> None:
+        for ticket in tickets:
+            if ticket is not caller:
+                ticket.wake()
+
+    def _admit(self, ticket: _Ticket) -> Optional[float]:
+        """Admit ``ticket``, or return how long to wait before trying again.
+
+        Every waiting call that can run is admitted along with it and woken,
+        so no caller waits on behalf of another while slots are free.
+        """
+        with self._lock:
+            admitted = [] if ticket.admitted else self._dispatch()
+            delay = None if ticket.admitted else min(self._tenant_delay(ticket.request) or MAX_WAIT, MAX_WAIT)
+        self._wake(admitted, ticket)
+        if delay is not None:
+            return delay
+        if ticket.throttled:
+            metrics.increment("llm_scheduler.throttled", node=ticket.request.node)
+        metrics.observe("llm_scheduler.wait_ms", (self.clock() - ticket.enqueued_at) * 1000,
+                        priority=ticket.request.priority)
+        return None
+
+    def _abandon(self, ticket: _Ticket) -> None:
+        """Withdraw a call whose caller gave up; a slot it was given goes to the next one."""
+        with self._lock:
+            if not ticket.admitted:
+                self._waiting.remove(ticket)
+                return
+            self._running -= 1
+            # The call never ran, so the budget taken to admit it is given back.
+            requests, tokens = self._tenant_buckets(ticket.request.tenant_id)
+            if requests:
+                requests.refund(1)
+            if tokens:
+                tokens.refund(ticket.request.tokens)
+            admitted = self._dispatch()
+        self._wake(admitted)
+
+    def _deadline(self, request: LLMRequest, timeout: Optional[float]) -> Optional[float]:
+        """Return the clock time by which ``request`` has to be admitted, None without a timeout."""
+        if timeout is None:
+            return None
+        if timeout <= 0:
+            self._timed_out(request)
+        return self.clock() + timeout
+
+    def _time_left(self, request: LLMRequest, deadline: Optional[float]) -> Optional[float]:
+        """Return the seconds left until ``deadline``; raise DeadlineExceeded once it passed."""
+        if deadline is None:
+            return None
+        left = deadline - self.clock()
+        if left <= 0:
+            self._timed_out(request)
+        return left
+
+    @staticmethod
+    def _timed_out(request: LLMRequest) -> NoReturn:
+        metrics.increment("llm_scheduler.timed_out", node=request.node)
+        raise DeadlineExceeded(f"No time left to run the {request.node} model call")
+
+    def _release(self, request: LLMRequest, result: Any) -> None:
+        with self._lock:
+            self._running -= 1
+            # Charge what the call actually used on top of the estimate.
+            _, tokens = self._tenant_buckets(request.tenant_id)
+            if tokens:
+                tokens.take(max(0, _usage_tokens(result) - request.tokens))
+            admitted = self._dispatch()
+        self._wake(admitted)
+
+    def _run(self, request: LLMRequest, func: Callable[[], T], deadline: Optional[float]) -> T:
+        ticket = self._enqueue(request)
+        event = threading.Event()
+        ticket.wake = event.set
+        try:
+            while True:
+                # Checked before each attempt, so a call admitted too late does not run.
+                left = self._time_left(request, deadline)
+                delay = self._admit(ticket)
+                if delay is None:
+                    break
+                event.wait(delay if left is None else min(delay, left))
+                event.clear()
+        except BaseException:
+            self._abandon(ticket)
+            raise
+        result = None
+        try:
+            result = func()
+            return result
+        finally:
+            self._release(request, result)
+
+    async def _arun(self, request: LLMRequest, func: Callable[[], Awaitable[T]], deadline: Optional[float]) -> T:
+        ticket = self._enqueue(request)
+        loop = asyncio.get_running_loop()
+        event = asyncio.Event()
+        ticket.wake = lambda: loop.call_soon_threadsafe(event.set)
+        try:
+            while True:
+                left = self._time_left(request, deadline)
+                delay = self._admit(ticket)
+                if delay is None:
+                    break
+                try:
+                    await asyncio.wait_for(event.wait(), delay if left is None else min(delay, left))
+                except TimeoutError:
+                    pass
+                event.clear()
+        except BaseException:
+            self._abandon(ticket)
+            raise
+        result = None
+        try:
+            result = await func()
+            return result
+        finally:
+            self._release(request, result)
+
+    def _join(self, request: LLMRequest) -> tuple[Optional[Future[Any]], Optional[Future[Any]]]:
+        """Return the in-flight call to share, or the future this call must resolve."""
+        if request.key is None:
+            return None, None
+        with self._lock:
+            shared = self._in_flight.get(request.key)
+            if shared is not None:
+                metrics.increment("llm_scheduler.coalesced", node=request.node)
+                return shared, None
+            own = self._in_flight[request.key] = Future()
+            return None, own
+
+    def _resolve(self, request: LLMRequest, own: Optional[Future[Any]], result: Any = None,
+                 error: Optional[BaseException] = None) -> None:
+        if own is None:
+            return
+        with self._lock:
+            del self._in_flight[request.key]
+        if error is None:
+            own.set_result(result)
+        else:
+            own.set_exception(error)
+
+    def call(self, request: LLMRequest, func: Callable[[], T], *, timeout: Optional[float] = None) -> T:
+        """Run ``func`` once the request is admitted and return its result.
+
+        Raises:
+            DeadlineExceeded: the call was not admitted, or the call it shares
+                did not finish, within ``timeout`` seconds.
+        """
+        deadline = self._deadline(request, timeout)
+        shared, own = self._join(request)
+        if shared is not None:
+            done, _ = wait([shared], timeout=self._time_left(request, deadline))
+            if not done:
+                self._timed_out(request)
+            return cast(T, shared.result())
+        try:
+            result = self._run(request, func, deadline)
+        except BaseException as error:
+            self._resolve(request, own, error=error)
+            raise
+        self._resolve(request, own, result)
+        return result
+
+    async def acall(
+        self, request: LLMRequest, func: Callable[[], Awaitable[T]], *, timeout: Optional[float] = None
+    ) -> T:
+        """Async version of call; ``func`` returns the awaitable to run."""
+        deadline = self._deadline(request, timeout)
+        shared, own = self._join(request)
+        if shared is not None:
+            # Shielded: a follower giving up must not cancel the call it shares.
+            waiter = asyncio.wrap_future(shared)
+            try:
+                return cast(T, await asyncio.wait_for(asyncio.shield(waiter), self._time_left(request, deadline)))
+            except TimeoutError:
+                if waiter.done():
+                    raise
+                self._timed_out(request)
+        try:
+            result = await self._arun(request, func, deadline)
+        except BaseException as error:
+            self._resolve(request, own, error=error)
+            raise
+        self._resolve(request, own, result)
+        return result
+
+
+def _usage_tokens(result: Any) -> int:
+    usage = getattr(result, "usage_metadata", None) or {}
+    return int(usage.get("total_tokens", 0))
+
+
+def _digest(messages: Sequence[BaseMessage]) -> str:
+    payload = [[msg.type, msg.content, getattr(msg, "tool_calls", None)] for msg in messages]
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def llm_request(
+    node: str, config: RunnableConfig, prompt: Union[str, Sequence[BaseMessage]], priority: int = PRIORITY_INTERACTIVE
+) -> LLMRequest:
+    """Describe a model call a node makes for the tenant and thread of ``config``.
+
+    Calls of the same node with the same prompt on the same thread coalesce.
+    """
+    messages: list[BaseMessage] = [HumanMessage(prompt)] if isinstance(prompt, str) else list(prompt)
+    thread_id = (config.get("configurable") or {}).get("thread_id")
+    return LLMRequest(
+        node=node,
+        tenant_id=Configuration.from_runnable_config(config).tenant_id,
+        priority=priority,
+        tokens=count_tokens_approximately(messages),
+        key=None if thread_id is None else (thread_id, node, _digest(messages)),
+    )
+
+
+def create_scheduler() -> LLMScheduler:
+    """Create the scheduler configured by the environment."""
+    return LLMScheduler(
+        max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "32")),
+        max_queue=int(os.getenv("LLM_MAX_QUEUE", "1000")),
+        default_limits=TenantLimits(
+            requests_per_minute=float(os.getenv("LLM_TENANT_RPM", "0")),
+            tokens_per_minute=float(os.getenv("LLM_TENANT_TPM", "0")),
+        ),
+    )
+
+
+scheduler = create_scheduler()
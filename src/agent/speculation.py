@@ -0,0 +1,234 @@
+"""Field-help drafts generated speculatively for the unset profile fields.
+
+With ``Configuration.speculative_field_help`` on, sync_profile starts
+background generations for the fields that are still unset once at least
+one field is set, since the user will likely ask for help with them soon.
+They run at background priority, with no callbacks, so nothing is streamed
+to the client.
+
+Drafts are kept per thread and keyed by the profile they were generated for
+(:func:`profile_key`). expert_field_assistant serves a draft for the same
+profile instead of generating one, and waits for it when it is still
+running, up to the deadline of the turn; a draft that fails or is not ready
+in time is cancelled and the field generated anew. A field whose draft was
+taken is not drafted again for the same profile. The drafts of a thread are
+discarded as soon as its profile changes.
+
+At most ``SPECULATION_MAX_CONCURRENCY`` drafts run at once in the process;
+drafts are skipped while the cap is reached. Drafts are kept for the last
+``SPECULATION_MAX_THREADS`` threads. ``speculation.started``,
+``speculation.used`` (served), ``speculation.wasted`` (discarded, failed or
+late) and ``speculation.skipped``, labelled by field, show how much of the
+extra spend pays off. A draft holds its slot until its generation really
+ends, cancelled ones included. The tokens of
+speculative generations are reported under the ``speculation`` node.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Coroutine, Hashable, Mapping, NamedTuple, Optional
+
+from agent.metrics import metrics
+from agent.profile import PROFILE_FIELDS
+
+DEFAULT_MAX_CONCURRENCY = 2
+DEFAULT_MAX_THREADS = 1000
+
+
+def profile_key(state: Mapping[str, Any]) -> Hashable:
+    """Return the key of the thread's profile: its version and field hashes."""
+    hashes = state.get("profile_hashes") or {}
+    return state.get("profile_version"), tuple(hashes.get(field) for field in PROFILE_FIELDS)
+
+
+class _Draft(NamedTuple):
+    future: Future[str]
+    cancel: Callable[[], Any]
+
+
+class _ThreadDrafts(NamedTuple):
+    key: Hashable
+    drafts: dict[str, _Draft]
+    # fields whose draft was taken for this key, served or not
+    taken: set[str]
+
+
+class SpeculativeDrafts:
+    """Background field-help drafts per thread, valid for one profile."""
+
+    def __init__(self, *, max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                 max_threads: int = DEFAULT_MAX_THREADS) -> None:
+        """Run up to ``max_concurrency`` drafts at once, keeping those of ``max_threads`` threads."""
+        self.max_concurrency = max_concurrency
+        self.max_threads = max_threads
+        # reentrant: cancelling a draft that has not started runs _done right away
+        self._lock = threading.RLock()
+        self._running = 0
+        self._threads: OrderedDict[str, _ThreadDrafts] = OrderedDict()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def _discard(self, entry: _ThreadDrafts) -> None:
+        for field, draft in entry.drafts.items():
+            metrics.increment("speculation.wasted", field=field)
+            draft.cancel()
+
+    def _entry(self, thread_id: str, key: Hashable) -> _ThreadDrafts:
+        """Return the drafts of a thread for ``key``, discarding those of another profile."""
+        entry = self._threads.get(thread_id)
+        if entry is not None and entry.key != key:
+            self._discard(entry)
+            entry = None
+        if entry is None:
+            entry = self._threads[thread_id] = _ThreadDrafts(key, {}, set())
+            if len(self._threads) > self.max_threads:
+                self._discard(self._threads.popitem(last=False)[1])
+        self._threads.move_to_end(thread_id)
+        return entry
+
+    def _reserve(self, thread_id: str, key: Hashable, field: str) -> Optional[_ThreadDrafts]:
+        """Return the entry to add a draft of ``field`` to, None if it has or had one or the cap is reached."""
+        with self._lock:
+            entry = self._entry(thread_id, key)
+            if field in entry.drafts or field in entry.taken:
+                return None
+            if self.max_concurrency and self._running >= self.max_concurrency:
+                metrics.increment("speculation.skipped", field=field)
+                return None
+            self._running += 1
+        metrics.increment("speculation.started", field=field)
+        return entry
+
+    def _done(self, _: Any) -> None:
+        with self._lock:
+            self._running -= 1
+
+    def submit(self, thread_id: str, key: Hashable, field: str, func: Callable[[], str]) -> bool:
+        """Draft ``field`` with ``func`` on a worker thread; return whether a draft was started."""
+        entry = self._reserve(thread_id, key, field)
+        if entry is None:
+            return False
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_concurrency or None, thread_name_prefix="speculation"
+                )
+        # A fresh context: the draft is not part of the run that started it.
+        future = self._executor.submit(contextvars.Context().run, func)
+        future.add_done_callback(self._done)
+        with self._lock:
+            entry.drafts[field] = _Draft(future, future.cancel)
+        return True
+
+    def asubmit(self, thread_id: str, key: Hashable, field: str, afunc: Callable[[], Coroutine[Any, Any, str]]) -> bool:
+        """Draft ``field`` with ``afunc`` as a task on the running event loop; see submit."""
+        entry = self._reserve(thread_id, key, field)
+        if entry is None:
+            return False
+        future: Future[str] = Future()
+        loop = asyncio.get_running_loop()
+        task: asyncio.Task[str] = loop.create_task(afunc(), context=contextvars.Context())
+
+        def resolve(task: asyncio.Task[str]) -> None:
+            if future.done():
+                return
+            if task.cancelled():
+                future.cancel()
+            elif task.exception() is not None:
+                future.set_exception(task.exception())
+            else:
+                future.set_result(task.result())
+
+        task.add_done_callback(resolve)
+        # The slot follows the task: the future is done as soon as a waiter cancels it.
+        task.add_done_callback(self._done)
+        with self._lock:
+            # Drafts may be discarded from another thread than the loop's.
+            entry.drafts[field] = _Draft(future, partial(loop.call_soon_threadsafe, task.cancel))
+        return True
+
+    def take(self, thread_id: Optional[str], key: Hashable, field: str) -> Optional[_Draft]:
+        """Return the draft of ``field`` for the thread's profile ``key``, removing it; None if there is none."""
+        if thread_id is None:
+            return None
+        with self._lock:
+            entry = self._threads.get(thread_id)
+            if entry is None:
+                return None
+            entry = self._entry(thread_id, key)
+            draft = entry.drafts.pop(field, None)
+            if draft is not None:
+                entry.taken.add(field)
+            return draft
+
+    def missing(self, thread_id: str, key: Hashable, fields: list[str]) -> list[str]:
+        """Return the fields of ``fields`` never drafted for the thread's profile ``key``."""
+        with self._lock:
+            entry = self._threads.get(thread_id)
+            if entry is None or entry.key != key:
+                return list(fields)
+            return [field for field in fields if field not in entry.drafts and field not in entry.taken]
+
+    def serve(self, thread_id: Optional[str], key: Hashable, field: str, timeout: Optional[float]) -> Optional[str]:
+        """Return the draft of ``field``, waiting up to ``timeout`` for it.
+
+        None if there is no draft, or if it fails or does not finish in time,
+        in which case it is cancelled.
+        """
+        draft = self.take(thread_id, key, field)
+        if draft is None:
+            return None
+        try:
+            result = draft.future.result(timeout=timeout)
+        except (Exception, CancelledError):
+            self._unserved(draft, field)
+            return None
+        metrics.increment("speculation.used", field=field)
+        return result
+
+    async def aserve(
+        self, thread_id: Optional[str], key: Hashable, field: str, timeout: Optional[float]
+    ) -> Optional[str]:
+        """Async version of serve."""
+        draft = self.take(thread_id, key, field)
+        if draft is None:
+            return None
+        try:
+            result = await asyncio.wait_for(asyncio.wrap_future(draft.future), timeout)
+        except (Exception, asyncio.CancelledError):
+            # Timing out only cancels the wrapper; the draft itself is cancelled here.
+            self._unserved(draft, field)
+            task = asyncio.current_task()
+            if task is not None and task.cancelling():
+                raise
+            return None
+        metrics.increment("speculation.used", field=field)
+        return result
+
+    def _unserved(self, draft: _Draft, field: str) -> None:
+        metrics.increment("speculation.wasted", field=field)
+        draft.cancel()
+
+    def discard(self, thread_id: str) -> None:
+        """Drop every draft of a thread."""
+        with self._lock:
+            entry = self._threads.pop(thread_id, None)
+        if entry is not None:
+            self._discard(entry)
+
+
+def create_speculative_drafts() -> SpeculativeDrafts:
+    """Create the draft store configured by the environment."""
+    return SpeculativeDrafts(
+        max_concurrency=int(os.getenv("SPECULATION_MAX_CONCURRENCY", DEFAULT_MAX_CONCURRENCY)),
+        max_threads=int(os.getenv("SPECULATION_MAX_THREADS", DEFAULT_MAX_THREADS)),
+    )
+
+
+speculative_drafts = create_speculative_drafts()
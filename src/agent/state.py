@@ -2,10 +2,13 @@
 
 from __future__ import annotations
 
-from typing import Optional
+from typing import Annotated, Any, Optional
 
-from langgraph.graph import MessagesState
+from langchain_core.messages import AnyMessage
 from pydantic import BaseModel, Field
+from typing_extensions import TypedDict
+
+from agent.message_log import add_messages_indexed
 
 
 class Expert(BaseModel):
@@ -21,7 +24,7 @@ class Expert(BaseModel):
     instructions: Optional[str] = Field(None, description="Instructions for the System prompt of the Expert")
 
     @classmethod
-    def from_config(cls, config: dict) -> Expert:
+    def from_config(cls, config: dict[str, Any]) -> Expert:
         """
         Create an Expert instance from a configuration dictionary.
         """
@@ -32,6 +35,18 @@ class Expert(BaseModel):
         )
 
 
-class ExpertCreatorAssistant(MessagesState):
+class ExpertCreatorAssistant(TypedDict):
 
+    # same as MessagesState, but the messages are kept as an indexed MessageLog
+    messages: Annotated[list[AnyMessage], add_messages_indexed]
     expert_profile: Optional[Expert]
+    # content hash of every profile field, used to detect changes cheaply
+    profile_hashes: Optional[dict[str, str]]
+    # version of expert_profile in the profile store
+    profile_version: Optional[int]
+    # rolling summary of the exchanges folded out of the verbatim history
+    summary: Optional[str]
+    # id of the last message already folded into the summary
+    summarized_until: Optional[str]
+    # time.time() by which the current turn has to finish, None without a budget
+    deadline: Optional[float]
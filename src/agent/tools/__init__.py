@@ -0,0 +1,29 @@
+from typing import Any, Mapping
+
+from langchain_core.messages import ToolCall
+
+from agent.message_log import message_log
+
+
+def tool_node(tool_call: ToolCall) -> str:
+    """Return the graph node that answers a tool call."""
+    args = tool_call.get('args', {})
+    if args.get('update_type') == "expert":
+        return "update_expert"
+    elif args.get('tool_type') == "help":
+        return "expert_field_assistant"
+    else:
+        raise ValueError(f"Unexpected tool call args: {args}")
+
+
+def pending_tool_calls(state: Mapping[str, Any], node: str) -> list[ToolCall]:
+    """Return the tool calls ``node`` has to answer.
+
+    route_message sends every tool node the calls meant for it under
+    ``tool_calls``; a node run without them answers the matching calls of the
+    last message that made any.
+    """
+    tool_calls = state.get("tool_calls")
+    if tool_calls is None:
+        tool_calls = message_log(state).last_tool_calls()
+    return [tool_call for tool_call in tool_calls if tool_node(tool_call) == node]
@@ -1,11 +1,24 @@
-from typing import Literal
-from pydantic import BaseModel
+from typing import Literal, Optional
+from pydantic import BaseModel, Field
+
+from agent.profile import PROFILE_FIELDS
 
 
 class ExpertFieldAssistantTool(BaseModel):
     """
-    Tool used to generate or enhance content for a specific Expert field.
+    Tool used to generate or enhance content for Expert fields.
+
+    Use `field` for a single field, or `fields` to draft several at once
+    (e.g. the whole Expert) in one call.
     """
     tool_type: Literal['help']
-    field: Literal['name', 'description', 'instructions']
+    field: Optional[Literal['name', 'description', 'instructions']] = None
+    fields: list[Literal['name', 'description', 'instructions']] = Field(
+        default_factory=list, description="Every field to draft together, when the user wants help with several"
+    )
     content_hint: str = ""
+
+    def requested_fields(self) -> list[str]:
+        """Return the requested fields in profile order, without duplicates."""
+        requested = set(self.fields) | ({self.field} if self.field else set())
+        return [field for field in PROFILE_FIELDS if field in requested]
@@ -1,8 +1,17 @@
-from typing import Literal
-from pydantic import BaseModel
+from typing import Literal, Optional
+from pydantic import BaseModel, Field
 
 
 # Update memory tool as a BaseModel instead of TypedDict
 class UpdateMemory(BaseModel):
-    """ Decision on what memory type to update """
+    """ Decision on what memory type to update.
+
+    Fill in only the Expert fields the user changed, with their complete new value.
+    Set `needs_merge` when the new value has to be combined with the existing one
+    (e.g. "add a rule to the instructions") instead of replacing it.
+    """
     update_type: Literal['expert']
+    name: Optional[str] = Field(None, description="Complete new name of the Expert, if it changed")
+    description: Optional[str] = Field(None, description="Complete new description of the Expert, if it changed")
+    instructions: Optional[str] = Field(None, description="Complete new instructions of the Expert, if they changed")
+    needs_merge: bool = Field(False, description="True if the change must be merged into the existing values")
@@ -0,0 +1 @@
+"""Deterministic, in-process performance benchmarks for the agent graph."""
@@ -0,0 +1,102 @@
+"""Cold-start benchmark: import time and time to first response of a fresh worker.
+
+Every sample runs in a new interpreter, which imports ``agent.graph``,
+compiles the graph, optionally runs ``warm_up`` and answers one message with
+the scripted fakes. The fake client factory imports ``langchain_openai`` like
+the real one does, so its cost lands where production pays it.
+
+    python -m tests.benchmarks.bench_cold_start --runs 10 --output cold_start.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+from typing import Any, Optional
+
+from tests.benchmarks.bench_graph import percentiles
+
+_CHILD = r"""
+import json, sys, time
+start = time.perf_counter()
+timings = {}
+
+import agent.graph
+timings["import"] = time.perf_counter() - start
+
+from tests.benchmarks.fakes import ScriptedChatModel, install_fakes
+from agent.llm import registry
+
+install_fakes()
+
+def factory(model, **settings):
+    import langchain_openai  # what the default factory imports on first use
+    return ScriptedChatModel()
+
+registry.set_factory(factory)
+
+mark = time.perf_counter()
+graph = agent.graph.load_graph()
+timings["compile"] = time.perf_counter() - mark
+
+if WARM_UP:
+    mark = time.perf_counter()
+    agent.graph.warm_up()
+    timings["warm_up"] = time.perf_counter() - mark
+
+from langchain_core.messages import HumanMessage
+
+mark = time.perf_counter()
+graph.invoke({"messages": [HumanMessage("hello")]}, {"configurable": {"thread_id": "cold"}})
+timings["first_response"] = time.perf_counter() - mark
+timings["total"] = time.perf_counter() - start
+print(json.dumps(timings))
+"""
+
+
+def sample(warm_up: bool) -> dict[str, float]:
+    """Run one fresh interpreter and return its timings in seconds."""
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, ["src", ".", os.getenv("PYTHONPATH")]))}
+    env.pop("AGENT_WARM_UP", None)
+    completed = subprocess.run(
+        [sys.executable, "-c", _CHILD.replace("WARM_UP", str(warm_up))],
+        env=env, capture_output=True, text=True, check=True,
+    )
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def run(runs: int, warm_up: bool) -> dict[str, Any]:
+    samples = [sample(warm_up) for _ in range(runs)]
+    phases = sorted({phase for timings in samples for phase in timings})
+    return {
+        "warm_up": warm_up,
+        "runs": runs,
+        "phases_ms": {phase: percentiles([timings[phase] for timings in samples if phase in timings])
+                      for phase in phases},
+    }
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per mode")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    results = [run(args.runs, warm_up) for warm_up in (False, True)]
+    for result in results:
+        phases = result["phases_ms"]
+        print(f"warm_up={result['warm_up']!s:<5} import p50={phases['import']['p50']:.0f}ms "
+              f"first_response p50={phases['first_response']['p50']:.0f}ms", file=sys.stderr)
+    report = json.dumps({"python": sys.version.split()[0], "results": results}, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(report + "\n")
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
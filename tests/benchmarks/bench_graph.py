@@ -0,0 +1,191 @@
+"""End-to-end benchmark of the compiled graph against the scripted fakes.
+
+Every routing branch is exercised at several history lengths; for each
+combination the benchmark reports per-node and end-to-end latency
+percentiles, throughput and the peak resident set size, as JSON.
+
+    python -m tests.benchmarks.bench_graph --runs 50 --output bench_output.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import platform
+import resource
+import sys
+import time
+import uuid
+from typing import Any, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import AIMessage, HumanMessage
+
+from tests.benchmarks.fakes import install_fakes
+
+# Scenario name -> (human message, configurable overrides).
+SCENARIOS: dict[str, tuple[str, dict[str, Any]]] = {
+    "end": ("hello there", {}),
+    "profile_fast_path": ("what's my expert's name?", {}),
+    "update_expert": ("update: a chef who teaches home cooking", {}),
+    "update_expert_merge": ("update:merge", {}),
+    "expert_field_assistant": ("help:name", {"field_help_cache": False}),
+    "expert_field_assistant_all": ("help:all", {"field_help_cache": False}),
+    "parallel_tools": ("update: a chef who teaches home cooking | help:instructions", {"field_help_cache": False}),
+}
+
+DEFAULT_HISTORY_LENGTHS = (0, 50, 200)
+
+
+class NodeTimer(BaseCallbackHandler):
+    """Collect the wall time of every graph node run."""
+
+    run_inline = True
+
+    def __init__(self) -> None:
+        self._started: dict[UUID, tuple[str, float]] = {}
+        self.timings: dict[str, list[float]] = {}
+
+    def on_chain_start(self, serialized: Optional[dict[str, Any]], inputs: Any, *, run_id: UUID,
+                       tags: Optional[list[str]] = None, metadata: Optional[dict[str, Any]] = None,
+                       **kwargs: Any) -> None:
+        node = (metadata or {}).get("langgraph_node")
+        if node and kwargs.get("name") == node and any(tag.startswith("graph:step:") for tag in tags or ()):
+            self._started[run_id] = (node, time.perf_counter())
+
+    def on_chain_end(self, outputs: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        started = self._started.pop(run_id, None)
+        if started is not None:
+            node, start = started
+            self.timings.setdefault(node, []).append(time.perf_counter() - start)
+
+    def on_chain_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._started.pop(run_id, None)
+
+
+def percentiles(samples: list[float]) -> dict[str, float]:
+    """Return count, mean and nearest-rank p50/p95/p99 of ``samples`` in milliseconds."""
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def rank(q: float) -> float:
+        return ordered[min(len(ordered) - 1, max(0, round(q * len(ordered)) - 1))] * 1000
+
+    return {
+        "count": len(ordered),
+        "mean": sum(ordered) / len(ordered) * 1000,
+        "p50": rank(0.50),
+        "p95": rank(0.95),
+        "p99": rank(0.99),
+    }
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process so far, in MiB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _history(length: int) -> list:
+    messages: list = []
+    for index in range(length):
+        messages.append(HumanMessage(f"Earlier question number {index} about the expert I am building."))
+        messages.append(AIMessage(f"Earlier answer number {index}, with a few suggestions for the profile."))
+    return messages
+
+
+async def _run_once(graph: Any, message: str, configurable: dict[str, Any], history: int,
+                    timer: NodeTimer) -> float:
+    config = {"configurable": {"thread_id": str(uuid.uuid4()), **configurable}}
+    if history:
+        await graph.aupdate_state(config, {"messages": _history(history)}, as_node="message_manager")
+    start = time.perf_counter()
+    await graph.ainvoke({"messages": [HumanMessage(message)]}, {**config, "callbacks": [timer]})
+    return time.perf_counter() - start
+
+
+async def run_scenario(graph: Any, name: str, history: int, runs: int, concurrency: int) -> dict[str, Any]:
+    """Benchmark one scenario at one history length."""
+    message, configurable = SCENARIOS[name]
+    timer = NodeTimer()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded() -> float:
+        async with semaphore:
+            return await _run_once(graph, message, configurable, history, timer)
+
+    # One untimed run warms the clients, runnables and compiled prompts.
+    await _run_once(graph, message, configurable, history, NodeTimer())
+    start = time.perf_counter()
+    latencies = await asyncio.gather(*(bounded() for _ in range(runs)))
+    elapsed = time.perf_counter() - start
+    return {
+        "scenario": name,
+        "history_exchanges": history,
+        "runs": runs,
+        "concurrency": concurrency,
+        "end_to_end_ms": percentiles(list(latencies)),
+        "nodes_ms": {node: percentiles(samples) for node, samples in sorted(timer.timings.items())},
+        "throughput_rps": runs / elapsed if elapsed else 0.0,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+async def run_benchmarks(args: argparse.Namespace) -> dict[str, Any]:
+    install_fakes(latency=args.latency, token_interval=args.token_interval,
+                  memory_latency=args.memory_latency)
+    from agent.graph import graph
+
+    # Per-message info logging would otherwise dominate the timings.
+    logging.getLogger("agent").setLevel(logging.WARNING)
+    results = []
+    for name in args.scenarios:
+        for history in args.history:
+            result = await run_scenario(graph, name, history, args.runs, args.concurrency)
+            print(f"{name:<24} history={history:<5} p50={result['end_to_end_ms']['p50']:.2f}ms "
+                  f"p99={result['end_to_end_ms']['p99']:.2f}ms rps={result['throughput_rps']:.1f}",
+                  file=sys.stderr)
+            results.append(result)
+    return {
+        "python": platform.python_version(),
+        "settings": {
+            "latency": args.latency,
+            "token_interval": args.token_interval,
+            "memory_latency": args.memory_latency,
+        },
+        "results": results,
+    }
+
+
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=20, help="timed runs per scenario and history length")
+    parser.add_argument("--concurrency", type=int, default=1, help="runs in flight at once")
+    parser.add_argument("--history", type=int, nargs="+", default=list(DEFAULT_HISTORY_LENGTHS),
+                        help="exchanges of pre-seeded history")
+    parser.add_argument("--scenarios", nargs="+", choices=sorted(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--latency", type=float, default=0.0, help="simulated time to first token (s)")
+    parser.add_argument("--token-interval", type=float, default=0.0, help="simulated delay between tokens (s)")
+    parser.add_argument("--memory-latency", type=float, default=None,
+                        help="simulated memory manager latency (s), defaults to --latency")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    args = parse_args(argv)
+    report = json.dumps(asyncio.run(run_benchmarks(args)), indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(report + "\n")
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+"""HTTP load test of the ``agent`` graph served by the LangGraph API server.
+
+A local OpenAI-compatible stub (``tests.benchmarks.stub_openai``) stands in
+for the model provider, with configurable latency, token rate and tool-call
+script. ``langgraph dev`` is started with its model clients pointed at the
+stub, unless ``--url`` names a server that is already running (started with
+``OPENAI_BASE_URL`` set to the stub printed on start-up).
+
+Many multi-turn sessions then run concurrently, one thread and one expert
+each, streaming every turn. Every ``--sample-interval`` seconds the report
+records completed turns per second, time to first token, errors and the
+resident memory of the server process tree, and at the end the totals for
+the whole run, as JSON.
+
+    python -m tests.benchmarks.bench_load --sessions 200 --concurrency 50 --output load_test.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Optional
+
+from tests.benchmarks.bench_graph import percentiles
+from tests.benchmarks.stub_openai import StubServer, add_arguments, parse_settings
+
+# Turns of every session, in order: one of each routing branch.
+SESSION_TURNS = (
+    "hello there",
+    "update: a chef who teaches home cooking",
+    "what's my expert's name?",
+    "help:name",
+    "update:merge",
+    "help:all",
+)
+
+ROOT = Path(__file__).resolve().parents[2]
+
+
+class LoadStats:
+    """Turn outcomes, both for the whole run and for the current sampling window."""
+
+    def __init__(self) -> None:
+        self.turn_s: list[float] = []
+        self.ttft_s: list[float] = []
+        self.errors: dict[str, int] = {}
+        self.window_turns = 0
+        self.window_errors = 0
+        self.window_ttft_s: list[float] = []
+
+    def turn(self, elapsed: float, ttft: Optional[float]) -> None:
+        self.turn_s.append(elapsed)
+        self.window_turns += 1
+        if ttft is not None:
+            self.ttft_s.append(ttft)
+            self.window_ttft_s.append(ttft)
+
+    def error(self, kind: str) -> None:
+        self.errors[kind] = self.errors.get(kind, 0) + 1
+        self.window_errors += 1
+
+    def take_window(self) -> tuple[int, int, list[float]]:
+        window = self.window_turns, self.window_errors, self.window_ttft_s
+        self.window_turns, self.window_errors, self.window_ttft_s = 0, 0, []
+        return window
+
+
+def rss_mb(pid: int) -> Optional[float]:
+    """Resident memory of a process and its descendants in MiB, None if unavailable (non-Linux)."""
+    total_kb = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            status = Path(f"/proc/{current}/status").read_text()
+            children = Path(f"/proc/{current}/task/{current}/children").read_text().split()
+        except OSError:
+            if current == pid:
+                return None
+            continue
+        total_kb += next((int(line.split()[1]) for line in status.splitlines() if line.startswith("VmRSS:")), 0)
+        pending.extend(int(child) for child in children)
+    return total_kb / 1024
+
+
+def _has_token(data: Any) -> bool:
+    """Tell whether a ``messages`` stream event carries generated text."""
+    messages = data if isinstance(data, list) else [data]
+    for message in messages:
+        if isinstance(message, (list, tuple)):
+            message = message[0]
+        if isinstance(message, dict) and message.get("type", "").lower().startswith("ai") and message.get("content"):
+            return True
+    return False
+
+
+async def run_turn(client: Any, thread_id: str, expert_id: str, text: str, stats: LoadStats) -> None:
+    started = time.perf_counter()
+    ttft = None
+    try:
+        async for part in client.runs.stream(
+            thread_id, "agent",
+            input={"messages": [{"role": "human", "content": text}]},
+            config={"configurable": {"expert_id": expert_id}},
+            stream_mode="messages",
+        ):
+            if part.event == "error":
+                stats.error("run")
+                return
+            if ttft is None and part.event.startswith("messages") and _has_token(part.data):
+                ttft = time.perf_counter() - started
+    except Exception as error:
+        stats.error(type(error).__name__)
+        return
+    stats.turn(time.perf_counter() - started, ttft)
+
+
+async def run_session(client: Any, index: int, turns: int, stats: LoadStats) -> None:
+    try:
+        thread = await client.threads.create()
+    except Exception as error:
+        stats.error(type(error).__name__)
+        return
+    expert_id = f"load-{index}-{uuid.uuid4().hex[:8]}"
+    for turn in range(turns):
+        await run_turn(client, thread["thread_id"], expert_id, SESSION_TURNS[turn % len(SESSION_TURNS)], stats)
+
+
+async def sample(stats: LoadStats, pid: Optional[int], interval: float, started: float,
+                 timeline: list[dict[str, Any]]) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        turns, errors, ttft = stats.take_window()
+        timeline.append({
+            "elapsed_s": round(time.perf_counter() - started, 1),
+            "requests_per_s": turns / interval,
+            "errors": errors,
+            "ttft_ms": percentiles(ttft),
+            "server_rss_mb": rss_mb(pid) if pid is not None else None,
+        })
+        point = timeline[-1]
+        print(f"t={point['elapsed_s']:>6}s rps={point['requests_per_s']:.1f} errors={errors} "
+              f"ttft p50={point['ttft_ms'].get('p50', 0):.0f}ms rss={point['server_rss_mb']}MiB", file=sys.stderr)
+
+
+async def run_load(url: str, pid: Optional[int], args: argparse.Namespace) -> dict[str, Any]:
+    from langgraph_sdk import get_client
+
+    client = get_client(url=url)
+    stats = LoadStats()
+    timeline: list[dict[str, Any]] = []
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def session(index: int) -> None:
+        # Sessions start evenly over the ramp-up, at most ``concurrency`` at a time.
+        await asyncio.sleep(args.ramp_up * index / max(1, args.sessions))
+        async with semaphore:
+            await run_session(client, index, args.turns, stats)
+
+    started = time.perf_counter()
+    sampler = asyncio.create_task(sample(stats, pid, args.sample_interval, started, timeline))
+    try:
+        await asyncio.gather(*(session(index) for index in range(args.sessions)))
+    finally:
+        sampler.cancel()
+    duration = time.perf_counter() - started
+    attempted = len(stats.turn_s) + sum(stats.errors.values())
+    return {
+        "sessions": args.sessions,
+        "concurrency": args.concurrency,
+        "turns_per_session": args.turns,
+        "duration_s": duration,
+        "requests_per_s": len(stats.turn_s) / duration,
+        "turn_ms": percentiles(stats.turn_s),
+        "ttft_ms": percentiles(stats.ttft_s),
+        "errors": stats.errors,
+        "error_rate": sum(stats.errors.values()) / attempted if attempted else 0.0,
+        "peak_server_rss_mb": max((point["server_rss_mb"] or 0 for point in timeline), default=None),
+        "timeline": timeline,
+    }
+
+
+def start_server(port: int, stub_url: str) -> subprocess.Popen:
+    """Start ``langgraph dev`` on ``port`` with the model clients pointed at the stub."""
+    env = {**os.environ, "OPENAI_BASE_URL": stub_url, "OPENAI_API_BASE": stub_url, "OPENAI_API_KEY": "stub"}
+    return subprocess.Popen(
+        ["langgraph", "dev", "--host", "127.0.0.1", "--port", str(port), "--no-browser", "--no-reload"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+
+
+async def wait_ready(url: str, timeout: float) -> None:
+    import httpx
+
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while True:
+            try:
+                if (await client.get(f"{url}/ok")).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"The API server at {url} did not become ready in {timeout}s")
+            await asyncio.sleep(0.5)
+
+
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", help="API server to load instead of starting langgraph dev")
+    parser.add_argument("--server-pid", type=int, help="process whose memory is sampled when --url is given")
+    parser.add_argument("--port", type=int, default=2025, help="port of the started API server")
+    parser.add_argument("--stub-port", type=int, default=0, help="port of the model stub, 0 for any free port")
+    parser.add_argument("--sessions", type=int, default=100, help="sessions in total")
+    parser.add_argument("--concurrency", type=int, default=25, help="sessions running at once")
+    parser.add_argument("--turns", type=int, default=len(SESSION_TURNS), help="turns per session")
+    parser.add_argument("--ramp-up", type=float, default=5.0, help="seconds over which sessions start")
+    parser.add_argument("--sample-interval", type=float, default=5.0, help="seconds per timeline point")
+    parser.add_argument("--startup-timeout", type=float, default=60.0, help="seconds to wait for the server")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    add_arguments(parser)
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    args = parse_args(argv)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    with StubServer(parse_settings(args), port=args.stub_port) as stub:
+        print(f"model stub at {stub.base_url}", file=sys.stderr)
+        server = None
+        url, pid = args.url, args.server_pid
+        if url is None:
+            server = start_server(args.port, stub.base_url)
+            url, pid = f"http://127.0.0.1:{args.port}", server.pid
+        try:
+            asyncio.run(wait_ready(url, args.startup_timeout))
+            result = asyncio.run(run_load(url, pid, args))
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait()
+    report = json.dumps({
+        "python": sys.version.split()[0],
+        "stub": {"latency": args.latency, "token_interval": args.token_interval, "reply_words": args.reply_words},
+        "result": result,
+    }, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(report + "\n")
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
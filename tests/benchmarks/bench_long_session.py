@@ -0,0 +1,128 @@
+"""Long-session benchmark: per-turn overhead as one thread's history grows.
+
+One thread is driven through many turns with the scripted fakes (cycling
+through a plain answer, a profile update and a field-help request), and the
+node and end-to-end times are reported per window of turns. Both still grow
+with the history: every step serializes the messages into a checkpoint, and
+async runs do it on the event loop while the nodes run. Profile a run to tell
+that cost apart from the nodes' own work.
+
+The messages reducer is also timed on its own, ``add_messages`` against
+``add_messages_indexed``, growing one history by a question and an answer per
+turn. ``add_messages`` re-indexes the whole history on every append;
+``add_messages_indexed`` only indexes the new messages, so what is left of its
+growth is the copy of the list of references, reported next to it.
+
+    python -m tests.benchmarks.bench_long_session --turns 600 --output long_session.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import platform
+import sys
+import time
+import uuid
+from typing import Any, Optional
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.graph.message import add_messages
+
+from agent.message_log import MessageLog, add_messages_indexed
+from tests.benchmarks.bench_graph import NodeTimer, percentiles
+from tests.benchmarks.fakes import install_fakes
+
+MESSAGES = ("hello there", "update: a chef who teaches home cooking", "help:name")
+
+
+async def run_session(turns: int, window: int) -> list[dict[str, Any]]:
+    """Run ``turns`` turns on one thread and return the timings per window of turns."""
+    from agent.graph import graph
+
+    # Per-turn overhead only: field-help answers would otherwise come from the cache.
+    config = {"configurable": {"thread_id": str(uuid.uuid4()), "field_help_cache": False}}
+    windows = []
+    node_ms: list[float] = []
+    turn_ms: list[float] = []
+    for turn in range(turns):
+        timer = NodeTimer()
+        start = time.perf_counter()
+        await graph.ainvoke({"messages": [HumanMessage(MESSAGES[turn % len(MESSAGES)])]},
+                            {**config, "callbacks": [timer]})
+        turn_ms.append(time.perf_counter() - start)
+        node_ms.append(sum(sum(samples) for samples in timer.timings.values()))
+        if len(turn_ms) == window:
+            state = await graph.aget_state(config)
+            windows.append({
+                "turns": f"{turn + 2 - window}-{turn + 1}",
+                "messages": len(state.values["messages"]),
+                "nodes_ms": percentiles(node_ms),
+                "end_to_end_ms": percentiles(turn_ms),
+            })
+            print(f"turns {windows[-1]['turns']:<10} messages={windows[-1]['messages']:<6} "
+                  f"nodes p50={windows[-1]['nodes_ms']['p50']:.2f}ms "
+                  f"end_to_end p50={windows[-1]['end_to_end_ms']['p50']:.2f}ms", file=sys.stderr)
+            node_ms, turn_ms = [], []
+    return windows
+
+
+def time_reducers(turns: int, window: int) -> list[dict[str, Any]]:
+    """Grow one history turn by turn with both reducers and time each turn's append per window of turns.
+
+    ``list_copy`` times copying the history's list of references, the part of
+    an ``add_messages_indexed`` append that still grows with the history.
+    """
+    results = []
+    histories: dict[str, list] = {"add_messages": [], "add_messages_indexed": MessageLog()}
+    reducers = {"add_messages": add_messages, "add_messages_indexed": add_messages_indexed}
+    timings: dict[str, list[float]] = {name: [] for name in (*reducers, "list_copy")}
+    for turn in range(turns):
+        for name, reducer in reducers.items():
+            messages = [HumanMessage(f"Question {turn}", id=str(uuid.uuid4())),
+                        AIMessage(f"Answer {turn}", id=str(uuid.uuid4()))]
+            start = time.perf_counter()
+            histories[name] = reducer(histories[name], messages)
+            timings[name].append(time.perf_counter() - start)
+        start = time.perf_counter()
+        list(histories["add_messages_indexed"])
+        timings["list_copy"].append(time.perf_counter() - start)
+        if len(timings["list_copy"]) == window:
+            results.append({"turns": f"{turn + 2 - window}-{turn + 1}",
+                            "messages": len(histories["add_messages"]),
+                            **{name: percentiles(samples) for name, samples in timings.items()}})
+            print(f"reducer turns {results[-1]['turns']:<12} messages={results[-1]['messages']:<6} "
+                  f"add_messages p50={results[-1]['add_messages']['p50']:.3f}ms "
+                  f"add_messages_indexed p50={results[-1]['add_messages_indexed']['p50']:.3f}ms "
+                  f"list_copy p50={results[-1]['list_copy']['p50']:.3f}ms", file=sys.stderr)
+            timings = {name: [] for name in timings}
+    return results
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", type=int, default=300, help="turns on the thread")
+    parser.add_argument("--window", type=int, default=50, help="turns per reported window")
+    parser.add_argument("--reducer-turns", type=int, default=5_000, help="turns the reducers are timed over")
+    parser.add_argument("--reducer-window", type=int, default=500, help="reducer turns per reported window")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    install_fakes()
+    logging.getLogger("agent").setLevel(logging.WARNING)
+    report = json.dumps({
+        "python": platform.python_version(),
+        "session": asyncio.run(run_session(args.turns, args.window)),
+        "reducers": time_reducers(args.reducer_turns, args.reducer_window),
+    }, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(report + "\n")
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
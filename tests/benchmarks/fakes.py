@@ -0,0 +1,174 @@
+"""Scripted stand-ins for the chat model and the langmem memory manager.
+
+The fakes react deterministically to the conversation, so a benchmark can
+drive every routing branch of the graph without network access:
+
+- a human message starting with ``update:`` makes the model call UpdateMemory,
+  ``update:merge`` without field values so the memory manager fallback runs;
+- a human message starting with ``help:`` makes the model call
+  ExpertFieldAssistantTool for the field named after the prefix, ``help:all``
+  or a comma-separated list such as ``help:name,description`` for several;
+- segments separated by `` | `` become parallel tool calls in one response,
+  e.g. ``update:a chef | help:instructions``;
+- anything else, including a pending tool result, gets a plain answer.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import itertools
+import json
+import time
+from typing import Any, AsyncIterator, Iterator, Optional
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import (
+    AIMessage,
+    AIMessageChunk,
+    BaseMessage,
+    HumanMessage,
+    SystemMessage,
+    ToolMessage,
+)
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.runnables import Runnable, RunnableLambda
+
+from agent.state import Expert
+
+_call_ids = itertools.count()
+
+
+def scripted_reply(messages: list[BaseMessage], reply_words: int = 30) -> AIMessage:
+    """Return the deterministic response to a conversation."""
+    conversation = [msg for msg in messages if not isinstance(msg, SystemMessage)]
+    last = conversation[-1] if conversation else None
+    human = next((msg for msg in reversed(messages) if isinstance(msg, HumanMessage)), None)
+    text = str(human.content) if human is not None else ""
+    if last is not None and not isinstance(last, ToolMessage):
+        calls = [call for call in map(_scripted_call, text.split(" | ")) if call is not None]
+        if calls:
+            return AIMessage(content="", tool_calls=calls)
+    return AIMessage(content=" ".join(["word"] * reply_words))
+
+
+def _scripted_call(text: str) -> Optional[dict]:
+    if text.startswith("update:merge"):
+        return _tool_call("UpdateMemory", {"update_type": "expert", "needs_merge": True})
+    if text.startswith("update:"):
+        return _tool_call("UpdateMemory", {"update_type": "expert", "description": text[len("update:"):].strip()})
+    if text.startswith("help:"):
+        field = text[len("help:"):].split()[0] if text[len("help:"):].strip() else "name"
+        if field == "all" or "," in field:
+            fields = ["name", "description", "instructions"] if field == "all" else field.split(",")
+            return _tool_call("ExpertFieldAssistantTool", {"tool_type": "help", "fields": fields})
+        return _tool_call("ExpertFieldAssistantTool", {"tool_type": "help", "field": field})
+    return None
+
+
+def _tool_call(name: str, args: dict) -> dict:
+    return {"name": name, "args": args, "id": f"call_{next(_call_ids)}"}
+
+
+class ScriptedChatModel(BaseChatModel):
+    """Chat model answering with scripted_reply after a simulated latency.
+
+    ``latency`` is the time to first token and ``token_interval`` the delay
+    between streamed tokens. Usage metadata is reported on every response.
+    """
+
+    latency: float = 0.0
+    token_interval: float = 0.0
+    reply_words: int = 30
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def bind_tools(self, tools: Any, **kwargs: Any) -> Runnable:
+        return self
+
+    def _reply(self, messages: list[BaseMessage]) -> AIMessage:
+        reply = scripted_reply(messages, self.reply_words)
+        prompt_tokens = sum(len(str(msg.content)) // 4 + 3 for msg in messages)
+        reply.usage_metadata = {
+            "input_tokens": prompt_tokens,
+            "output_tokens": len(str(reply.content)) // 4,
+            "total_tokens": prompt_tokens + len(str(reply.content)) // 4,
+        }
+        return reply
+
+    def _chunks(self, reply: AIMessage) -> Iterator[ChatGenerationChunk]:
+        words = str(reply.content).split(" ") if reply.content else []
+        for index, word in enumerate(words):
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word if index == 0 else " " + word))
+        yield ChatGenerationChunk(message=AIMessageChunk(
+            content="",
+            usage_metadata=reply.usage_metadata,
+            tool_call_chunks=[
+                {"name": call["name"], "args": json.dumps(call["args"]), "id": call["id"], "index": index}
+                for index, call in enumerate(reply.tool_calls)
+            ],
+        ))
+
+    def _generate(self, messages: list[BaseMessage], stop: Optional[list[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        time.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=self._reply(messages))])
+
+    async def _agenerate(self, messages: list[BaseMessage], stop: Optional[list[str]] = None,
+                         run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        await asyncio.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=self._reply(messages))])
+
+    def _stream(self, messages: list[BaseMessage], stop: Optional[list[str]] = None,
+                run_manager: Any = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self.latency)
+        for chunk in self._chunks(self._reply(messages)):
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+            time.sleep(self.token_interval)
+
+    async def _astream(self, messages: list[BaseMessage], stop: Optional[list[str]] = None,
+                       run_manager: Any = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self.latency)
+        for chunk in self._chunks(self._reply(messages)):
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+            await asyncio.sleep(self.token_interval)
+
+
+def fake_memory_manager_factory(latency: float = 0.0):
+    """Return a memory manager factory whose managers echo the last human message."""
+
+    def _result(input_data: dict) -> list:
+        human = next(
+            (msg for msg in reversed(input_data["messages"]) if isinstance(msg, HumanMessage)), None
+        )
+        return [("memory_0", Expert(description=str(human.content) if human else None))]
+
+    def factory(model: Any, **kwargs: Any) -> Runnable:
+        def invoke(input_data: dict) -> list:
+            time.sleep(latency)
+            return _result(input_data)
+
+        async def ainvoke(input_data: dict) -> list:
+            await asyncio.sleep(latency)
+            return _result(input_data)
+
+        return RunnableLambda(invoke, afunc=ainvoke)
+
+    return factory
+
+
+def install_fakes(latency: float = 0.0, token_interval: float = 0.0, memory_latency: Optional[float] = None) -> None:
+    """Route every model and memory manager the graph builds to the fakes."""
+    from agent.llm import registry
+
+    registry.set_factory(
+        lambda model, **settings: ScriptedChatModel(latency=latency, token_interval=token_interval)
+    )
+    registry.set_memory_manager_factory(
+        fake_memory_manager_factory(latency if memory_latency is None else memory_latency)
+    )
@@ -0,0 +1,289 @@
+"""Local OpenAI-compatible chat completions server answering like the fakes.
+
+``POST /v1/chat/completions`` answers with :func:`scripted_reply`, so the
+graph served over HTTP follows the same branches as with the in-process
+fakes, with a configurable time to first token and delay between streamed
+tokens. Streaming responses are server-sent events like OpenAI's, usage
+included when ``stream_options.include_usage`` is set.
+
+A script file adds tool calls of its own: a JSON list of
+``{"match": <regex>, "tool_calls": [{"name": ..., "args": {...}}]}`` tried
+against the last human message before the scripted prefixes. Tool calls are
+only made to tools offered in the request. When the request forces a tool
+call and none applies, like the memory manager's extraction, the first
+offered tool is called with empty arguments.
+
+    python -m tests.benchmarks.stub_openai --port 8911 --latency 0.2 --token-interval 0.02
+
+Point a client at it with ``OPENAI_BASE_URL=http://127.0.0.1:8911/v1``.
+"""
+
+from __future__ import annotations
+
+import argparse
+import itertools
+import json
+import re
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Iterator, Optional
+
+from langchain_core.messages import (
+    AIMessage,
+    BaseMessage,
+    HumanMessage,
+    SystemMessage,
+    ToolMessage,
+)
+
+from tests.benchmarks.fakes import scripted_reply
+
+_ROLES = {"system": SystemMessage, "developer": SystemMessage, "user": HumanMessage, "assistant": AIMessage}
+_call_ids = itertools.count()
+
+
+@dataclass
+class StubSettings:
+    # seconds before the first token, or the whole response when not streaming
+    latency: float = 0.0
+    # seconds between streamed tokens
+    token_interval: float = 0.0
+    # words in a plain answer
+    reply_words: int = 30
+    # (pattern, tool calls) tried against the last human message, in order
+    script: list[tuple[re.Pattern, list[dict[str, Any]]]] = field(default_factory=list)
+
+
+def load_script(path: str) -> list[tuple[re.Pattern, list[dict[str, Any]]]]:
+    """Read a tool-call script file, see the module docstring for the format."""
+    with open(path, encoding="utf-8") as file:
+        return [(re.compile(rule["match"]), rule["tool_calls"]) for rule in json.load(file)]
+
+
+def _text(content: Any) -> str:
+    if isinstance(content, list):
+        return "".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return content or ""
+
+
+def _to_messages(payload: list[dict[str, Any]]) -> list[BaseMessage]:
+    messages: list[BaseMessage] = []
+    for message in payload:
+        if message["role"] == "tool":
+            messages.append(ToolMessage(content=_text(message.get("content")), tool_call_id=message["tool_call_id"]))
+        else:
+            messages.append(_ROLES.get(message["role"], HumanMessage)(content=_text(message.get("content"))))
+    return messages
+
+
+def _forced_tool(request: dict[str, Any], offered: list[str]) -> Optional[str]:
+    choice = request.get("tool_choice")
+    if isinstance(choice, dict):
+        return choice.get("function", {}).get("name")
+    if choice in ("required", "any") and offered:
+        return offered[0]
+    return None
+
+
+def answer(request: dict[str, Any], settings: StubSettings) -> AIMessage:
+    """Return the response of the stub to a chat completions request."""
+    messages = _to_messages(request.get("messages", []))
+    offered = [tool["function"]["name"] for tool in request.get("tools") or ()]
+    human = next((msg for msg in reversed(messages) if isinstance(msg, HumanMessage)), None)
+    last = next((msg for msg in reversed(messages) if not isinstance(msg, SystemMessage)), None)
+    calls: list[dict[str, Any]] = []
+    if human is not None and not isinstance(last, ToolMessage):
+        calls = next((rule for pattern, rule in settings.script if pattern.search(str(human.content))), [])
+    reply = (
+        AIMessage(content="", tool_calls=[{**call, "id": f"call_{next(_call_ids)}"} for call in calls])
+        if calls else scripted_reply(messages, settings.reply_words)
+    )
+    tool_calls = [call for call in reply.tool_calls if call["name"] in offered]
+    forced = _forced_tool(request, offered)
+    if forced is not None and not any(call["name"] == forced for call in tool_calls):
+        tool_calls = [{"name": forced, "args": {}, "id": f"call_{next(_call_ids)}"}]
+    if tool_calls:
+        return AIMessage(content="", tool_calls=tool_calls)
+    if reply.tool_calls:
+        return scripted_reply([], settings.reply_words)
+    return reply
+
+
+def _usage(request: dict[str, Any], reply: AIMessage) -> dict[str, int]:
+    prompt = sum(len(json.dumps(message.get("content"))) // 4 + 3 for message in request.get("messages", []))
+    completion = len(str(reply.content)) // 4 + sum(len(json.dumps(call["args"])) // 4 for call in reply.tool_calls)
+    return {"prompt_tokens": prompt, "completion_tokens": completion, "total_tokens": prompt + completion}
+
+
+def _openai_tool_calls(reply: AIMessage) -> list[dict[str, Any]]:
+    return [
+        {"index": index, "id": call["id"], "type": "function",
+         "function": {"name": call["name"], "arguments": json.dumps(call["args"])}}
+        for index, call in enumerate(reply.tool_calls)
+    ]
+
+
+def completion(request: dict[str, Any], reply: AIMessage) -> dict[str, Any]:
+    """Render a reply as a chat.completion object."""
+    message: dict[str, Any] = {"role": "assistant", "content": reply.content or None}
+    if reply.tool_calls:
+        message["tool_calls"] = [
+            {key: value for key, value in call.items() if key != "index"} for call in _openai_tool_calls(reply)
+        ]
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": request.get("model", "stub"),
+        "choices": [{
+            "index": 0,
+            "message": message,
+            "finish_reason": "tool_calls" if reply.tool_calls else "stop",
+        }],
+        "usage": _usage(request, reply),
+    }
+
+
+def completion_chunks(request: dict[str, Any], reply: AIMessage) -> Iterator[dict[str, Any]]:
+    """Render a reply as the chat.completion.chunk objects of a stream, one per word."""
+    base = {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": request.get("model", "stub"),
+    }
+
+    def chunk(delta: dict[str, Any], finish_reason: Optional[str] = None) -> dict[str, Any]:
+        return {**base, "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+
+    yield chunk({"role": "assistant", "content": ""})
+    words = str(reply.content).split(" ") if reply.content else []
+    for index, word in enumerate(words):
+        yield chunk({"content": word if index == 0 else " " + word})
+    if reply.tool_calls:
+        yield chunk({"tool_calls": _openai_tool_calls(reply)})
+    yield chunk({}, "tool_calls" if reply.tool_calls else "stop")
+    if (request.get("stream_options") or {}).get("include_usage"):
+        yield {**base, "choices": [], "usage": _usage(request, reply)}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: _StubServer
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def do_GET(self) -> None:
+        if self.path.rstrip("/").endswith("/models"):
+            self._json(200, {"object": "list", "data": [{"id": "stub", "object": "model"}]})
+        else:
+            self._json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    def do_POST(self) -> None:
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._json(404, {"error": {"message": f"Unknown path {self.path}"}})
+            return
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        settings = self.server.settings
+        reply = answer(request, settings)
+        time.sleep(settings.latency)
+        if not request.get("stream"):
+            self._json(200, completion(request, reply))
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for index, chunk in enumerate(completion_chunks(request, reply)):
+            if index > 1:
+                time.sleep(settings.token_interval)
+            self._event(f"data: {json.dumps(chunk)}\n\n")
+        self._event("data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _event(self, data: str) -> None:
+        payload = data.encode("utf-8")
+        self.wfile.write(f"{len(payload):x}\r\n".encode("ascii") + payload + b"\r\n")
+        self.wfile.flush()
+
+    def _json(self, status: int, body: dict[str, Any]) -> None:
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+class _StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], settings: StubSettings) -> None:
+        super().__init__(address, _Handler)
+        self.settings = settings
+
+
+class StubServer:
+    """The stub running on a background thread; use as a context manager or call close()."""
+
+    def __init__(self, settings: Optional[StubSettings] = None, host: str = "127.0.0.1", port: int = 0) -> None:
+        self._server = _StubServer((host, port), settings or StubSettings())
+        self._thread = threading.Thread(target=self._server.serve_forever, name="stub-openai", daemon=True)
+        self._thread.start()
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def close(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> StubServer:
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+
+def parse_settings(args: argparse.Namespace) -> StubSettings:
+    return StubSettings(
+        latency=args.latency,
+        token_interval=args.token_interval,
+        reply_words=args.reply_words,
+        script=load_script(args.script) if args.script else [],
+    )
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    """Add the stub settings to a command line parser."""
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds before the first token")
+    parser.add_argument("--token-interval", type=float, default=0.02, help="seconds between streamed tokens")
+    parser.add_argument("--reply-words", type=int, default=30, help="words in a plain answer")
+    parser.add_argument("--script", help="JSON file of tool calls per last human message pattern")
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8911)
+    add_arguments(parser)
+    args = parser.parse_args(argv)
+    server = _StubServer((args.host, args.port), parse_settings(args))
+    print(f"Serving on http://{args.host}:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+import pytest
+
+from agent import profile
+from agent.blobs import BlobStore, InMemoryBlobBackend
+from agent.cache import create_field_help_cache
+from agent.llm import registry
+from agent.metrics import metrics
+from agent.nodes import expert_field_assistant, sync_profile, update_expert
+from agent.profile_store import InMemoryProfileBackend, ProfileStore
+from agent.speculation import create_speculative_drafts
+from tests.benchmarks.fakes import install_fakes
+
+
+@pytest.fixture
+def fakes(monkeypatch):
+    """Route every model the graph builds to the fakes, on fresh stores and metrics.
+
+    Yields ``install_fakes`` so a test can reinstall them with other latencies.
+    The registry and metrics are reset afterwards.
+    """
+    monkeypatch.setattr(profile, "blob_store", BlobStore(InMemoryBlobBackend()))
+    for module in (sync_profile, update_expert):
+        monkeypatch.setattr(module, "profile_store", ProfileStore(InMemoryProfileBackend()))
+    monkeypatch.setattr(expert_field_assistant, "field_help_cache", create_field_help_cache())
+    monkeypatch.setattr(expert_field_assistant, "speculative_drafts", create_speculative_drafts())
+    metrics.reset()
+    install_fakes()
+    yield install_fakes
+    registry.set_factory(None)
+    registry.set_memory_manager_factory(None)
+    metrics.reset()
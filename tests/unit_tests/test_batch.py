@@ -0,0 +1,30 @@
+import asyncio
+import io
+import json
+
+from agent.batch import completed_ids, read_items, run_batch
+
+INPUT = "\n".join([
+    json.dumps({"id": "chef", "expert_profile": {"name": "Chef"}, "messages": ["hello", "update: cooks pasta"]}),
+    json.dumps({"id": "done", "messages": ["hello"]}),
+    "{not json",
+])
+
+
+def test_run_batch_writes_experts_and_skips_completed(fakes) -> None:
+    from agent.graph import graph
+
+    output = io.StringIO()
+    counts = asyncio.run(run_batch(graph, read_items(io.StringIO(INPUT)), output, concurrency=2, skip={"done"}))
+
+    records = {record["id"]: record for record in map(json.loads, output.getvalue().splitlines())}
+    assert counts == {"ok": 1, "timeout": 0, "error": 1, "skipped": 1}
+    assert records["chef"]["expert"] == {"name": "Chef", "description": "cooks pasta", "instructions": None}
+    assert records["line-3"]["status"] == "error"
+    assert graph.checkpointer.get_tuple({"configurable": {"thread_id": "batch-chef"}}) is None
+
+
+def test_completed_ids_ignores_failures_and_truncated_lines(tmp_path) -> None:
+    path = tmp_path / "out.jsonl"
+    path.write_text('{"id": "a", "status": "ok"}\n{"id": "b", "status": "timeout"}\n{"id": "c", "sta')
+    assert completed_ids(str(path)) == {"a"}
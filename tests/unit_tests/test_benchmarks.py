@@ -0,0 +1,48 @@
+import asyncio
+
+from tests.benchmarks.bench_graph import SCENARIOS, percentiles, run_scenario
+
+
+def test_percentiles_use_nearest_rank() -> None:
+    stats = percentiles([i / 1000 for i in range(1, 101)])
+    assert stats["p50"] == 50
+    assert stats["p99"] == 99
+
+
+def test_every_scenario_reaches_its_branch(fakes) -> None:
+    from agent.graph import graph
+
+    for name in SCENARIOS:
+        result = asyncio.run(run_scenario(graph, name, history=2, runs=2, concurrency=2))
+        assert result["end_to_end_ms"]["count"] == 2
+        if name == "parallel_tools":
+            assert {"update_expert", "expert_field_assistant"} <= set(result["nodes_ms"])
+        elif name != "end":
+            assert name.removesuffix("_merge").removesuffix("_all") in result["nodes_ms"]
+
+
+def test_stub_server_scripts_tool_calls_and_streams() -> None:
+    from langchain_openai import ChatOpenAI
+
+    from agent.tools.update_memory import UpdateMemory
+    from tests.benchmarks.stub_openai import StubServer
+
+    with StubServer() as stub:
+        llm = ChatOpenAI(model="gpt-4o", base_url=stub.base_url, api_key="stub", stream_usage=True)
+        response = llm.bind_tools([UpdateMemory]).invoke("update: a chef")
+        chunks = list(llm.stream("hello"))
+
+    assert response.tool_calls[0]["args"] == {"update_type": "expert", "description": "a chef"}
+    assert "".join(chunk.content for chunk in chunks).startswith("word word")
+    assert any(chunk.usage_metadata for chunk in chunks)
+
+
+def test_load_test_helpers() -> None:
+    import os
+
+    from tests.benchmarks.bench_load import _has_token, rss_mb
+
+    assert _has_token([{"type": "AIMessageChunk", "content": "Hi"}])
+    assert not _has_token([{"type": "AIMessageChunk", "content": ""}])
+    assert not _has_token({"run_id": {"metadata": {}}})
+    assert rss_mb(os.getpid()) is None or rss_mb(os.getpid()) > 0
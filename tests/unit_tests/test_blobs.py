@@ -0,0 +1,94 @@
+from langchain_core.messages import HumanMessage
+
+from agent import profile as profile_module
+from agent.blobs import BlobStore, InMemoryBlobBackend, SqliteBlobBackend, blob_hash
+from agent.checkpointer import create_sqlite_checkpointer
+from agent.metrics import metrics
+from agent.nodes import sync_profile as sync_profile_module
+from agent.nodes import update_expert as update_expert_module
+from agent.nodes.sync_profile import sync_profile
+from agent.profile import field_hashes, resolve_profile, store_profile
+from agent.profile_store import InMemoryProfileBackend, ProfileStore
+
+
+def test_identical_values_are_stored_once() -> None:
+    store = BlobStore(InMemoryBlobBackend(), max_size=1)
+    metrics.reset()
+
+    blobs = store.put_many(["Be brief", "Be brief", "Chef"])
+    store.put_many(["Chef"])
+
+    assert set(blobs) == {blob_hash("Be brief"), blob_hash("Chef")}
+    assert metrics.counter("profile_blobs.stored") == 2
+    assert metrics.counter("profile_blobs.deduplicated") == 1
+    # Evicted from the cache, still read back from the backend.
+    assert store.get_many([blob_hash("Be brief")]) == {blob_hash("Be brief"): "Be brief"}
+
+
+def test_cached_values_are_written_again_after_the_backend_evicted_them() -> None:
+    backend = InMemoryBlobBackend(max_blobs=1)
+    store = BlobStore(backend)
+
+    store.put_many(["Chef"])
+    store.put_many(["Baker"])
+    assert backend.get_many([blob_hash("Chef")]) == {}
+    # Still in the read cache, but a new profile version refers to it again.
+    store.put_many(["Chef"])
+    assert backend.get_many([blob_hash("Chef")]) == {blob_hash("Chef"): "Chef"}
+
+
+def test_state_keeps_the_profile_with_its_hashes() -> None:
+    profile = {"name": "Chef", "description": "Cooks", "instructions": "Line one\nLine two"}
+    update = sync_profile({"messages": []}, {"configurable": {"expert_profile": profile}})
+
+    assert update["expert_profile"] == profile
+    assert update["profile_hashes"] == field_hashes(profile)
+    assert resolve_profile(update) == profile
+
+
+def test_hash_only_checkpoints_resolve_from_the_blob_store() -> None:
+    profile = {"name": "Chef", "description": "Cooks", "instructions": "Be brief"}
+    state = {"messages": [], "expert_profile": None, "profile_hashes": store_profile(profile)}
+
+    assert resolve_profile(state) == profile
+    # The next sync writes the values back into the state.
+    assert sync_profile(state, {"configurable": {"expert_profile": profile}})["expert_profile"] == profile
+
+
+def test_memory_backend_keeps_the_most_recently_used_blobs() -> None:
+    backend = InMemoryBlobBackend(max_blobs=2)
+    backend.put_many({"a": "A", "b": "B"})
+    backend.get_many(["a"])
+    backend.put_many({"c": "C"})
+
+    assert backend.get_many(["a", "b", "c"]) == {"a": "A", "c": "C"}
+
+
+def test_sqlite_backend_persists_blobs(tmp_path) -> None:
+    path = str(tmp_path / "profiles.sqlite")
+    assert SqliteBlobBackend(path).put_many({"a": "A", "b": "B"}) == 2
+
+    reopened = SqliteBlobBackend(path)
+    assert reopened.put_many({"a": "A", "c": "C"}) == 1
+    assert reopened.get_many(["a", "b", "c", "d"]) == {"a": "A", "b": "B", "c": "C"}
+
+
+def test_thread_restores_its_profile_with_a_new_blob_store(tmp_path, monkeypatch, fakes) -> None:
+    from agent.graph import build_workflow
+
+    path = str(tmp_path / "checkpoints.sqlite")
+    config = {"configurable": {"thread_id": "restore", "expert_id": "restore"}}
+    graph = build_workflow().compile(checkpointer=create_sqlite_checkpointer(path))
+    graph.invoke({"messages": [HumanMessage("update: a chef")]}, config)
+
+    # A restarted worker: new checkpointer connection, empty blob and profile stores.
+    monkeypatch.setattr(profile_module, "blob_store", BlobStore(InMemoryBlobBackend()))
+    for module in (sync_profile_module, update_expert_module):
+        monkeypatch.setattr(module, "profile_store", ProfileStore(InMemoryProfileBackend()))
+    graph = build_workflow().compile(checkpointer=create_sqlite_checkpointer(path))
+    assert resolve_profile(graph.get_state(config).values)["description"] == "a chef"
+
+    result = graph.invoke({"messages": [HumanMessage("hello again")]}, config)
+
+    assert resolve_profile(result)["description"] == "a chef"
+    assert not any("Profile synchronization" in str(msg.content) for msg in result["messages"])
@@ -0,0 +1,42 @@
+from langchain_core.messages import HumanMessage
+
+from agent.cache import InMemoryBackend, ResponseCache, fingerprint
+from agent.metrics import metrics
+
+PROFILE = {"name": "Anselmo", "description": "NOT SET", "instructions": "NOT SET"}
+
+
+def test_fingerprint_ignores_case_and_whitespace() -> None:
+    first = fingerprint("name", PROFILE, [HumanMessage("Help me  with the name")], "gpt-4o")
+    second = fingerprint("name", PROFILE, [HumanMessage("help me with the name ")], "gpt-4o")
+    assert first == second
+    assert first != fingerprint("description", PROFILE, [HumanMessage("help me with the name")], "gpt-4o")
+
+
+def test_in_memory_backend_evicts_lru_and_expired_entries() -> None:
+    now = [0.0]
+    backend = InMemoryBackend(max_size=2, ttl=10, name="test_cache", clock=lambda: now[0])
+    metrics.reset()
+
+    backend.set("a", "1")
+    backend.set("b", "2")
+    backend.get("a")
+    backend.set("c", "3")
+    assert backend.get("b") is None
+    assert backend.get("a") == "1"
+
+    now[0] = 11
+    assert backend.get("a") is None
+    assert metrics.counter("test_cache.evictions", reason="lru") == 1
+    assert metrics.counter("test_cache.evictions", reason="ttl") == 1
+
+
+def test_response_cache_counts_hits_and_misses() -> None:
+    cache = ResponseCache(InMemoryBackend(), name="test_cache")
+    metrics.reset()
+
+    assert cache.get("key") is None
+    cache.set("key", "suggestion")
+    assert cache.get("key") == "suggestion"
+    assert metrics.counter("test_cache.hits") == 1
+    assert metrics.counter("test_cache.misses") == 1
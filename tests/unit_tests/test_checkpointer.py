@@ -0,0 +1,138 @@
+import operator
+from typing import Annotated, TypedDict
+
+import pytest
+from langgraph.checkpoint.base import create_checkpoint, empty_checkpoint
+from langgraph.graph import StateGraph
+
+from agent.checkpointer import (
+    BoundedMemorySaver,
+    CompressedSerializer,
+    create_sqlite_checkpointer,
+)
+
+
+class _State(TypedDict):
+    items: Annotated[list, operator.add]
+
+
+def _graph(checkpointer):
+    workflow = StateGraph(_State)
+    workflow.add_node("append", lambda state: {"items": ["x" * 2000]})
+    workflow.set_entry_point("append")
+    return workflow.compile(checkpointer=checkpointer)
+
+
+def _config(thread_id: str) -> dict:
+    return {"configurable": {"thread_id": thread_id}}
+
+
+def test_memory_saver_caps_checkpoints_and_threads() -> None:
+    saver = BoundedMemorySaver(max_threads=2, max_checkpoints=3, serde=CompressedSerializer())
+    graph = _graph(saver)
+
+    for _ in range(5):
+        graph.invoke({"items": []}, _config("a"))
+    assert len(graph.get_state(_config("a")).values["items"]) == 5
+    assert len(saver.storage["a"][""]) == 3
+
+    graph.invoke({"items": []}, _config("b"))
+    graph.invoke({"items": []}, _config("c"))
+    assert "a" not in saver.storage
+    assert all(key[0] != "a" for key in saver.blobs)
+
+
+def test_sqlite_saver_caps_checkpoints(tmp_path) -> None:
+    saver = create_sqlite_checkpointer(str(tmp_path / "checkpoints.sqlite"), max_checkpoints=2)
+    graph = _graph(saver)
+
+    for _ in range(4):
+        graph.invoke({"items": []}, _config("a"))
+    assert len(graph.get_state(_config("a")).values["items"]) == 4
+    assert len(list(saver.list(_config("a")))) == 2
+
+
+def test_compressed_serializer_round_trip() -> None:
+    serde = CompressedSerializer()
+    value = {"text": "instructions " * 500}
+    type_, data = serde.dumps_typed(value)
+    assert type_.endswith("+zlib")
+    assert serde.loads_typed((type_, data)) == value
+
+
+def test_memory_saver_prunes_threads_with_non_str_ids() -> None:
+    saver = BoundedMemorySaver(max_threads=1, max_checkpoints=2)
+
+    def put(thread_id, step: int) -> None:
+        checkpoint = create_checkpoint(empty_checkpoint(), None, step)
+        checkpoint["channel_versions"] = {"items": str(step)}
+        config = {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}
+        saver.put(config, checkpoint, {"step": step}, {"items": str(step)})
+
+    for step in range(4):
+        put(7, step)
+    assert saver.get_tuple({"configurable": {"thread_id": 7}}) is not None
+    assert list(saver.storage) == ["7"]
+    assert len(saver.storage["7"][""]) == 2
+    assert sorted(key[3] for key in saver.blobs) == ["2", "3"]
+
+    put(8, 0)
+    assert list(saver.storage) == ["8"]
+    assert {key[0] for key in saver.blobs} == {"8"}
+
+
+def test_max_checkpoints_must_keep_one(tmp_path) -> None:
+    with pytest.raises(ValueError):
+        BoundedMemorySaver(max_checkpoints=0)
+    with pytest.raises(ValueError):
+        create_sqlite_checkpointer(str(tmp_path / "checkpoints.sqlite"), max_checkpoints=0)
+
+
+def _sqlite_bytes(saver) -> int:
+    with saver.cursor(transaction=False) as cur:
+        cur.execute(
+            "SELECT (SELECT COALESCE(SUM(LENGTH(checkpoint)), 0) FROM checkpoints)"
+            " + (SELECT COALESCE(SUM(LENGTH(blob)), 0) FROM checkpoint_blobs)"
+        )
+        return cur.fetchone()[0]
+
+
+def test_sqlite_saver_stores_unchanged_channels_once(tmp_path) -> None:
+    class State(TypedDict):
+        profile: str
+        items: Annotated[list, operator.add]
+
+    workflow = StateGraph(State)
+    workflow.add_node("append", lambda state: {"items": ["x"]})
+    workflow.set_entry_point("append")
+    saver = create_sqlite_checkpointer(str(tmp_path / "checkpoints.sqlite"), max_checkpoints=50)
+    graph = workflow.compile(checkpointer=saver)
+    profile = "instructions " * 2000
+
+    graph.invoke({"profile": profile, "items": []}, _config("a"))
+    first_turn = _sqlite_bytes(saver)
+    for _ in range(10):
+        graph.invoke({"items": []}, _config("a"))
+
+    # Each turn adds small checkpoints, not one more copy of the profile.
+    assert _sqlite_bytes(saver) - first_turn < len(profile)
+    values = graph.get_state(_config("a")).values
+    assert values["profile"] == profile
+    assert len(values["items"]) == 11
+
+
+def test_sqlite_saver_prunes_channel_blobs(tmp_path) -> None:
+    saver = create_sqlite_checkpointer(str(tmp_path / "checkpoints.sqlite"), max_checkpoints=2)
+    graph = _graph(saver)
+
+    for _ in range(6):
+        graph.invoke({"items": []}, _config("a"))
+    with saver.cursor(transaction=False) as cur:
+        cur.execute("SELECT COUNT(*) FROM checkpoint_blobs WHERE channel = 'items'")
+        assert cur.fetchone()[0] <= 2
+    assert len(graph.get_state(_config("a")).values["items"]) == 6
+
+    saver.delete_thread("a")
+    with saver.cursor(transaction=False) as cur:
+        cur.execute("SELECT COUNT(*) FROM checkpoint_blobs")
+        assert cur.fetchone()[0] == 0
@@ -0,0 +1,131 @@
+import asyncio
+import itertools
+import threading
+import time
+
+import pytest
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import HumanMessage
+from langchain_core.tracers._streaming import _StreamingCallbackHandler
+
+from agent.deadline import (
+    MIN_HEDGE_SAMPLES,
+    DeadlineExceeded,
+    acall_within_deadline,
+    call_within_deadline,
+    request_timeout,
+)
+from agent.llm import ModelRegistry
+from agent.metrics import metrics
+from agent.nodes.message_manager import DEGRADED_RESPONSE
+
+CONFIG = {"configurable": {"hedge_quantile": 0.5}}
+
+
+def _slow_node_history() -> None:
+    metrics.reset()
+    for _ in range(MIN_HEDGE_SAMPLES):
+        metrics.observe("llm.duration_ms", 50, node="slow")
+
+
+def test_slow_call_is_hedged_and_the_first_answer_wins() -> None:
+    _slow_node_history()
+    attempts = itertools.count()
+
+    async def call():
+        # The first request stalls, the hedge answers right away.
+        if next(attempts) == 0:
+            await asyncio.sleep(5)
+            return "primary"
+        return "hedge"
+
+    started = time.monotonic()
+    assert asyncio.run(acall_within_deadline("slow", {}, CONFIG, call)) == "hedge"
+    assert time.monotonic() - started < 1
+    assert metrics.counter("deadline.hedges", node="slow") == 1
+    assert metrics.counter("deadline.hedge_wins", node="slow") == 1
+
+
+def test_sync_calls_are_hedged_too() -> None:
+    _slow_node_history()
+    attempts = itertools.count()
+
+    def call():
+        if next(attempts) == 0:
+            time.sleep(0.5)
+            return "primary"
+        return "hedge"
+
+    assert call_within_deadline("slow", {}, CONFIG, call) == "hedge"
+
+
+def test_calls_time_out_at_the_deadline() -> None:
+    metrics.reset()
+    state = {"deadline": time.time() + 0.05}
+
+    async def call():
+        await asyncio.sleep(5)
+
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(acall_within_deadline("slow", state, {}, call))
+    with pytest.raises(DeadlineExceeded):
+        call_within_deadline("slow", {"deadline": time.time() - 1}, {}, lambda: None)
+
+
+def test_turn_out_of_time_gets_a_degraded_answer(fakes) -> None:
+    fakes(latency=1)
+    from agent.graph import graph
+
+    config = {"configurable": {"thread_id": "deadline", "deadline_seconds": 0.2}}
+    started = time.monotonic()
+    result = asyncio.run(graph.ainvoke({"messages": [HumanMessage("hello")]}, config))
+
+    assert time.monotonic() - started < 1
+    assert result["messages"][-1].content == DEGRADED_RESPONSE
+    assert metrics.counter("deadline.degraded", node="message_manager") == 1
+
+
+def test_requests_time_out_with_the_time_left() -> None:
+    metrics.reset()
+    state = {"deadline": time.time() + 2}
+    threads = set()
+
+    def call():
+        threads.add(threading.current_thread().name)
+        return request_timeout()
+
+    async def acall():
+        return request_timeout()
+
+    assert 1 < call_within_deadline("node", state, {}, call) <= 2
+    assert 1 < call_within_deadline("node", state, {}, call) <= 2
+    assert 1 < asyncio.run(acall_within_deadline("node", state, {}, acall)) <= 2
+    assert request_timeout() is None
+    # Calls share one pool instead of starting threads of their own.
+    assert all(name.startswith("deadline") for name in threads)
+
+    payload = ModelRegistry()._default_factory("gpt-4o", api_key="test")._get_request_payload("hi")
+    assert "timeout" not in payload
+    payload = call_within_deadline(
+        "node", state, {}, lambda: ModelRegistry()._default_factory("gpt-4o", api_key="test")._get_request_payload("hi")
+    )
+    assert 1 < payload["timeout"] <= 2
+
+
+def test_hedging_is_off_by_default_and_for_streamed_calls() -> None:
+    _slow_node_history()
+
+    class StreamingHandler(BaseCallbackHandler, _StreamingCallbackHandler):
+        def tap_output_aiter(self, run_id, output):
+            return output
+
+        def tap_output_iter(self, run_id, output):
+            return output
+
+    def call():
+        time.sleep(0.2)
+        return "primary"
+
+    assert call_within_deadline("slow", {}, {}, call) == "primary"
+    assert call_within_deadline("slow", {}, {**CONFIG, "callbacks": [StreamingHandler()]}, call) == "primary"
+    assert metrics.counter("deadline.hedges", node="slow") == 0
@@ -0,0 +1,46 @@
+import asyncio
+
+from langchain_core.messages import HumanMessage, ToolMessage
+
+from agent.llm import registry
+from agent.nodes.expert_field_assistant import _waves
+from agent.tools.expert_field_assistant_tool import ExpertFieldAssistantTool
+from tests.benchmarks.fakes import ScriptedChatModel
+
+prompts = []
+
+
+class RecordingChatModel(ScriptedChatModel):
+    def _reply(self, messages):
+        prompts.append(messages)
+        return super()._reply(messages)
+
+
+def test_requested_fields_merge_field_and_fields() -> None:
+    tool = ExpertFieldAssistantTool(tool_type="help", field="instructions", fields=["name", "instructions"])
+    assert tool.requested_fields() == ["name", "instructions"]
+
+
+def test_waves_generate_instructions_after_their_dependencies() -> None:
+    assert _waves(["name", "description", "instructions"]) == [["name", "description"], ["instructions"]]
+    assert _waves(["instructions"]) == [["instructions"]]
+    assert _waves(["name", "description"]) == [["name", "description"]]
+
+
+def test_whole_expert_help_answers_with_one_tool_message(fakes) -> None:
+    registry.set_factory(lambda model, **settings: RecordingChatModel(latency=0.05))
+    prompts.clear()
+    from agent.graph import graph
+
+    config = {"configurable": {"thread_id": "help-all", "field_help_cache": False}}
+    result = asyncio.run(graph.ainvoke({"messages": [HumanMessage("help:all")]}, config))
+
+    tool_messages = [msg for msg in result["messages"] if isinstance(msg, ToolMessage)]
+    assert len(tool_messages) == 1
+    content = tool_messages[0].content
+    assert content.index("Name:") < content.index("Description:") < content.index("Instructions:")
+
+    # Only the instructions are conditioned on the other drafts.
+    conditioned = [messages for messages in prompts if "Drafts proposed" in str(messages[-1].content)]
+    assert len(conditioned) == 1
+    assert '"instructions"' in str(conditioned[0][-2].content)
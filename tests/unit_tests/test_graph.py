@@ -0,0 +1,105 @@
+import os
+import subprocess
+import sys
+
+
+def test_import_defers_model_clients() -> None:
+    # A fresh interpreter, since other tests have already imported everything.
+    script = (
+        "import sys, agent.graph; "
+        "print(sorted(m for m in ('langchain_openai', 'openai', 'httpx', 'langmem', 'agent.nodes.message_manager') "
+        "if m in sys.modules))"
+    )
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, ["src", os.getenv("PYTHONPATH")]))}
+    completed = subprocess.run([sys.executable, "-c", script], env=env, capture_output=True, text=True, check=True)
+    assert completed.stdout.strip() == "[]"
+
+
+def test_load_graph_compiles_once() -> None:
+    from agent.graph import load_graph
+
+    assert load_graph() is load_graph()
+
+
+def test_tool_calls_of_one_response_run_together(fakes) -> None:
+    from langchain_core.messages import HumanMessage, ToolMessage
+
+    from agent.graph import graph
+    from agent.profile import resolve_profile
+
+    config = {"configurable": {"thread_id": "parallel-tools", "expert_id": "parallel-tools",
+                               "field_help_cache": False}}
+    message = HumanMessage("update: a chef | update: a baker | help:instructions | help:name")
+    result = graph.invoke({"messages": [message]}, config)
+
+    calls = result["messages"][1].tool_calls
+    results = [msg for msg in result["messages"] if isinstance(msg, ToolMessage)]
+    assert sorted(msg.tool_call_id for msg in results) == sorted(call["id"] for call in calls)
+    # The model answers once, after every tool call.
+    assert [type(msg).__name__ for msg in result["messages"][2:]] == ["ToolMessage"] * 4 + ["AIMessage"]
+    # Patches apply in call order, and the profile is written once.
+    assert resolve_profile(result)["description"] == "a baker"
+    assert result["profile_version"] == 1
+
+
+def test_profile_changes_stream_as_patches(fakes) -> None:
+    from langchain_core.messages import HumanMessage
+
+    from agent.graph import graph
+
+    config = {"configurable": {"thread_id": "profile-patches", "expert_id": "profile-patches"}}
+    events = [
+        list(graph.stream({"messages": [HumanMessage(text)]}, config, stream_mode="custom"))
+        for text in ("hello there", "update: a chef", "hello again")
+    ]
+
+    # The first sync sends the whole profile, the update only the changed field.
+    assert events[0] == [{"type": "profile_patch", "full": True, "version": None,
+                          "patch": {"name": None, "description": None, "instructions": None}}]
+    assert events[1] == [{"type": "profile_patch", "full": False, "version": 1, "patch": {"description": "a chef"}}]
+    assert events[2] == []
+
+
+def test_async_runs_use_the_async_nodes(fakes) -> None:
+    import asyncio
+
+    from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+    from langchain_core.runnables import RunnableLambda
+
+    from agent.llm import registry
+    from agent.profile import resolve_profile
+    from tests.benchmarks.fakes import ScriptedChatModel, fake_memory_manager_factory
+
+    class AsyncOnlyChatModel(ScriptedChatModel):
+        def _generate(self, *args, **kwargs):
+            raise AssertionError("sync model call in an async run")
+
+        def _stream(self, *args, **kwargs):
+            raise AssertionError("sync model call in an async run")
+
+    def memory_manager_factory(model, **kwargs):
+        def invoke(input_data):
+            raise AssertionError("sync memory manager call in an async run")
+
+        return RunnableLambda(invoke, afunc=fake_memory_manager_factory()(model, **kwargs).ainvoke)
+
+    registry.set_factory(lambda model, **settings: AsyncOnlyChatModel())
+    registry.set_memory_manager_factory(memory_manager_factory)
+    from agent.graph import graph
+
+    config = {"configurable": {"thread_id": "async-nodes", "expert_id": "async-nodes", "field_help_cache": False}}
+
+    async def turn(text: str) -> dict:
+        return await graph.ainvoke({"messages": [HumanMessage(text)]}, config)
+
+    # message_manager alone, then with update_expert applying a patch locally,
+    # merging with the memory manager, and expert_field_assistant.
+    results = [asyncio.run(turn(text)) for text in ("hello", "update: a chef", "update:merge", "help:name")]
+
+    assert isinstance(results[0]["messages"][-1], AIMessage)
+    assert resolve_profile(results[1])["description"] == "a chef"
+    assert resolve_profile(results[2])["description"] == "update:merge"
+    assert results[2]["profile_version"] == 2
+    help_result = next(msg for msg in reversed(results[3]["messages"]) if isinstance(msg, ToolMessage))
+    assert help_result.content.strip()
+    assert isinstance(results[3]["messages"][-1], AIMessage)
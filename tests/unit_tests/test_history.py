@@ -0,0 +1,33 @@
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+from agent.history import budgeted_history
+
+
+def _conversation(exchanges: int) -> list:
+    messages = []
+    for i in range(exchanges):
+        messages.append(HumanMessage(content="question " * 50, id=f"h{i}"))
+        messages.append(AIMessage(content="answer " * 50, id=f"a{i}"))
+    return messages
+
+
+def test_history_within_budget_is_untouched() -> None:
+    messages = _conversation(2)
+    view = budgeted_history({"messages": messages}, {"configurable": {"history_token_budget": 10_000}})
+    assert view == messages
+
+
+def test_history_drops_whole_exchanges_over_budget() -> None:
+    messages = _conversation(5)
+    view = budgeted_history({"messages": messages}, {"configurable": {"history_token_budget": 300}})
+    assert isinstance(view[0], HumanMessage)
+    assert view[-1].id == "a4"
+    assert len(view) < len(messages)
+
+
+def test_history_starts_after_summary() -> None:
+    messages = _conversation(3)
+    state = {"messages": messages, "summary": "User wants a chef.", "summarized_until": "a0"}
+    view = budgeted_history(state, {})
+    assert isinstance(view[0], SystemMessage)
+    assert [m.id for m in view[1:]] == ["h1", "a1", "h2", "a2"]
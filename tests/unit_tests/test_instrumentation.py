@@ -0,0 +1,44 @@
+from langchain_core.messages import HumanMessage
+
+from agent.instrumentation import instrumentation
+from agent.metrics import Metrics, metrics
+
+
+class _ListExporter:
+    def __init__(self) -> None:
+        self.snapshots: list = []
+
+    def export(self, snapshot: dict) -> None:
+        self.snapshots.append(snapshot)
+
+
+def test_histograms_are_exported() -> None:
+    local = Metrics()
+    exporter = _ListExporter()
+    local.add_exporter(exporter)
+    for value in (3, 30, 300):
+        local.observe("node.duration_ms", value, node="message_manager")
+
+    local.export()
+    (entry,) = exporter.snapshots[0]["histograms"]["node.duration_ms"]
+    assert entry["labels"] == {"node": "message_manager"}
+    assert entry["count"] == 3
+    assert entry["p50"] == 50
+    assert entry["max"] == 300
+
+
+def test_graph_runs_record_node_and_llm_metrics(fakes) -> None:
+    from agent.graph import graph
+
+    config = {"configurable": {"thread_id": "instrumented"}}
+    graph.invoke({"messages": [HumanMessage("update: a chef")]}, config)
+
+    assert metrics.histogram("node.duration_ms", node="message_manager")["count"] == 2
+    assert metrics.histogram("node.duration_ms", node="update_expert")["count"] == 1
+    stats = instrumentation.thread_stats("instrumented")
+    assert stats["llm_calls"] == 2
+    # Tokens are counted once, by record_token_usage.
+    assert stats["prompt_tokens"] > 0
+    assert metrics.counter("llm.prompt_tokens", node="message_manager") == stats["prompt_tokens"]
+    assert metrics.histogram("llm.tokens", node="message_manager", kind="prompt") is None
+    assert stats["node_runs"] == 6
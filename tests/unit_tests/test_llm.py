@@ -0,0 +1,98 @@
+import asyncio
+import time
+
+import pytest
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.messages import AIMessage
+
+from agent.deadline import DeadlineExceeded
+from agent.llm import ModelRegistry, ainvoke, invoke, record_token_usage
+from agent.metrics import metrics
+from agent.scheduler import PRIORITY_BACKGROUND, TenantLimits, scheduler
+
+
+def _fake_factory(model, **settings):
+    return FakeListChatModel(responses=[model])
+
+
+def test_registry_reuses_clients_per_settings() -> None:
+    registry = ModelRegistry(factory=_fake_factory)
+
+    first = registry.get_chat_model("gpt-4o", temperature=0)
+    assert registry.get_chat_model("gpt-4o", temperature=0) is first
+    assert registry.get_chat_model("gpt-4o", temperature=1) is not first
+
+
+def test_registry_bounds_clients() -> None:
+    registry = ModelRegistry(max_clients=2, factory=_fake_factory)
+
+    first = registry.get_chat_model("a")
+    registry.get_chat_model("b")
+    registry.get_chat_model("c")
+    assert registry.get_chat_model("a") is not first
+
+
+def test_registry_builds_runnables_once() -> None:
+    registry = ModelRegistry(factory=_fake_factory)
+    calls = []
+
+    def build(llm):
+        calls.append(llm)
+        return llm
+
+    registry.get_runnable("node", build, "gpt-4o")
+    registry.get_runnable("node", build, "gpt-4o")
+    assert len(calls) == 1
+
+
+def test_record_token_usage_counts_cached_tokens() -> None:
+    metrics.reset()
+    message = AIMessage(
+        content="hi",
+        usage_metadata={
+            "input_tokens": 1200,
+            "output_tokens": 10,
+            "total_tokens": 1210,
+            "input_token_details": {"cache_read": 1024},
+        },
+    )
+    record_token_usage("message_manager", message)
+    assert metrics.counter("llm.prompt_tokens", node="message_manager") == 1200
+    assert metrics.counter("llm.cached_prompt_tokens", node="message_manager") == 1024
+
+
+def test_invoke_schedules_the_call_and_runs_the_node_policy() -> None:
+    metrics.reset()
+    config = {"configurable": {"model_policy": {"node": ["small", "big"]}}}
+
+    def call(model: str) -> str:
+        if model == "small":
+            raise ConnectionError("unavailable")
+        return model
+
+    async def acall(model: str) -> str:
+        return call(model)
+
+    assert invoke("node", config, {}, call, prompt="hello") == "big"
+    assert asyncio.run(ainvoke("node", config, {}, acall, prompt="hello", priority=PRIORITY_BACKGROUND)) == "big"
+    assert metrics.counter("llm.fallbacks", node="node", model="small") == 2
+    assert metrics.histogram("llm_scheduler.wait_ms", priority=PRIORITY_BACKGROUND)["count"] == 1
+
+
+def test_invoke_raises_when_the_turn_has_no_time_left() -> None:
+    with pytest.raises(DeadlineExceeded):
+        invoke("node", {}, {"deadline": time.time() - 1}, lambda model: model, prompt="hello")
+
+
+
+def test_invoke_waits_for_a_throttled_tenant_no_longer_than_the_turn() -> None:
+    config = {"configurable": {"tenant_id": "throttled"}}
+    scheduler.set_limits("throttled", TenantLimits(requests_per_minute=1))
+    try:
+        invoke("node", config, {}, lambda model: model, prompt="first")
+        started = time.monotonic()
+        with pytest.raises(DeadlineExceeded):
+            invoke("node", config, {"deadline": time.time() + 0.3}, lambda model: model, prompt="second")
+        assert time.monotonic() - started < 1
+    finally:
+        scheduler.set_limits("throttled", None)
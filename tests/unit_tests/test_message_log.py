@@ -0,0 +1,70 @@
+from langchain_core.messages import AIMessage, HumanMessage, RemoveMessage, ToolMessage
+from langgraph.graph.message import add_messages
+
+from agent.message_log import MessageLog, add_messages_indexed
+
+
+def _turn(i: int) -> list:
+    return [
+        HumanMessage(content=f"question {i}", id=f"h{i}"),
+        AIMessage(
+            content="",
+            id=f"c{i}",
+            tool_calls=[{"name": "UpdateMemory", "args": {}, "id": f"t{i}"}],
+            additional_kwargs={"tool_calls": [{"id": f"t{i}", "type": "function"}]},
+        ),
+        ToolMessage(content="updated", tool_call_id=f"t{i}", id=f"r{i}"),
+        AIMessage(content=f"answer {i}", id=f"a{i}"),
+    ]
+
+
+def test_appending_matches_add_messages() -> None:
+    log = MessageLog()
+    plain: list = []
+    for i in range(3):
+        log = add_messages_indexed(log, _turn(i))
+        plain = add_messages(plain, _turn(i))
+    assert isinstance(log, MessageLog)
+    assert list(log) == plain
+    assert log.size == MessageLog(plain).size
+
+
+def test_appending_does_not_change_the_previous_log() -> None:
+    first = add_messages_indexed([], _turn(0))
+    second = add_messages_indexed(first, _turn(1))
+    assert len(first) == 4 and len(second) == 8
+    assert first.position("h1") is None
+    assert second.position("h1") == 4
+
+
+def test_indexes() -> None:
+    log = add_messages_indexed(_turn(0), _turn(1))
+    assert log.last_human().id == "h1"
+    assert [message.id for message in log.last_ai(3)] == ["a0", "c1", "a1"]
+    assert log.last_tool_calls()[0]["id"] == "t1"
+    assert log.human_positions(1) == [4]
+    assert [message.id for message in log.chat_view(4)] == ["h1", "a1"]
+
+
+def test_replacement_and_removal_fall_back_to_add_messages() -> None:
+    messages = _turn(0) + _turn(1)
+    replaced = AIMessage(content="better answer", id="a0")
+    log = add_messages_indexed(messages, [replaced, RemoveMessage(id="h1")])
+    assert isinstance(log, MessageLog)
+    assert list(log) == add_messages(messages, [replaced, RemoveMessage(id="h1")])
+    assert log.position("a0") == 3
+    assert log.position("h1") is None
+    assert log.last_human().id == "h0"
+
+
+def test_appending_to_an_older_log_starts_a_new_index() -> None:
+    first = add_messages_indexed([], _turn(0))
+    second = add_messages_indexed(first, _turn(1))
+    assert second._index is first._index
+    branch = add_messages_indexed(first, _turn(2))
+    assert branch._index is not first._index
+    assert [message.id for message in branch.last_ai(3)] == ["a0", "c2", "a2"]
+    assert branch.position("h1") is None and branch.position("h2") == 4
+    assert second.last_human().id == "h1" and second.size == MessageLog(_turn(0) + _turn(1)).size
+    assert first.last_tool_calls()[0]["id"] == "t0"
+    assert first.human_positions(0) == [0] and [message.id for message in first.chat_view(0)] == ["h0", "a0"]
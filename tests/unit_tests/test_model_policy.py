@@ -0,0 +1,100 @@
+import asyncio
+
+import pytest
+from langchain_core.messages import HumanMessage
+from pydantic import ValidationError
+
+from agent.llm import registry
+from agent.metrics import metrics
+from agent.model_policy import (
+    ModelPolicy,
+    acall_with_policy,
+    call_with_policy,
+    model_policy,
+)
+from agent.state import Expert
+from tests.benchmarks.fakes import ScriptedChatModel
+
+
+def test_field_entry_wins_over_node_and_default() -> None:
+    config = {"configurable": {
+        "default_model": "big",
+        "model_policy": {
+            "expert_field_assistant": ["medium", "big"],
+            "expert_field_assistant.name": {"models": "small", "escalate_to": "big"},
+        },
+    }}
+    assert model_policy(config, "expert_field_assistant", "name") == ModelPolicy(("small",), "big")
+    assert model_policy(config, "expert_field_assistant", "instructions") == ModelPolicy(("medium", "big"))
+    assert model_policy(config, "message_manager") == ModelPolicy(("big",))
+    with pytest.raises(ValueError):
+        model_policy({"configurable": {"model_policy": {"message_manager": []}}}, "message_manager")
+
+
+def test_failed_call_falls_back_to_the_next_model() -> None:
+    metrics.reset()
+
+    def call(model: str) -> str:
+        if model == "small":
+            raise ConnectionError("unavailable")
+        return model
+
+    assert call_with_policy("node", ModelPolicy(("small", "big")), call) == "big"
+    assert metrics.counter("llm.fallbacks", node="node", model="small") == 1
+    assert metrics.counter("llm.tier_calls", node="node", model="big", tier="fallback") == 1
+    with pytest.raises(ConnectionError):
+        call_with_policy("node", ModelPolicy(("small",)), call)
+
+
+def test_invalid_answer_escalates_once() -> None:
+    metrics.reset()
+    calls = []
+
+    async def call(model: str) -> dict:
+        calls.append(model)
+        return {"name": 1} if model == "small" else {"name": "Chef"}
+
+    def validate(answer: dict) -> bool:
+        return Expert.model_validate(answer) is not None
+
+    policy = ModelPolicy(("small",), escalate_to="big")
+    assert asyncio.run(acall_with_policy("node", policy, call, validate)) == {"name": "Chef"}
+    assert calls == ["small", "big"]
+    assert metrics.counter("llm.escalations", node="node", model="big") == 1
+    assert metrics.counter("llm.tier_calls", node="node", model="big", tier="escalation") == 1
+
+    # Without escalation the answer is kept as it is.
+    assert asyncio.run(acall_with_policy("node", ModelPolicy(("small",)), call, validate)) == {"name": 1}
+
+    def raises(model: str) -> dict:
+        if model == "small":
+            Expert.model_validate({"name": 1})
+        return {"name": model}
+
+    assert call_with_policy("node", policy, raises) == {"name": "big"}
+    with pytest.raises(ValidationError):
+        call_with_policy("node", ModelPolicy(("small",)), raises)
+
+
+def test_field_help_runs_on_the_model_of_its_field(fakes) -> None:
+    models = []
+
+    def factory(model: str, **settings) -> ScriptedChatModel:
+        models.append(model)
+        return ScriptedChatModel()
+
+    registry.set_factory(factory)
+    from agent.graph import graph
+
+    config = {"configurable": {
+        "thread_id": "model-policy",
+        "field_help_cache": False,
+        "model_policy": {"expert_field_assistant.name": "gpt-4o-mini"},
+    }}
+    asyncio.run(graph.ainvoke({"messages": [HumanMessage("help:name")]}, config))
+
+    assert set(models) == {"gpt-4o", "gpt-4o-mini"}
+    assert metrics.counter(
+        "llm.tier_calls", node="expert_field_assistant.name", model="gpt-4o-mini", tier="primary"
+    ) == 1
+    assert metrics.counter("llm.tier_calls", node="message_manager", model="gpt-4o", tier="primary") == 2
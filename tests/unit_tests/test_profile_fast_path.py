@@ -0,0 +1,66 @@
+from langchain_core.messages import HumanMessage
+
+from agent.llm import registry
+from agent.metrics import metrics
+from agent.nodes.profile_fast_path import answer, match_intent
+
+
+def test_match_intent_only_accepts_pure_reads() -> None:
+    assert match_intent("What's my expert's name?") == "name"
+    assert match_intent("show me the current instructions") == "instructions"
+    assert match_intent("Show me my profile.") == "profile"
+    assert match_intent("what's the name? make it shorter") is None
+    assert match_intent("help me with the description") is None
+
+
+def test_match_intent_ignores_bare_field_mentions() -> None:
+    # Answers to "which field do you want help with?" are not reads.
+    for text in ("The instructions.", "my name", "the prompt", "my description please", "the expert's name"):
+        assert match_intent(text) is None, text
+
+
+def test_answer_reports_unset_fields() -> None:
+    profile = {"name": "Chef", "description": "NOT SET", "instructions": "NOT SET"}
+    assert answer("name", profile) == "Name: Chef"
+    assert answer("description", profile) == "The Expert does not have a description yet."
+
+
+def test_profile_reads_skip_the_model(fakes) -> None:
+    calls = []
+
+    def factory(model, **settings):
+        calls.append(model)
+        raise AssertionError("the model must not be built")
+
+    registry.set_factory(factory)
+    from agent.graph import graph
+
+    config = {"configurable": {"thread_id": "fast-path", "expert_profile": {"name": "Chef"}}}
+    result = graph.invoke({"messages": [HumanMessage("what is the expert's name?")]}, config)
+
+    assert result["messages"][-1].content == "Name: Chef"
+    assert metrics.counter("profile_fast_path.hits", intent="name") == 1
+    assert not calls
+
+
+def test_fast_path_can_be_disabled(fakes) -> None:
+    from agent.graph import graph
+
+    config = {"configurable": {"thread_id": "no-fast-path", "profile_fast_path": False}}
+    result = graph.invoke({"messages": [HumanMessage("what is the expert's name?")]}, config)
+
+    assert result["messages"][-1].content.startswith("word")
+    assert metrics.counter("profile_fast_path.hits", intent="name") == 0
+
+
+def test_fast_path_only_matches_the_message_of_this_turn(fakes) -> None:
+    from agent.graph import graph
+
+    config = {"configurable": {"thread_id": "fast-path-turn", "expert_profile": {"name": "Chef"}}}
+    graph.invoke({"messages": [HumanMessage("what is the expert's name?")]}, config)
+    # A turn that adds no human message must not answer the previous one again.
+    result = graph.invoke({"messages": []}, config)
+
+    assert result["messages"][-1].content.startswith("word")
+    assert metrics.counter("profile_fast_path.hits", intent="name") == 1
+    assert metrics.counter("profile_fast_path.misses") == 1
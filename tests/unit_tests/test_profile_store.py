@@ -0,0 +1,138 @@
+import pytest
+from langchain_core.messages import AIMessage
+
+from agent.metrics import metrics
+from agent.nodes.sync_profile import sync_profile
+from agent.nodes.update_expert import save_profile
+from agent.profile import resolve_profile
+from agent.profile_store import (
+    InMemoryProfileBackend,
+    ProfileStore,
+    SqliteProfileBackend,
+    VersionConflict,
+    profile_store,
+)
+
+
+def test_put_requires_the_latest_version() -> None:
+    store = ProfileStore(InMemoryProfileBackend())
+    assert store.put("tenant", "expert", {"name": "Chef"}, 0).version == 1
+    with pytest.raises(VersionConflict):
+        store.put("tenant", "expert", {"name": "Baker"}, 0)
+    assert store.get("tenant", "expert").profile["name"] == "Chef"
+
+
+def test_cache_serves_the_version_the_client_saw() -> None:
+    store = ProfileStore(InMemoryProfileBackend())
+    store.put("tenant", "expert", {"name": "Chef"}, 0)
+    metrics.reset()
+
+    assert store.get("tenant", "expert", version=1).profile["name"] == "Chef"
+    assert store.get("tenant", "expert", version=2).profile["name"] == "Chef"
+    assert metrics.counter("profile_store.cache.hits") == 1
+    assert metrics.counter("profile_store.cache.misses") == 1
+
+
+def test_sync_profile_loads_the_stored_profile() -> None:
+    stored = profile_store.put("store-tenant", "chef", {"name": "Chef", "description": "Cooks"}, 0)
+    config = {"configurable": {"tenant_id": "store-tenant", "expert_id": "chef", "profile_version": stored.version}}
+
+    update = sync_profile({"messages": []}, config)
+
+    assert resolve_profile(update) == {"name": "Chef", "description": "Cooks", "instructions": "NOT SET"}
+    assert update["profile_version"] == stored.version
+
+
+def test_save_profile_rebases_on_a_concurrent_update() -> None:
+    profile_store.put("store-tenant", "baker", {"name": "Baker"}, 0)
+    state = {
+        "messages": [AIMessage("")],
+        "expert_profile": {"name": "Baker", "description": "NOT SET", "instructions": "NOT SET"},
+        "profile_version": 1,
+    }
+    # Another worker renamed the expert after this thread read version 1.
+    profile_store.put("store-tenant", "baker", {"name": "Master Baker"}, 1)
+
+    config = {"configurable": {"tenant_id": "store-tenant", "expert_id": "baker"}}
+    profile, version = save_profile(state, config, {**state["expert_profile"], "description": "Bakes bread"})
+
+    assert version == 3
+    assert profile["name"] == "Master Baker"
+    assert profile_store.get("store-tenant", "baker").profile["description"] == "Bakes bread"
+
+
+def test_history_diff_and_rollback() -> None:
+    store = ProfileStore(InMemoryProfileBackend())
+    store.put("tenant", "expert", {"name": "Chef", "instructions": "Be brief"}, 0)
+    store.put("tenant", "expert", {"name": "Chef", "instructions": "Be thorough"}, 1)
+
+    assert [version.version for version in store.history("tenant", "expert")] == [1, 2]
+    assert list(store.diff("tenant", "expert", 1, 2)) == ["instructions"]
+
+    rolled_back = store.rollback("tenant", "expert", 1, expected_version=2)
+    assert rolled_back.version == 3
+    assert store.get("tenant", "expert").profile["instructions"] == "Be brief"
+    assert store.history("tenant", "expert")[2].refs == store.history("tenant", "expert")[0].refs
+
+
+def test_sqlite_backend_keeps_versions_across_connections(tmp_path) -> None:
+    path = str(tmp_path / "profiles.sqlite")
+    ProfileStore(SqliteProfileBackend(path)).put("tenant", "expert", {"name": "Chef"}, 0)
+
+    store = ProfileStore(SqliteProfileBackend(path))
+    with pytest.raises(VersionConflict):
+        store.put("tenant", "expert", {"name": "Baker"}, 0)
+    store.put("tenant", "expert", {"name": "Baker"}, 1)
+    assert store.get("tenant", "expert").profile["name"] == "Baker"
+    assert [version.version for version in store.history("tenant", "expert")] == [1, 2]
+    assert store.get_version("tenant", "expert", 1).profile["name"] == "Chef"
+
+
+def test_sync_profile_keeps_the_thread_profile_when_stored_values_are_gone(monkeypatch) -> None:
+    from agent import profile as profile_module
+    from agent.blobs import BlobStore, InMemoryBlobBackend
+
+    stored = profile_store.put("store-tenant", "evicted", {"name": "Chef"}, 0)
+    # The values of the stored version were evicted from the in-memory blob backend.
+    monkeypatch.setattr(profile_module, "blob_store", BlobStore(InMemoryBlobBackend()))
+    state = {"messages": [], "expert_profile": {"name": "Chef", "description": "NOT SET", "instructions": "NOT SET"}}
+    config = {"configurable": {"tenant_id": "store-tenant", "expert_id": "evicted", "profile_version": stored.version + 1}}
+
+    update = sync_profile(state, config)
+
+    assert resolve_profile({**state, **update})["name"] == "Chef"
+
+
+def test_an_empty_profile_sent_by_the_client_is_not_loaded_from_the_store() -> None:
+    profile_store.put("store-tenant", "owned", {"name": "Chef"}, 0)
+    config = {"configurable": {"tenant_id": "store-tenant", "expert_id": "owned", "expert_profile": {}}}
+
+    update = sync_profile({"messages": []}, config)
+
+    assert resolve_profile(update) == {"name": "NOT SET", "description": "NOT SET", "instructions": "NOT SET"}
+    assert "profile_version" not in update
+
+
+def test_profiles_without_an_expert_id_are_kept_per_thread() -> None:
+    state = {"messages": [AIMessage("")], "expert_profile": {"name": "NOT SET", "description": "NOT SET",
+                                                            "instructions": "NOT SET"}}
+    config = {"configurable": {"tenant_id": "store-tenant", "thread_id": "thread-a"}}
+    _, version = save_profile(state, config, {**state["expert_profile"], "name": "Chef"})
+
+    assert version == 1
+    assert profile_store.get("store-tenant", "thread-a").profile["name"] == "Chef"
+    other = sync_profile({"messages": []}, {"configurable": {"tenant_id": "store-tenant", "thread_id": "thread-b"}})
+    assert resolve_profile(other)["name"] == "NOT SET"
+
+
+def test_profiles_owned_by_the_client_are_not_saved() -> None:
+    state = {"messages": [AIMessage("")], "expert_profile": {"name": "Chef", "description": "NOT SET",
+                                                            "instructions": "NOT SET"}}
+    config = {"configurable": {"tenant_id": "store-tenant", "expert_id": "client-owned",
+                               "expert_profile": state["expert_profile"]}}
+
+    profile, version = save_profile(state, config, {**state["expert_profile"], "description": "Cooks"})
+
+    assert profile["description"] == "Cooks"
+    assert version is None
+    assert profile_store.get("store-tenant", "client-owned") is None
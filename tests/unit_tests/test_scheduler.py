@@ -0,0 +1,220 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from langchain_core.messages import HumanMessage
+
+from agent.deadline import DeadlineExceeded
+from agent.llm import registry
+from agent.metrics import metrics
+from agent.scheduler import (
+    PRIORITY_BACKGROUND,
+    PRIORITY_INTERACTIVE,
+    LLMRequest,
+    LLMScheduler,
+    SchedulerOverloaded,
+    TenantLimits,
+    TokenBucket,
+)
+from tests.benchmarks.fakes import ScriptedChatModel
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_token_bucket_refills_over_time() -> None:
+    clock = FakeClock()
+    bucket = TokenBucket(60, clock)
+    bucket.take(60)
+    assert bucket.delay(1) == pytest.approx(1.0)
+    clock.now = 1.0
+    assert bucket.delay(1) == 0
+
+
+def test_identical_requests_in_flight_share_one_call() -> None:
+    scheduler = LLMScheduler()
+    request = LLMRequest("message_manager", "tenant", key=("thread", "message_manager", "prompt"))
+    calls = []
+
+    async def call():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "answer"
+
+    async def main():
+        return await asyncio.gather(*(scheduler.acall(request, call) for _ in range(3)))
+
+    assert asyncio.run(main()) == ["answer"] * 3
+    assert len(calls) == 1
+
+
+def test_tenant_limits_throttle_only_that_tenant() -> None:
+    clock = FakeClock()
+    scheduler = LLMScheduler(clock=clock)
+    scheduler.set_limits("busy", TenantLimits(requests_per_minute=1))
+    scheduler.call(LLMRequest("message_manager", "busy"), lambda: None)
+
+    # Another tenant is not affected by the busy one.
+    assert scheduler.call(LLMRequest("message_manager", "quiet"), lambda: "quiet") == "quiet"
+
+    done = threading.Event()
+    thread = threading.Thread(
+        target=lambda: (scheduler.call(LLMRequest("message_manager", "busy"), lambda: None), done.set())
+    )
+    thread.start()
+    assert not done.wait(0.1)
+    clock.now = 60.0
+    assert done.wait(2)
+    thread.join()
+
+
+def test_waiting_calls_run_by_priority() -> None:
+    scheduler = LLMScheduler(max_concurrency=1)
+    order = []
+    release = threading.Event()
+
+    def first():
+        release.wait(2)
+
+    threads = [threading.Thread(target=scheduler.call, args=(LLMRequest("a", "t"), first))]
+    threads[0].start()
+    time.sleep(0.05)
+    for name, priority in (("background", PRIORITY_BACKGROUND), ("interactive", PRIORITY_INTERACTIVE)):
+        threads.append(threading.Thread(
+            target=scheduler.call, args=(LLMRequest(name, "t", priority), lambda name=name: order.append(name))
+        ))
+        threads[-1].start()
+        time.sleep(0.05)
+    release.set()
+    for thread in threads:
+        thread.join(3)
+    assert order == ["interactive", "background"]
+
+
+def test_full_queue_rejects_calls() -> None:
+    scheduler = LLMScheduler(max_concurrency=1, max_queue=1)
+    release = threading.Event()
+    running = threading.Thread(target=scheduler.call, args=(LLMRequest("a", "t"), lambda: release.wait(2)))
+    running.start()
+    time.sleep(0.05)
+    waiting = threading.Thread(target=scheduler.call, args=(LLMRequest("b", "t"), lambda: None))
+    waiting.start()
+    time.sleep(0.05)
+    try:
+        with pytest.raises(SchedulerOverloaded):
+            scheduler.call(LLMRequest("c", "t"), lambda: None)
+    finally:
+        release.set()
+        running.join(3)
+        waiting.join(3)
+
+
+def test_duplicate_submits_call_the_model_once(fakes) -> None:
+    calls = []
+
+    class CountingChatModel(ScriptedChatModel):
+        def _reply(self, messages):
+            calls.append(1)
+            return super()._reply(messages)
+
+    registry.set_factory(lambda model, **settings: CountingChatModel(latency=0.1))
+    from agent.graph import graph
+
+    config = {"configurable": {"thread_id": "duplicate-submit"}}
+
+    async def main():
+        return await asyncio.gather(*(graph.ainvoke({"messages": [HumanMessage("hello")]}, config)
+                                      for _ in range(2)))
+
+    asyncio.run(main())
+
+    assert len(calls) == 1
+    assert metrics.counter("llm_scheduler.coalesced", node="message_manager") == 1
+
+
+def test_calls_with_free_slots_do_not_wait_for_each_other() -> None:
+    scheduler = LLMScheduler(max_concurrency=8)
+    # Both calls have to run at the same time for either to finish.
+    for _ in range(20):
+        together = threading.Barrier(2, timeout=0.5)
+        start = threading.Barrier(2)
+        errors = []
+
+        def call() -> None:
+            start.wait()
+            try:
+                scheduler.call(LLMRequest("a", "t"), together.wait)
+            except threading.BrokenBarrierError as error:
+                errors.append(error)
+
+        threads = [threading.Thread(target=call) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(3)
+        assert not errors
+
+
+def test_a_later_call_admits_the_earlier_ones_and_runs() -> None:
+    scheduler = LLMScheduler(max_concurrency=8)
+    # An earlier call that has queued but not yet tried to run.
+    earlier = scheduler._enqueue(LLMRequest("a", "t"))
+    woken = threading.Event()
+    earlier.wake = woken.set
+
+    done = threading.Event()
+    thread = threading.Thread(target=scheduler.call, args=(LLMRequest("b", "t"), done.set), daemon=True)
+    thread.start()
+    assert done.wait(0.5)
+    assert earlier.admitted and woken.is_set()
+
+
+def test_throttled_calls_give_up_when_the_turn_runs_out() -> None:
+    metrics.reset()
+    scheduler = LLMScheduler()
+    scheduler.set_limits("busy", TenantLimits(requests_per_minute=1))
+    scheduler.call(LLMRequest("message_manager", "busy"), lambda: None)
+    requests, _ = scheduler._tenant_buckets("busy")
+    level = requests.level
+
+    started = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        scheduler.call(LLMRequest("message_manager", "busy"), lambda: None, timeout=0.2)
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(scheduler.acall(LLMRequest("message_manager", "busy"), _none, timeout=0.2))
+    assert time.monotonic() - started < 1
+    # Neither call took a request from the tenant's budget or stayed in the queue.
+    assert requests.level == pytest.approx(level, abs=0.05)
+    assert not scheduler._waiting
+    assert metrics.counter("llm_scheduler.timed_out", node="message_manager") == 2
+
+
+def test_calls_sharing_a_slow_call_give_up_at_their_deadline() -> None:
+    scheduler = LLMScheduler()
+    request = LLMRequest("message_manager", "tenant", key=("thread", "message_manager", "prompt"))
+    release = threading.Event()
+    thread = threading.Thread(target=scheduler.call, args=(request, lambda: release.wait(2)), daemon=True)
+    thread.start()
+    time.sleep(0.05)
+
+    async def follow() -> None:
+        await scheduler.acall(request, _none, timeout=0.1)
+
+    with pytest.raises(DeadlineExceeded):
+        scheduler.call(request, lambda: None, timeout=0.1)
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(follow())
+    # The shared call itself is not cancelled by the followers giving up.
+    release.set()
+    thread.join(1)
+    assert not scheduler._in_flight
+
+
+async def _none() -> None:
+    return None
@@ -0,0 +1,135 @@
+import asyncio
+import threading
+import time
+
+from langchain_core.messages import HumanMessage, ToolMessage
+
+from agent.metrics import metrics
+from agent.speculation import SpeculativeDrafts
+
+
+def test_drafts_are_served_for_the_same_profile_only() -> None:
+    metrics.reset()
+    drafts = SpeculativeDrafts(max_concurrency=2)
+    assert drafts.submit("t", "v1", "name", lambda: "Chef Anselmo")
+    assert not drafts.submit("t", "v1", "name", lambda: "again")
+    assert drafts.serve("t", "v1", "name", 1) == "Chef Anselmo"
+    assert drafts.serve("t", "v1", "name", 1) is None
+
+    assert drafts.submit("t", "v1", "instructions", lambda: "Be kind")
+    # The profile changed: the draft is discarded, not served.
+    assert drafts.take("t", "v2", "instructions") is None
+    assert metrics.counter("speculation.used", field="name") == 1
+    assert metrics.counter("speculation.wasted", field="instructions") == 1
+
+
+def test_taken_drafts_are_not_drafted_again_for_the_same_profile() -> None:
+    drafts = SpeculativeDrafts(max_concurrency=2)
+    calls = []
+
+    def draft() -> str:
+        calls.append(1)
+        return "Chef Anselmo"
+
+    # Two turns on the same profile: the draft served in the first is not redone.
+    for _ in range(2):
+        drafts.submit("t", "v1", "name", draft)
+        drafts.serve("t", "v1", "name", 1)
+    assert len(calls) == 1
+    assert drafts.missing("t", "v1", ["name", "description"]) == ["description"]
+
+    assert drafts.submit("t", "v2", "name", draft)
+    assert drafts.serve("t", "v2", "name", 1) == "Chef Anselmo"
+    assert len(calls) == 2
+
+
+def test_drafts_beyond_the_cap_are_skipped() -> None:
+    metrics.reset()
+    drafts = SpeculativeDrafts(max_concurrency=1)
+    release = threading.Event()
+    assert drafts.submit("t", "v1", "name", lambda: release.wait(1) and "name")
+    assert not drafts.submit("t", "v1", "description", lambda: "description")
+    release.set()
+    assert drafts.serve("t", "v1", "name", 1) == "name"
+    assert metrics.counter("speculation.skipped", field="description") == 1
+
+
+def test_failed_drafts_are_not_counted_as_used() -> None:
+    metrics.reset()
+    drafts = SpeculativeDrafts(max_concurrency=1)
+
+    def fail() -> str:
+        raise ConnectionError("unavailable")
+
+    assert drafts.submit("t", "v1", "name", fail)
+    assert drafts.serve("t", "v1", "name", 1) is None
+    assert metrics.counter("speculation.used", field="name") == 0
+    assert metrics.counter("speculation.wasted", field="name") == 1
+
+
+def test_late_async_drafts_are_cancelled_and_hold_their_slot_until_they_end() -> None:
+    metrics.reset()
+    drafts = SpeculativeDrafts(max_concurrency=1)
+    cancelled = []
+
+    async def draft() -> str:
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            # Cleaning up still takes the slot.
+            await asyncio.sleep(0.05)
+            raise
+        return "late"
+
+    async def run() -> None:
+        assert drafts.asubmit("t", "v1", "name", draft)
+        assert await drafts.aserve("t", "v1", "name", 0.05) is None
+        await asyncio.sleep(0.01)
+        assert cancelled and not drafts.asubmit("t", "v1", "description", draft)
+        await asyncio.sleep(0.1)
+        assert drafts.asubmit("t", "v1", "description", lambda: asyncio.sleep(0, "description"))
+        assert await drafts.aserve("t", "v1", "description", 1) == "description"
+
+    asyncio.run(run())
+    assert metrics.counter("speculation.used", field="name") == 0
+    assert metrics.counter("speculation.wasted", field="name") == 1
+    assert metrics.counter("speculation.used", field="description") == 1
+
+
+def test_help_for_an_unset_field_is_served_from_its_draft(fakes) -> None:
+    from agent.graph import graph
+
+    config = {"configurable": {"thread_id": "speculation", "expert_id": "speculation",
+                               "speculative_field_help": True, "field_help_cache": False}}
+    graph.invoke({"messages": [HumanMessage("update: a chef")]}, config)
+    # A field is set now: the next turn drafts the unset ones in the background.
+    graph.invoke({"messages": [HumanMessage("hello there")]}, config)
+    assert metrics.counter("speculation.started", field="name") == 1
+    assert metrics.counter("speculation.started", field="instructions") == 1
+    time.sleep(0.2)
+    result = graph.invoke({"messages": [HumanMessage("help:name")]}, config)
+    graph.invoke({"messages": [HumanMessage("update: a baker")]}, config)
+    graph.invoke({"messages": [HumanMessage("hello again")]}, config)
+
+    assert isinstance(result["messages"][-2], ToolMessage) and result["messages"][-2].content
+    assert metrics.counter("speculation.used", field="name") == 1
+    # The suggestion did not cost a model call of its own.
+    assert metrics.counter("llm.tier_calls", node="expert_field_assistant.name", model="gpt-4o", tier="primary") == 0
+    # The description changed, so the unused instructions draft was thrown away.
+    assert metrics.counter("speculation.wasted", field="instructions") == 1
+
+
+def test_served_drafts_are_not_redrafted_on_the_next_turns(fakes) -> None:
+    from agent.graph import graph
+
+    config = {"configurable": {"thread_id": "speculation-served", "expert_id": "speculation-served",
+                               "speculative_field_help": True, "field_help_cache": False}}
+    graph.invoke({"messages": [HumanMessage("update: a chef")]}, config)
+    graph.invoke({"messages": [HumanMessage("hello there")]}, config)
+    time.sleep(0.2)
+    graph.invoke({"messages": [HumanMessage("help:name")]}, config)
+    graph.invoke({"messages": [HumanMessage("hello again")]}, config)
+
+    assert metrics.counter("speculation.used", field="name") == 1
+    assert metrics.counter("speculation.started", field="name") == 1
@@ -0,0 +1,25 @@
+from agent.nodes.sync_profile import sync_profile
+from agent.profile import field_hashes
+
+PROFILE = {"name": "Anselmo", "description": "NOT SET", "instructions": "Line one\nLine two"}
+
+
+def _config(profile: dict) -> dict:
+    return {"configurable": {"expert_profile": profile}}
+
+
+def test_sync_without_changes_emits_no_message() -> None:
+    state = {"messages": [], "expert_profile": PROFILE, "profile_hashes": field_hashes(PROFILE)}
+    assert sync_profile(state, _config(PROFILE)) == {}
+
+
+def test_sync_reports_only_changed_fields() -> None:
+    state = {"messages": [], "expert_profile": PROFILE, "profile_hashes": field_hashes(PROFILE)}
+    new_profile = {**PROFILE, "instructions": "Line one\nLine three"}
+
+    update = sync_profile(state, _config(new_profile))
+
+    content = update["messages"][0].content
+    assert "name" not in content
+    assert "-Line two" in content and "+Line three" in content
+    assert update["profile_hashes"] == field_hashes(new_profile)
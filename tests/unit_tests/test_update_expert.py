@@ -0,0 +1,30 @@
+from agent.nodes.update_expert import apply_profile_patch
+
+CURRENT = {"name": "Anselmo", "description": "NOT SET", "instructions": "NOT SET"}
+
+
+def test_patch_replaces_only_given_fields() -> None:
+    updated = apply_profile_patch(CURRENT, {"update_type": "expert", "description": "A chef"})
+    assert updated == {"name": "Anselmo", "description": "A chef", "instructions": "NOT SET"}
+
+
+def test_patch_falls_back_without_values() -> None:
+    assert apply_profile_patch(CURRENT, {"update_type": "expert"}) is None
+
+
+def test_patch_falls_back_on_merge() -> None:
+    args = {"update_type": "expert", "instructions": "Be brief", "needs_merge": True}
+    assert apply_profile_patch(CURRENT, args) is None
+
+
+def test_pending_tool_calls_prefer_the_routed_calls() -> None:
+    from langchain_core.messages import AIMessage
+
+    from agent.tools import pending_tool_calls
+
+    update = {"name": "UpdateMemory", "args": {"update_type": "expert", "name": "Chef"}, "id": "a"}
+    help_call = {"name": "ExpertFieldAssistantTool", "args": {"tool_type": "help", "field": "name"}, "id": "b"}
+    state = {"messages": [AIMessage(content="", tool_calls=[update, help_call])]}
+
+    assert [call["id"] for call in pending_tool_calls(state, "update_expert")] == ["a"]
+    assert pending_tool_calls({**state, "tool_calls": [help_call]}, "update_expert") == []